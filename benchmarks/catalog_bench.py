@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Benchmarks our item catalog at modded-server sizes.  Generates a
+# synthetic YAML file with the given number of items (spread across a
+# bunch of IDs, data values, groups and enchantments), and then reports
+# how long it takes to build the catalog, sort it, and look items up,
+# along with how much memory it took.
+#
+# Run from the top level of the source tree:
+#
+#     python benchmarks/catalog_bench.py [count ...]
+#
+# With no arguments, runs at 1k, 10k and 100k items.
+
+import os
+import sys
+import time
+import yaml
+import random
+import subprocess
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyinveditlib import data
+
+def generate_yaml(count, groups=20, enchantments=20):
+    """
+    Returns a YAML dict with the given number of items
+    """
+    rand = random.Random(count)
+    yaml_dict = {}
+    yaml_dict['texfiles'] = [ { 'texfile': 'items.png', 'dimensions': [16, 16] } ]
+    yaml_dict['groups'] = []
+    for i in range(groups):
+        yaml_dict['groups'].append({ 'name': 'Group %d' % (i),
+            'texfile': 'items.png', 'coords': [i % 16, i / 16] })
+    yaml_dict['enchantments'] = []
+    for i in range(enchantments):
+        yaml_dict['enchantments'].append({ 'num': i,
+            'name': 'Enchantment %d' % (i), 'max_power': 5 })
+    yaml_dict['items'] = []
+    for i in range(count):
+        item = { 'num': 256 + (i / 16), 'data': i % 16,
+                'name': 'Modded Item %d' % (rand.randint(0, count*10)),
+                'texfile': 'items.png', 'coords': [i % 16, (i / 16) % 16],
+                'groups': [ 'Group %d' % (i % groups) ] }
+        if i % 4 == 0:
+            item['max_damage'] = 250
+            item['enchantments'] = [ 'Enchantment %d' % (n) for n in range(i % 5) ]
+        yaml_dict['items'].append(item)
+    return yaml_dict
+
+def max_rss():
+    """
+    Returns our peak memory use, in kilobytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def bench(count):
+    """
+    Runs the benchmark for the given number of items
+    """
+    (fd, filename) = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as df:
+        yaml.dump(generate_yaml(count), df, Dumper=getattr(yaml, 'CDumper', yaml.Dumper))
+
+    try:
+        catalog = data.Catalog(filename)
+
+        # Parse the YAML ourselves first, so that the catalog timing doesn't
+        # include PyYAML
+        yaml_dict = catalog._read_yaml()
+        catalog._read_yaml = lambda: yaml_dict
+
+        rss_before = max_rss()
+        start = time.time()
+        catalog.load()
+        load_time = time.time() - start
+        rss_after = max_rss()
+
+        # Loading fills in the sorted-item cache (group membership is
+        # built from it), so throw that away to time a real sort
+        catalog.items.sorted_items = None
+        start = time.time()
+        catalog.items.get_items()
+        sort_time = time.time() - start
+
+        start = time.time()
+        for i in range(100):
+            catalog.items.get_items()
+        sorted_time = (time.time() - start) / 100
+
+        lookups = [(256 + (i / 16), i % 16) for i in range(0, count, max(1, count / 1000))]
+        start = time.time()
+        for (num, damage) in lookups:
+            catalog.items.get_item(num, damage)
+        lookup_time = (time.time() - start) / len(lookups)
+
+        print '%7d items: load %7.3fs (%5.1fus/item), first sort %6.3fs, cached sort %6.1fus, lookup %5.2fus, +%d KB peak RSS (%.0f bytes/item)' % (
+                count, load_time, load_time*1000000/count, sort_time,
+                sorted_time*1000000, lookup_time*1000000,
+                rss_after - rss_before, (rss_after - rss_before)*1024.0/count)
+    finally:
+        os.unlink(filename)
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]]
+    if len(counts) == 0:
+        counts = [1000, 10000, 100000]
+    if len(counts) == 1:
+        bench(counts[0])
+    else:
+        # Run each size in its own process, so that peak memory from one
+        # run doesn't hide the next
+        for count in counts:
+            subprocess.call([sys.executable, os.path.abspath(__file__), str(count)])
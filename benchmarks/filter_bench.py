@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Benchmarks filtering our item list.  Builds an ItemView on top of a
+# synthetic catalog of the given size (see catalog_bench.py), shows it in
+# a window, and then reports how long a handful of typical filter changes
+# take from an unfiltered list, including the time GTK spends catching
+# up afterwards.  Each filter is timed once with our bulk update path and
+# once with per-row updates, for comparison.
+#
+# This needs a display to run.  Run from the top level of the source tree:
+#
+#     python benchmarks/filter_bench.py [count ...]
+#
+# With no arguments, runs at 500, 5k and 50k items.
+
+import os
+import sys
+import time
+import yaml
+import tempfile
+
+import gtk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pyinveditlib import data, pyinveditapp
+from catalog_bench import generate_yaml
+
+def flush():
+    """
+    Lets GTK process everything that's pending
+    """
+    while gtk.events_pending():
+        gtk.main_iteration(False)
+
+def reset(view):
+    """
+    Clears all filters on our view
+    """
+    view.filter_text('')
+    view.filter_group(None)
+    view.apply_filters()
+    flush()
+
+def time_filter(view, filter_func):
+    """
+    Returns how long it takes to apply the given filter change to our
+    view, starting from an unfiltered list and including GTK catching up
+    afterwards
+    """
+    reset(view)
+    start = time.time()
+    filter_func()
+    view.apply_filters()
+    flush()
+    return time.time() - start
+
+def bench(count):
+    """
+    Runs the benchmark for the given number of items
+    """
+    (fd, filename) = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as df:
+        yaml.dump(generate_yaml(count), df, Dumper=getattr(yaml, 'CDumper', yaml.Dumper))
+
+    try:
+        catalog = data.Catalog(filename)
+        catalog.load()
+        group = catalog.groups.values()[0]
+
+        view = pyinveditapp.ItemView(catalog.items)
+        scroll = gtk.ScrolledWindow()
+        scroll.add(view)
+        window = gtk.Window()
+        window.set_default_size(300, 600)
+        window.add(scroll)
+        window.show_all()
+        flush()
+
+        filters = [
+                ('group', lambda: view.filter_group(group)),
+                ('text "item"', lambda: view.filter_text('item')),
+                ('text "item 1"', lambda: view.filter_text('item 1')),
+                ('text "item 12"', lambda: view.filter_text('item 12')),
+                ('text "itme 12"', lambda: view.filter_text('itme 12')),
+            ]
+
+        bulk_threshold = view.bulk_threshold
+        print '%d items:' % (count)
+        for (label, filter_func) in filters:
+            view.bulk_threshold = bulk_threshold
+            bulk_time = time_filter(view, filter_func)
+            visible = len(view.visible)
+            view.bulk_threshold = count*2
+            per_row_time = time_filter(view, filter_func)
+            print '    %-16s %6d visible: bulk %8.2fms, per-row %8.2fms' % (
+                    label, visible, bulk_time*1000, per_row_time*1000)
+
+        window.destroy()
+    finally:
+        os.unlink(filename)
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]]
+    if len(counts) == 0:
+        counts = [500, 5000, 50000]
+    for count in counts:
+        bench(count)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Benchmarks our item search.  Builds an ItemIndex over a synthetic
+# catalog of the given size, with names put together from the sort of
+# words modded items use, and then types a handful of queries (some with
+# typos) into a QueryCache one keystroke at a time, reporting how long
+# ranking takes for each keystroke.  The search index doesn't need GTK
+# or cairo, so this runs anywhere.
+#
+# Run from the top level of the source tree:
+#
+#     python benchmarks/search_bench.py [count ...]
+#
+# With no arguments, runs at 1k, 10k and 20k items.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyinveditlib import search
+
+MODIFIERS = ['Basic', 'Advanced', 'Elite', 'Ultimate', 'Reinforced',
+        'Hardened', 'Insulated', 'Compressed', 'Energized', 'Resonant',
+        'Small', 'Large', 'Empty', 'Filled', 'Creative', 'Redstone']
+
+MATERIALS = ['Copper', 'Tin', 'Bronze', 'Iron', 'Gold', 'Diamond', 'Emerald',
+        'Steel', 'Lead', 'Silver', 'Uranium', 'Osmium', 'Obsidian', 'Quartz',
+        'Lapis', 'Nickel', 'Platinum', 'Invar', 'Electrum', 'Signalum',
+        'Lumium', 'Enderium', 'Aluminum', 'Titanium', 'Tungsten', 'Wooden',
+        'Stone', 'Glass', 'Rubber', 'Carbon']
+
+OBJECTS = ['Wire', 'Cable', 'Ingot', 'Nugget', 'Dust', 'Plate', 'Gear', 'Rod',
+        'Block', 'Ore', 'Pickaxe', 'Sword', 'Shovel', 'Axe', 'Hoe', 'Helmet',
+        'Chestplate', 'Leggings', 'Boots', 'Machine', 'Crusher', 'Furnace',
+        'Generator', 'Reactor', 'Reactor Chamber', 'Pipe', 'Tank', 'Cell',
+        'Battery', 'Circuit', 'Drill', 'Saw', 'Casing', 'Coil', 'Frame',
+        'Machine Crusher', 'Macerator', 'Extractor', 'Conduit', 'Chest']
+
+QUERIES = ['di', 'dia', 'diamond', 'diamnd', 'reactr', 'coper wire',
+        'machine crusher', 'tungstn drill', 'xyzzy']
+
+class StubItem(object):
+    """
+    Just enough of a data.Item for the index
+    """
+
+    def __init__(self, num, name):
+        self.num = num
+        self.name = name
+        self.unique_id = '%d~%s' % (num, name)
+        self.group_mask = 1 << (num % 20)
+        self.unknown = False
+
+def generate_items(count):
+    """
+    Returns the given number of items with mod-like names, sorted by name
+    the way our catalog is
+    """
+    rand = random.Random(count)
+    names = []
+    for i in range(count):
+        words = rand.sample(MODIFIERS, rand.randint(0, 2))
+        words.append(rand.choice(MATERIALS))
+        words.append(rand.choice(OBJECTS))
+        names.append(' '.join(words))
+    names.sort(key=lambda name: name.lower())
+    return [StubItem(256 + i, name) for (i, name) in enumerate(names)]
+
+def type_query(index, text):
+    """
+    Types the given query into a fresh QueryCache one keystroke at a time,
+    and returns the time each keystroke took to rank, along with the final
+    number of results
+    """
+    index.short_ranks.clear()
+    cache = search.QueryCache(index)
+    times = []
+    for end in range(1, len(text)+1):
+        start = time.time()
+        ranked = cache.rank(text[:end])
+        times.append(time.time() - start)
+    return (times, len(ranked))
+
+def bench(count):
+    """
+    Runs the benchmark for the given number of items
+    """
+    items = generate_items(count)
+    start = time.time()
+    index = search.ItemIndex(items)
+    print '%d items: index built in %.3fs' % (count, time.time() - start)
+    worst = 0
+    for text in QUERIES:
+        # Take the median of a few runs for each keystroke, to keep the
+        # odd GC pause or scheduling hiccup out of it
+        runs = []
+        for i in range(5):
+            (times, results) = type_query(index, text)
+            runs.append(times)
+        medians = [sorted(keystroke)[len(keystroke)/2] for keystroke in zip(*runs)]
+        worst = max(worst, max(medians))
+        print '    %-18s %5d results, per keystroke: mean %6.3fms, max %6.3fms, last %6.3fms' % (
+                repr(text), results, sum(medians)*1000/len(medians),
+                max(medians)*1000, medians[-1]*1000)
+    print '    worst keystroke: %.3fms' % (worst*1000)
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]]
+    if len(counts) == 0:
+        counts = [1000, 10000, 20000]
+    for count in counts:
+        bench(count)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Benchmarks loading our texture sheets.  Loads every sheet listed in
+# our YAML file (plus gui.png) the way the catalog does, and reports how
+# long that takes with a single worker and with one worker per CPU.
+# Each sheet can be repeated to stand in for a modded install with more
+# of them.  GTK pixbufs aren't created, so this only needs cairo.
+#
+# It also reports how much memory the scaled atlases take, and how much
+# more it takes to copy every icon out into its own surface at both
+# sizes, which is how TexFile used to store them.  Everything is run
+# twice: once with our shipped 16px sheets, and once with a stand-in for
+# a 4x resolution texture pack (64px icons), made by upscaling each of
+# the shipped sheets into a temporary directory.
+#
+# Run from the top level of the source tree:
+#
+#     python benchmarks/texture_bench.py [copies ...]
+#
+# With no arguments, runs with 1, 4 and 16 copies of each sheet.
+
+import os
+import sys
+import time
+import yaml
+import cairo
+import shutil
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyinveditlib import data, util
+
+# How much to upscale the shipped sheets by for our texture pack run
+pack_scale = 4
+
+def get_texfile_yaml(pack_dir=None):
+    """
+    Returns the yaml dicts for all the sheets the catalog would load.  If
+    pack_dir is given, the sheets are loaded from there instead of from
+    our gfx directory.
+    """
+    with open(util.get_datafile_path('pyinvedit.yaml', 'data'), 'r') as df:
+        yaml_dict = yaml.load(df.read())
+    yamlobjs = yaml_dict['texfiles'] + [data.Catalog.gui_yaml]
+    if pack_dir is not None:
+        # An absolute path comes straight through get_datafile_path()
+        yamlobjs = [dict(yamlobj, texfile=os.path.join(pack_dir, yamlobj['texfile']))
+                for yamlobj in yamlobjs]
+    return yamlobjs
+
+def make_pack(pack_dir, scale):
+    """
+    Writes an upscaled copy of each of our sheets into pack_dir, so that
+    each icon is scale times as large, the way a high resolution texture
+    pack would have them.
+    """
+    for yamlobj in get_texfile_yaml():
+        source = cairo.ImageSurface.create_from_png(
+                util.get_datafile_path(yamlobj['texfile'], 'gfx'))
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                source.get_width()*scale, source.get_height()*scale)
+        ctx = cairo.Context(surface)
+        ctx.scale(scale, scale)
+        ctx.set_source_surface(source, 0, 0)
+        ctx.get_source().set_filter(cairo.FILTER_NEAREST)
+        ctx.paint()
+        surface.write_to_png(os.path.join(pack_dir, yamlobj['texfile']))
+
+def max_rss():
+    """
+    Returns our peak memory use, in kilobytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def copy_icons(texfiles):
+    """
+    Copies every icon in the given texfiles out into its own surface, at
+    both of our base sizes, and returns the surfaces
+    """
+    surfaces = []
+    for texfile in texfiles:
+        for size in (texfile.size_small, texfile.size_large):
+            atlas = texfile.get_atlas(size)
+            for y in range(texfile.y):
+                for x in range(texfile.x):
+                    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, size, size)
+                    ctx = cairo.Context(surface)
+                    ctx.set_source_surface(atlas, -x*size, -y*size)
+                    ctx.paint()
+                    surfaces.append(surface)
+    return surfaces
+
+def time_load(yamlobjs, workers, runs=5):
+    """
+    Returns the best time out of a few runs to load the given sheets
+    """
+    best = None
+    for i in range(runs):
+        start = time.time()
+        data.load_texfiles(yamlobjs, workers=workers, pixbufs=False)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench(copies, pack_dir=None):
+    """
+    Runs the benchmark with the given number of copies of each sheet,
+    loading them from pack_dir if it's given
+    """
+    yamlobjs = get_texfile_yaml(pack_dir) * copies
+
+    rss_start = max_rss()
+    texfiles = data.load_texfiles(yamlobjs, pixbufs=False)
+    rss_atlas = max_rss()
+    icons = copy_icons(texfiles)
+    rss_icons = max_rss()
+    del icons
+    del texfiles
+
+    serial = time_load(yamlobjs, 1)
+    parallel = time_load(yamlobjs, None)
+    if pack_dir is None:
+        label = 'shipped'
+    else:
+        label = '%dx pack' % (pack_scale)
+    print '%-8s %3d sheets: serial %7.3fs, parallel %7.3fs (%.2fx), atlases +%d KB peak RSS, per-icon copies +%d KB more' % (
+            label, len(yamlobjs), serial, parallel, serial/parallel,
+            rss_atlas - rss_start, rss_icons - rss_atlas)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        # A single run, started by ourselves below
+        bench(int(sys.argv[2]), *sys.argv[3:])
+    else:
+        copies = [int(arg) for arg in sys.argv[1:]]
+        if len(copies) == 0:
+            copies = [1, 4, 16]
+        pack_dir = tempfile.mkdtemp(prefix='texture_bench')
+        try:
+            make_pack(pack_dir, pack_scale)
+            # Run each size in its own process, so that peak memory from
+            # one run doesn't hide the next
+            for extra in ([], [pack_dir]):
+                for count in copies:
+                    subprocess.call([sys.executable, os.path.abspath(__file__),
+                        '--run', str(count)] + extra)
+        finally:
+            shutil.rmtree(pack_dir)
@@ -27,48 +27,125 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import yaml
 import cairo
+import numpy
+import operator
 import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from pyinveditlib import util, minecraft
 
 # This file contains classes that primarily represent the utility data
 # that we store in the main YAML file, in a way that's useful to us.
 
+class TexIcon(object):
+    """
+    A lightweight view of a single icon inside one of a TexFile's scaled
+    atlases.  No pixel data is copied; we just remember which atlas
+    surface the icon lives on and where, and paint from the shared
+    buffer when asked.  Provides get_width()/get_height() so it can be
+    used in most places which used to expect a standalone ImageSurface.
+    """
+
+    __slots__ = ('atlas', 'x', 'y', 'size', 'texfile')
+
+    def __init__(self, atlas, x, y, size, texfile=None):
+        self.atlas = atlas
+        self.x = x
+        self.y = y
+        self.size = size
+        self.texfile = texfile
+
+    def get_width(self):
+        return self.size
+
+    def get_height(self):
+        return self.size
+
+    def paint(self, ctx, x, y):
+        """
+        Paints this icon onto the given cairo context, with its top-left
+        corner at the given coordinates.
+        """
+        ctx.set_source_surface(self.atlas, x - self.x, y - self.y)
+        ctx.rectangle(x, y, self.size, self.size)
+        ctx.fill()
+
+    def get_surface(self):
+        """
+        Returns a standalone cairo ImageSurface copy of this icon.  Only
+        needed for the rare cases where we need the icon outside of the
+        atlas (drag icons and the like).
+        """
+        surf = cairo.ImageSurface(self.atlas.get_format(), self.size, self.size)
+        self.paint(cairo.Context(surf), 0, 0)
+        return surf
+
+    def get_pixbuf(self):
+        """
+        Returns a gtk.gdk.Pixbuf copy of this icon
+        """
+        return util.get_pixbuf_from_surface(self.get_surface())
+
+    def at_scale(self, scale):
+        """
+        Returns a TexIcon for this same icon, drawn at the given multiple
+        of our size (for HiDPI displays).  Returns ourselves if the scale
+        is 1, or if we don't know which TexFile we came from.
+        """
+        if scale == 1 or self.texfile is None:
+            return self
+        return self.texfile.get_tex_sized(self.x/self.size, self.y/self.size,
+                self.size*scale)
+
 class TexFile(object):
     """
     Class to provide information about a specific texture file we have
     access to.
+
+    Rather than keeping an individual surface around for every icon, we
+    keep a single scaled atlas per icon size (plus a pixbuf version of
+    the small atlas), and hand out views into those.  Atlases for sizes
+    other than our two base sizes (ie: for HiDPI displays) are built the
+    first time they're asked for, and then kept.
     """
 
     size_small = 16
     size_large = 32
     large_full = 50
 
-    def __init__(self, yamlobj):
+    def __init__(self, yamlobj, process=True):
         """
-        Initializes given a yaml dict.
+        Initializes given a yaml dict.  If process is False, we won't
+        actually load the texture file; the caller is responsible for
+        calling process() and create_pixbufs() itself (see load_texfiles())
         """
         self.texfile = yamlobj['texfile']
         self.filename = util.get_datafile_path(self.texfile, 'gfx')
         self.x = yamlobj['dimensions'][0]
         self.y = yamlobj['dimensions'][1]
-        self.grid_large = []
-        self.grid_small = []
-        self.grid_pixbuf = []
-        for x in range(0, self.x):
-            self.grid_large.append([])
-            self.grid_small.append([])
-            self.grid_pixbuf.append([])
-            for y in range(0, self.y):
-                self.grid_large[x].append(None)
-                self.grid_small[x].append(None)
-                self.grid_pixbuf[x].append(None)
+        self.atlas_small = None
+        self.atlas_large = None
+        self.atlas_pixbuf = None
+        self.atlases = {}
+        self.pixbufs = {}
 
         # Make sure the file is present
         if not os.path.exists(self.filename):
             raise Exception('texfile %s not found' % (self.texfile))
 
         # And while we're at it, load and process it
+        if process:
+            self.process()
+            self.create_pixbufs()
+
+    def process(self):
+        """
+        Loads our texture file and builds our scaled atlases.  This only
+        touches cairo (which releases the GIL while it works), so it's
+        safe to call from a worker thread.
+        """
         mainsurface = None
         try:
             mainsurface = cairo.ImageSurface.create_from_png(self.filename)
@@ -87,45 +164,138 @@ class TexFile(object):
                     (self.texfile))
         self.icon_width = main_width
 
-        # Now do the actual picking-apart
-        scale_small = 1
-        scale_large = 1
-        if self.icon_width != self.size_small:
-            scale_small = self.icon_width/float(self.size_small)
-        if self.icon_width != self.size_large:
-            scale_large = self.icon_width/float(self.size_large)
-        pat = cairo.SurfacePattern(mainsurface)
-        for x in range(0, self.x):
-            for y in range(0, self.y):
-
-                # Resize for small icons (in the search pane)
-                ind_surf = cairo.ImageSurface(mainsurface.get_format(), self.size_small, self.size_small)
-                scaler = cairo.Matrix()
-                scaler.translate(x*self.icon_width, y*self.icon_width)
-                scaler.scale(scale_small, scale_small)
-                pat.set_filter(cairo.FILTER_NEAREST)
-                pat.set_matrix(scaler)
-                ctx = cairo.Context(ind_surf)
-                ctx.set_source(pat)
-                ctx.paint()
-                self.grid_small[x][y] = ind_surf
+        # Now scale the sheet for each of our sizes, starting from whichever
+        # mip level is closest (see _scale_atlas() for the details).
+        mipmaps = self._build_mipmaps(mainsurface)
+        self.atlas_small = self._scale_atlas(mipmaps, self.size_small)
+        self.atlas_large = self._scale_atlas(mipmaps, self.size_large)
+        self.atlases = {
+                self.size_small: self.atlas_small,
+                self.size_large: self.atlas_large,
+            }
 
-                # Convert "small" to a pixbuf, for ease of putting it in
-                # our item selection area
-                self.grid_pixbuf[x][y] = util.get_pixbuf_from_surface(ind_surf)
+    def create_pixbufs(self):
+        """
+        Convert "small" to a pixbuf, for ease of putting it in our item
+        selection area.  Individual icons are handed out as subpixbufs,
+        which share this pixbuf's pixel data.  This needs GTK, so should
+        be called from the main thread after process().
+        """
+        self.atlas_pixbuf = util.get_pixbuf_from_surface(self.atlas_small)
+        self.pixbufs = {self.size_small: self.atlas_pixbuf}
 
-                # Resize for large icons (in the main inventory area)
-                ind_surf = cairo.ImageSurface(mainsurface.get_format(), self.size_large, self.size_large)
+    def get_atlas(self, size):
+        """
+        Returns our atlas surface for the given icon size, building it if
+        we haven't been asked for that size before.  We don't keep our
+        mip pyramid around after process(), so the first request for a new
+        size re-reads the texture file.  That only happens once per size,
+        so changing scale factors doesn't mean rescaling on every draw.
+        """
+        if size not in self.atlases:
+            mainsurface = cairo.ImageSurface.create_from_png(self.filename)
+            self.atlases[size] = self._scale_atlas(self._build_mipmaps(mainsurface), size)
+        return self.atlases[size]
+
+    def get_pixbuf_atlas(self, size):
+        """
+        Returns a pixbuf version of our atlas for the given icon size,
+        building it if need be.  Needs GTK.
+        """
+        if size not in self.pixbufs:
+            self.pixbufs[size] = util.get_pixbuf_from_surface(self.get_atlas(size))
+        return self.pixbufs[size]
+
+    def _build_mipmaps(self, mainsurface):
+        """
+        Builds a mip pyramid for our texture sheet, by repeatedly halving
+        it with a 2x2 box filter until another halving would take our icons
+        below size_small.  Returns a list of (icon_width, surface) tuples,
+        starting with the full-resolution sheet.  Total cost is linear in
+        the number of source pixels.
+        """
+        mipmaps = [(self.icon_width, mainsurface)]
+        icon_width = self.icon_width
+        surface = mainsurface
+        while icon_width % 2 == 0 and icon_width/2 >= self.size_small:
+            surface = self._halve_surface(surface)
+            icon_width /= 2
+            mipmaps.append((icon_width, surface))
+        return mipmaps
+
+    def _halve_surface(self, surface):
+        """
+        Returns a new ImageSurface at half the size of the given one, with
+        each destination pixel being the average of a 2x2 source block.
+        Cairo's pixels are premultiplied, so straight averaging of all
+        four channels is correct.
+        """
+        surface.flush()
+        width = surface.get_width()
+        height = surface.get_height()
+        src = numpy.frombuffer(surface.get_data(), numpy.uint8)
+        src = src.reshape(height, surface.get_stride())[:, :width*4]
+        blocks = src.reshape(height/2, 2, width/2, 2, 4).astype(numpy.uint16)
+        dst = (blocks.sum(axis=3).sum(axis=1) + 2) // 4
+        dst = numpy.ascontiguousarray(dst.astype(numpy.uint8))
+        return cairo.ImageSurface.create_for_data(dst, surface.get_format(),
+                width/2, height/2, (width/2)*4)
+
+    def _scale_atlas(self, mipmaps, size):
+        """
+        Returns a new ImageSurface containing our entire texture sheet,
+        scaled such that each icon is the given size.  We scale from the
+        smallest mip level whose icons are at least as big as the target
+        (or the full-size sheet, if we have to scale up).
+
+        Upscaling and exact matches use nearest-neighbor filtering to keep
+        pixel art crisp.  Every destination pixel then samples from inside
+        its own icon, so the whole sheet can be done in one paint.
+        Downscaling by the remaining (less than 2x) factor is filtered,
+        and a filter would sample across cell borders into neighbouring
+        icons, so that's done one cell at a time, with each cell padded
+        out to its own edges.
+        """
+        (icon_width, source) = mipmaps[0]
+        for (level_width, level) in mipmaps:
+            if level_width >= size:
+                (icon_width, source) = (level_width, level)
+        atlas = cairo.ImageSurface(source.get_format(), self.x*size, self.y*size)
+        ctx = cairo.Context(atlas)
+        scale = icon_width/float(size)
+
+        if icon_width <= size:
+            scaler = cairo.Matrix()
+            scaler.scale(scale, scale)
+            pat = cairo.SurfacePattern(source)
+            pat.set_filter(cairo.FILTER_NEAREST)
+            pat.set_matrix(scaler)
+            ctx.set_source(pat)
+            ctx.paint()
+            return atlas
+
+        cell = cairo.ImageSurface(source.get_format(), icon_width, icon_width)
+        cell_ctx = cairo.Context(cell)
+        cell_ctx.set_operator(cairo.OPERATOR_SOURCE)
+        for y in range(self.y):
+            for x in range(self.x):
+                # Copy the cell out on its own...
+                cell_ctx.set_source_surface(source, -x*icon_width, -y*icon_width)
+                cell_ctx.paint()
+                cell.flush()
+
+                # ... and scale it into place
                 scaler = cairo.Matrix()
-                scaler.translate(x*self.icon_width, y*self.icon_width)
-                scaler.scale(scale_large, scale_large)
-                pat = cairo.SurfacePattern(mainsurface)
-                pat.set_filter(cairo.FILTER_NEAREST)
+                scaler.scale(scale, scale)
+                scaler.translate(-x*size, -y*size)
+                pat = cairo.SurfacePattern(cell)
+                pat.set_filter(cairo.FILTER_GOOD)
+                pat.set_extend(cairo.EXTEND_PAD)
                 pat.set_matrix(scaler)
-                ctx = cairo.Context(ind_surf)
                 ctx.set_source(pat)
-                ctx.paint()
-                self.grid_large[x][y] = ind_surf
+                ctx.rectangle(x*size, y*size, size, size)
+                ctx.fill()
+        return atlas
 
     def check_bounds(self, x, y):
         """
@@ -136,23 +306,64 @@ class TexFile(object):
             raise Exception("Texture coordinate (%d, %d) is not valid for %s" %
                     (x, y, self.texfile))
 
-    def get_tex(self, x, y, large=False):
+    def get_tex(self, x, y, large=False, scale=1):
         """
-        Returns a cairo ImageSurface of the requested texture.
+        Returns a TexIcon view of the requested texture.  scale is the
+        display's scale factor; icons will be that many times bigger.
         """
-        self.check_bounds(x, y)
         if large:
-            return self.grid_large[x][y]
+            return self.get_tex_sized(x, y, self.size_large*scale)
         else:
-            return self.grid_small[x][y]
+            return self.get_tex_sized(x, y, self.size_small*scale)
+
+    def get_tex_sized(self, x, y, size):
+        """
+        Returns a TexIcon view of the requested texture, at the given
+        pixel size.
+        """
+        self.check_bounds(x, y)
+        return TexIcon(self.get_atlas(size), x*size, y*size, size, self)
 
-    def get_pixbuf(self, x, y):
+    def get_pixbuf(self, x, y, scale=1):
         """
         Returns a gtk.gtk.Pixbuf of the requested texture.  Note that
-        this will always be the "small" version
+        this will always be the "small" version, multiplied by the given
+        scale factor.
         """
         self.check_bounds(x, y)
-        return self.grid_pixbuf[x][y]
+        size = self.size_small*scale
+        return self.get_pixbuf_atlas(size).subpixbuf(x*size, y*size, size, size)
+
+def load_texfiles(yamlobjs, workers=None, pixbufs=True):
+    """
+    Loads a list of TexFile objects given a list of yaml dicts, and
+    returns them in the same order.  Decoding and scaling are spread
+    over a pool of worker threads (defaulting to one per CPU), and the
+    GTK-side pixbuf conversion is done back here on the calling thread
+    once they've all finished.  If pixbufs is False, that last step is
+    skipped, and the texfiles will only have their cairo atlases.
+    """
+    texfiles = [TexFile(yamlobj, False) for yamlobj in yamlobjs]
+    if workers is None:
+        try:
+            workers = multiprocessing.cpu_count()
+        except NotImplementedError:
+            workers = 1
+    workers = min(workers, len(texfiles))
+    if workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            pool.map(TexFile.process, texfiles)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for texfile in texfiles:
+            texfile.process()
+    if pixbufs:
+        for texfile in texfiles:
+            texfile.create_pixbufs()
+    return texfiles
 
 class Group(object):
     """
@@ -172,17 +383,20 @@ class Group(object):
         self.texfile.check_bounds(self.x, self.y)
         self.items = []
 
+        # Our bit in Item.group_mask.  Assigned by the Catalog.
+        self.bit = 0
+
     def add_item(self, item):
         """
         Adds a new item to this group.
         """
         self.items.append(item)
 
-    def get_pixbuf(self):
+    def get_pixbuf(self, scale=1):
         """
         Returns the small gtk.gdk.Pixbuf corresponding to this item
         """
-        return self.texfile.get_pixbuf(self.x, self.y)
+        return self.texfile.get_pixbuf(self.x, self.y, scale)
 
 class Enchantment(object):
     """
@@ -213,6 +427,14 @@ class Enchantments(object):
         self.enchantments_id = {}
         self.enchantments_name = {}
 
+    def replace_with(self, other):
+        """
+        Replaces our entire set of enchantments with those from another
+        Enchantments object.
+        """
+        self.enchantments_id = other.enchantments_id
+        self.enchantments_name = other.enchantments_name
+
     def add_enchantment(self, yamlobj):
         """
         Adds a new enchantment, given a YAML object
@@ -286,8 +508,18 @@ class Enchantments(object):
 
 class Item(object):
     """
-    Class to hold information about an inventory item.
+    Class to hold information about an inventory item.  Modded catalogs
+    can run to tens of thousands of these, so we use __slots__ to keep
+    each one compact.  The groups and enchantments tuples are shared
+    between items which have identical ones (see Catalog), and group
+    membership is also available as a bitmask (see Group.bit).
     """
+
+    __slots__ = ('num', 'name', 'texfile', 'x', 'y', 'unknown',
+            'enchantment_catalog', 'groups', 'group_mask', 'data',
+            'unique_id', 'max_damage', 'max_quantity', 'all_data',
+            'enchantments', 'tool', 'weapon', 'armor')
+
     def __init__(self, yamlobj, texfiles, groups, enchantment_catalog, unknown=False):
         """
         Initializes given a YAML dict, a dict of valid texfiles, and a dict
@@ -305,25 +537,26 @@ class Item(object):
         self.texfile.check_bounds(self.x, self.y)
         self.enchantment_catalog = enchantment_catalog
 
-        # See if we belong to any groups.  Note that we're adding ourselves
-        # into the group object as well
-        self.groups = []
+        # See if we belong to any groups.  Note that the Catalog takes care
+        # of adding us into the group objects themselves.
+        groupobjs = []
+        self.group_mask = 0
         if 'groups' in yamlobj:
             for group in yamlobj['groups']:
                 if group in groups:
-                    self.groups.append(groups[group])
-                    groups[group].add_item(self)
+                    groupobjs.append(groups[group])
+                    self.group_mask |= groups[group].bit
                 else:
                     raise Exception('Group %s not found for item %d (%s)' %
                             (group, self.num, self.name))
+        self.groups = tuple(groupobjs)
 
         # Data value, if we have it.
         if 'data' in yamlobj:
             self.data = yamlobj['data']
-            self.unique_id = '%d~%d' % (self.num, self.data)
         else:
             self.data = 0
-            self.unique_id = self.num
+        self.unique_id = Item.get_unique_id(yamlobj)
 
         # Maximum damage, if we have it
         if 'max_damage' in yamlobj:
@@ -344,14 +577,15 @@ class Item(object):
             self.all_data = False
 
         # See if we have any enchantments
-        self.enchantments = []
+        enchobjs = []
         if 'enchantments' in yamlobj:
             for ench in yamlobj['enchantments']:
                 enchobj = enchantment_catalog.get_by_name(ench)
                 if enchobj is None:
                     raise Exception('Enchantment %s for item %s is unknown' % (ench, self.name))
                 else:
-                    self.enchantments.append(enchobj)
+                    enchobjs.append(enchobj)
+        self.enchantments = tuple(enchobjs)
 
         # Item categorization - Tool
         if 'tool' in yamlobj:
@@ -371,17 +605,28 @@ class Item(object):
         else:
             self.armor = False
 
-    def get_image(self, large=False):
+    @staticmethod
+    def get_unique_id(yamlobj):
         """
-        Returns the base cairo ImageSurface for this item
+        Returns the unique ID that an item built from the given YAML dict
+        would have.
         """
-        return self.texfile.get_tex(self.x, self.y, large)
+        if 'data' in yamlobj:
+            return '%d~%d' % (yamlobj['num'], yamlobj['data'])
+        else:
+            return yamlobj['num']
 
-    def get_pixbuf(self):
+    def get_image(self, large=False, scale=1):
+        """
+        Returns the base image (a TexIcon) for this item
+        """
+        return self.texfile.get_tex(self.x, self.y, large, scale)
+
+    def get_pixbuf(self, scale=1):
         """
         Returns the small gtk.gdk.Pixbuf corresponding to this item
         """
-        return self.texfile.get_pixbuf(self.x, self.y)
+        return self.texfile.get_pixbuf(self.x, self.y, scale)
 
     def get_new_inventoryslot(self, slot):
         """
@@ -407,22 +652,312 @@ class ItemCollection(object):
     def __init__(self):
         self.items = collections.OrderedDict()
 
+        # Lookup indexes for get_item(), so that we don't have to build
+        # unique ID strings on every lookup, and a cached sorted list
+        # for get_items()
+        self.by_num = {}
+        self.by_num_data = {}
+        self.sorted_items = None
+
     def add_item(self, item):
+        """
+        Adds (or replaces) an item
+        """
+        if item.unique_id in self.items:
+            self.remove_item(self.items[item.unique_id])
         self.items[item.unique_id] = item
+        if isinstance(item.unique_id, basestring):
+            self.by_num_data[(item.num, item.data)] = item
+        else:
+            self.by_num[item.unique_id] = item
+        self.sorted_items = None
+
+    def remove_item(self, item):
+        """
+        Removes the given item
+        """
+        del self.items[item.unique_id]
+        if isinstance(item.unique_id, basestring):
+            del self.by_num_data[(item.num, item.data)]
+        else:
+            del self.by_num[item.unique_id]
+        self.sorted_items = None
+
+    def get_by_unique_id(self, unique_id):
+        """
+        Gets an item by its unique ID, if possible
+        """
+        if unique_id in self.items:
+            return self.items[unique_id]
+        else:
+            return None
 
     def get_item(self, num, damage):
         """
         Gets an item with the given ID and damage
         """
-        for unique in ['%d~%d' % (num, damage), num]:
-            if unique in self.items:
-                return self.items[unique]
-        return None
+        item = self.by_num_data.get((num, damage))
+        if item is None:
+            item = self.by_num.get(num)
+        return item
 
     def get_items(self):
         """
-        Returns a list of all our items, ordered.
+        Returns a list of all our items, ordered by name.  The list is
+        cached until our contents change, so callers shouldn't modify it.
+        """
+        if self.sorted_items is None:
+            self.sorted_items = self.items.values()
+            self.sorted_items.sort(key=operator.attrgetter('name'))
+        return self.sorted_items
+
+class CatalogChanges(object):
+    """
+    Describes what changed in a Catalog during a call to reload().
+    Changed items are stored as (old, new) tuples.
+    """
+
+    def __init__(self):
+        self.texfiles = []
+        self.groups_changed = False
+        self.enchantments_changed = False
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+    def is_empty(self):
         """
-        itemlist = self.items.values()
-        itemlist.sort()
-        return itemlist
+        Returns whether or not anything actually changed
+        """
+        return not (self.texfiles or self.groups_changed or
+                self.enchantments_changed or self.added or
+                self.changed or self.removed)
+
+    def get_unique_ids(self):
+        """
+        Returns a set of all item unique IDs which were affected
+        """
+        ids = set()
+        for item in self.added + self.removed:
+            ids.add(item.unique_id)
+        for (old, new) in self.changed:
+            ids.add(old.unique_id)
+            ids.add(new.unique_id)
+        return ids
+
+class Catalog(object):
+    """
+    Holds everything we load from our main YAML file: texfiles, groups,
+    enchantments, and items.  The catalog can be reloaded while we're
+    running, in which case it patches itself in place, only rebuilding
+    the objects whose definitions (or texture files) actually changed.
+    """
+
+    # Our own GUI texture file, which isn't defined in the YAML
+    gui_yaml = { 'texfile': 'gui.png', 'dimensions': [16, 16] }
+
+    # A standin Item which we'll use when someone wants to type in
+    # an arbitrary ID
+    unknown_yaml = { 'num': 0, 'name': 'Unknown Item',
+            'texfile': 'gui.png', 'coords': [1, 2] }
+
+    def __init__(self, filename, pixbufs=True):
+        """
+        Initializes given the path to our YAML file.  If pixbufs is False,
+        our texfiles won't have GTK pixbufs made for them, which is all
+        that's needed to draw with cairo (see render.py).
+        """
+        self.filename = filename
+        self.pixbufs = pixbufs
+        self.texfiles = {}
+        self.groups = collections.OrderedDict()
+        self.enchantments = Enchantments()
+        self.items = ItemCollection()
+
+        # Identical group and enchantment tuples, shared between items
+        self.shared = {}
+
+        # The YAML each of our objects was built from, so we can tell
+        # what's changed on a reload
+        self.texfile_yaml = {}
+        self.group_yaml = {}
+        self.enchantment_yaml = None
+        self.item_yaml = {}
+
+    def get_watch_paths(self):
+        """
+        Returns a list of paths which should be watched for changes:
+        our YAML file, and the directories holding our texture files.
+        """
+        paths = [self.filename]
+        for texfile in self.texfiles.values():
+            dirname = os.path.dirname(texfile.filename)
+            if dirname not in paths:
+                paths.append(dirname)
+        return paths
+
+    def _share(self, values):
+        """
+        Returns a shared tuple equal to the given one, so that items with
+        the same groups or enchantments don't each hold their own copy.
+        """
+        if values not in self.shared:
+            self.shared[values] = values
+        return self.shared[values]
+
+    def _read_yaml(self):
+        """
+        Reads and parses our YAML file
+        """
+        filedata = None
+        with open(self.filename, 'r') as df:
+            filedata = df.read()
+        if not filedata:
+            raise Exception('No data found from YAML file')
+        return yaml.load(filedata)
+
+    def load(self):
+        """
+        Loads everything from our YAML file.  This is just a reload on
+        an empty catalog.
+        """
+        return self.reload()
+
+    def reload(self, changed_paths=None):
+        """
+        (Re)loads our YAML file and patches ourselves to match, returning
+        a CatalogChanges object.  changed_paths is an optional list of files
+        known to have changed on disk; any texfile in there is re-read even
+        if its YAML is unchanged.
+
+        Everything gets parsed and validated before any of our live objects
+        are touched, so a broken YAML file (say, one that's halfway through
+        being edited) will raise an Exception and leave us intact.
+
+        Items are rebuilt if their own YAML changed, or if they refer to a
+        texfile or group which was rebuilt.  If the enchantments change at
+        all, every item with enchantments is rebuilt.
+        """
+        yaml_dict = self._read_yaml()
+        changes = CatalogChanges()
+        if changed_paths is None:
+            changed_paths = []
+        changed_paths = set([os.path.realpath(path) for path in changed_paths])
+
+        # Texfiles
+        texfile_yaml = collections.OrderedDict()
+        for yamlobj in yaml_dict['texfiles'] + [self.gui_yaml]:
+            texfile_yaml[yamlobj['texfile']] = yamlobj
+        texfiles = {}
+        to_load = []
+        for (name, yamlobj) in texfile_yaml.iteritems():
+            if (name in self.texfiles and yamlobj == self.texfile_yaml[name] and
+                    os.path.realpath(self.texfiles[name].filename) not in changed_paths):
+                texfiles[name] = self.texfiles[name]
+            else:
+                to_load.append(yamlobj)
+        for texfile in load_texfiles(to_load, pixbufs=self.pixbufs):
+            texfiles[texfile.texfile] = texfile
+            changes.texfiles.append(texfile.texfile)
+        changed_texfiles = set(changes.texfiles)
+        for name in self.texfiles.keys():
+            if name not in texfiles:
+                changed_texfiles.add(name)
+
+        # Groups
+        groups = collections.OrderedDict()
+        group_yaml = {}
+        changed_groups = set()
+        for yamlobj in yaml_dict['groups']:
+            name = yamlobj['name']
+            group_yaml[name] = yamlobj
+            if (name in self.groups and yamlobj == self.group_yaml[name] and
+                    yamlobj['texfile'] not in changed_texfiles):
+                groups[name] = self.groups[name]
+            else:
+                groups[name] = Group(yamlobj, texfiles)
+                changed_groups.add(name)
+        for name in self.groups.keys():
+            if name not in groups:
+                changed_groups.add(name)
+        for (index, (name, group)) in enumerate(groups.items()):
+            if group.bit != (1 << index):
+                # Our group has moved, so it needs a new bit.  Live groups
+                # get a fresh copy, so that we don't touch them until we've
+                # validated everything.
+                if name in self.groups and group is self.groups[name]:
+                    group = Group(group_yaml[name], texfiles)
+                    groups[name] = group
+                group.bit = 1 << index
+                changed_groups.add(name)
+        if len(changed_groups) > 0 or groups.keys() != self.groups.keys():
+            changes.groups_changed = True
+
+        # Enchantments
+        enchantment_yaml = yaml_dict['enchantments']
+        if enchantment_yaml == self.enchantment_yaml:
+            enchantments = self.enchantments
+        else:
+            enchantments = Enchantments()
+            for yamlobj in enchantment_yaml:
+                enchantments.add_enchantment(yamlobj)
+            changes.enchantments_changed = True
+
+        # Items
+        item_yaml = collections.OrderedDict()
+        for yamlobj in yaml_dict['items']:
+            item_yaml[Item.get_unique_id(yamlobj)] = (yamlobj, False)
+        item_yaml[Item.get_unique_id(self.unknown_yaml)] = (self.unknown_yaml, True)
+        items = {}
+        for (unique_id, (yamlobj, unknown)) in item_yaml.iteritems():
+            old = self.items.get_by_unique_id(unique_id)
+            rebuild = (old is None or yamlobj != self.item_yaml[unique_id] or
+                    old.unknown != unknown or
+                    yamlobj['texfile'] in changed_texfiles or
+                    (changes.enchantments_changed and 'enchantments' in yamlobj))
+            if not rebuild and 'groups' in yamlobj:
+                for group in yamlobj['groups']:
+                    if group in changed_groups:
+                        rebuild = True
+                        break
+            if rebuild:
+                item = Item(yamlobj, texfiles, groups, enchantments, unknown)
+                items[unique_id] = item
+                if old is None:
+                    changes.added.append(item)
+                else:
+                    changes.changed.append((old, item))
+        for item in self.items.get_items():
+            if item.unique_id not in item_yaml:
+                changes.removed.append(item)
+
+        # Everything's validated, so now commit it all.  Note that we
+        # patch our containers in place, since other objects hold
+        # references to them.
+        self.texfiles.clear()
+        self.texfiles.update(texfiles)
+        self.texfile_yaml = texfile_yaml
+        self.groups.clear()
+        self.groups.update(groups)
+        self.group_yaml = group_yaml
+        if enchantments is not self.enchantments:
+            self.enchantments.replace_with(enchantments)
+        self.enchantment_yaml = enchantment_yaml
+        for item in changes.removed:
+            self.items.remove_item(item)
+        for item in items.values():
+            item.enchantment_catalog = self.enchantments
+            item.groups = self._share(item.groups)
+            item.enchantments = self._share(item.enchantments)
+            self.items.add_item(item)
+        self.item_yaml = dict([(unique_id, yamlobj) for
+                (unique_id, (yamlobj, unknown)) in item_yaml.iteritems()])
+
+        # Finally, group membership
+        for group in self.groups.values():
+            group.items = []
+        for item in self.items.get_items():
+            for group in item.groups:
+                group.add_item(item)
+
+        return changes
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Copyright (c) 2012, Christopher J. Kucera
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the PyInvEdit team nor the names of its
+#       contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL VINCENT VOLLERS OR CJ KUCERA BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import gzip
+import zlib
+import Queue
+import struct
+import shutil
+import gobject
+import cStringIO
+import threading
+from pymclevel import nbt
+
+# This file contains helpers for reading and writing our NBT files in the
+# background, so that the GUI stays responsive while they run.  Anything
+# which needs to touch the GUI is handed back to the GTK main loop with
+# gobject.idle_add(), so gobject.threads_init() needs to have been called.
+
+class LoadJob(object):
+    """
+    Loads an NBT file on a worker thread.  The file is read and inflated
+    in chunks, so we can report progress (as a fraction of the bytes read)
+    and notice if we've been cancelled in between.  zlib releases the GIL
+    while it inflates each chunk.  The parse itself can't be split up or
+    run without the GIL, since it's building Python objects, so it's just
+    reported as a phase with no fraction.
+
+    progress_callback(job, phase, fraction) and done_callback(job,
+    leveldat, exception) are both called from the GTK main loop.  Progress
+    reports are coalesced, so a slow main loop only ever sees the latest
+    one.  Once cancel() has been called, neither callback fires again.
+    """
+
+    chunk_size = 256*1024
+
+    def __init__(self, path, progress_callback, done_callback):
+        self.path = path
+        self.progress_callback = progress_callback
+        self.done_callback = done_callback
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.progress = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        """
+        Starts loading
+        """
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Cancels the load.  If the worker is partway through parsing, it'll
+        finish that in the background and the result will be thrown away.
+        """
+        self.cancelled.set()
+
+    def is_cancelled(self):
+        """
+        Returns whether or not we've been cancelled
+        """
+        return self.cancelled.is_set()
+
+    def _run(self):
+        """
+        The worker thread itself
+        """
+        leveldat = None
+        exception = None
+        try:
+            leveldat = self._load()
+        except Exception, e:
+            exception = e
+        if not self.is_cancelled():
+            gobject.idle_add(self._finish, leveldat, exception)
+
+    def _load(self):
+        """
+        Reads, inflates and parses our file, returning the root NBT tag
+        (or None if we were cancelled).  As with nbt.load(), files which
+        aren't gzipped are parsed as-is.
+        """
+        total = max(os.path.getsize(self.path), 1)
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        gzipped = None
+        raw = []
+        inflated = []
+        bytes_read = 0
+        with open(self.path, 'rb') as df:
+            while True:
+                if self.is_cancelled():
+                    return None
+                chunk = df.read(self.chunk_size)
+                if not chunk:
+                    break
+                bytes_read += len(chunk)
+                if gzipped is None:
+                    # Find out from the first chunk whether we're gzipped
+                    try:
+                        inflated.append(inflater.decompress(chunk))
+                        gzipped = True
+                    except zlib.error:
+                        gzipped = False
+                        raw.append(chunk)
+                elif gzipped:
+                    inflated.append(inflater.decompress(chunk))
+                else:
+                    raw.append(chunk)
+                self._report('Reading', bytes_read / float(total))
+
+        if gzipped:
+            inflated.append(inflater.flush())
+            buf = ''.join(inflated)
+        else:
+            buf = ''.join(raw)
+        del raw, inflated
+
+        if self.is_cancelled():
+            return None
+        self._report('Parsing', None)
+        return nbt.load(buf=buf)
+
+    def _report(self, phase, fraction):
+        """
+        Queues up a progress report for the main loop, if one isn't
+        already waiting to be delivered
+        """
+        with self.lock:
+            pending = self.progress is not None
+            self.progress = (phase, fraction)
+        if not pending:
+            gobject.idle_add(self._deliver_progress)
+
+    def _deliver_progress(self):
+        """
+        Hands our latest progress report to our callback.  Runs in the
+        main loop.
+        """
+        with self.lock:
+            (phase, fraction) = self.progress
+            self.progress = None
+        if not self.is_cancelled():
+            self.progress_callback(self, phase, fraction)
+        return False
+
+    def _finish(self, leveldat, exception):
+        """
+        Hands our result to our callback.  Runs in the main loop.
+        """
+        if not self.is_cancelled():
+            self.done_callback(self, leveldat, exception)
+        return False
+
+class SaveJob(object):
+    """
+    A single save which has been handed to a SaveQueue
+    """
+
+    def __init__(self, tag, path, done_callback):
+        self.tag = tag
+        self.path = path
+        self.done_callback = done_callback
+
+class SaveQueue(object):
+    """
+    Saves NBT data on a worker thread: encoding, compressing and writing
+    all happen off of the main loop.  There's a single worker working
+    through the queue in order, so if several saves are queued up back to
+    back, they hit the disk in the order they were queued.  Each file is
+    written to a temporary file alongside the real one and then renamed
+    over it, so a half-finished save never leaves a truncated file behind.
+
+    The tag being saved is read by the worker until its done_callback(job,
+    exception) is called (from the GTK main loop), so the caller shouldn't
+    change it until then.  is_pending() lets the caller check whether it
+    needs to make a copy to work on instead.
+    """
+
+    compresslevel = 2
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.pending = []
+        self.thread = None
+
+    def save(self, tag, path, done_callback):
+        """
+        Queues up a save of the given root tag to the given path, and
+        returns its SaveJob
+        """
+        job = SaveJob(tag, path, done_callback)
+        self.pending.append(job)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(job)
+        return job
+
+    def is_pending(self, tag):
+        """
+        Returns whether the given tag is part of a save which hasn't
+        finished yet
+        """
+        for job in self.pending:
+            if job.tag is tag:
+                return True
+        return False
+
+    def has_pending(self):
+        """
+        Returns whether we've got any saves which haven't finished yet
+        """
+        return len(self.pending) > 0
+
+    def wait(self):
+        """
+        Blocks until everything we've been given has been written out
+        (for when we're about to quit)
+        """
+        self.queue.join()
+
+    def _run(self):
+        """
+        The worker thread itself
+        """
+        while True:
+            job = self.queue.get()
+            exception = None
+            try:
+                self._write(job.tag, job.path)
+            except Exception, e:
+                exception = e
+            gobject.idle_add(self._finish, job, exception)
+            self.queue.task_done()
+
+    def _write(self, tag, path):
+        """
+        Encodes, compresses and writes out a single tag
+        """
+        buf = cStringIO.StringIO()
+        tag.save(buf=buf)
+        tmppath = '%s.tmp' % (path)
+        try:
+            with open(tmppath, 'wb') as df:
+                # No filename in the gzip header: pymclevel's pure-Python
+                # loader assumes the header is a fixed ten bytes.
+                gz = gzip.GzipFile('', 'wb', self.compresslevel, df)
+                gz.write(buf.getvalue())
+                gz.close()
+                # Make sure the data's really on disk before it replaces
+                # the old file
+                df.flush()
+                os.fsync(df.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, tmppath)
+                if os.name == 'nt':
+                    # rename() won't replace an existing file on Windows
+                    os.remove(path)
+            os.rename(tmppath, path)
+        except:
+            # Don't leave a partial temp file lying around
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+    def _finish(self, job, exception):
+        """
+        Reports a finished save to its callback.  Runs in the main loop.
+        """
+        self.pending.remove(job)
+        job.done_callback(job, exception)
+        return False
+
+class NBTStreamReader(object):
+    """
+    Pulls a few values out of an NBT file without parsing the whole
+    thing.  We walk the tag stream straight off the (possibly gzipped)
+    file, skipping over anything we're not interested in without building
+    any objects for it, and stop reading as soon as we've found everything
+    we were after.  Only simple values (numbers and strings) can be read
+    this way.
+    """
+
+    # Struct formats for our fixed-size tag types, by tag ID
+    formats = {
+            1: '>b',
+            2: '>h',
+            3: '>i',
+            4: '>q',
+            5: '>f',
+            6: '>d',
+        }
+
+    TAG_END = 0
+    TAG_BYTE_ARRAY = 7
+    TAG_STRING = 8
+    TAG_LIST = 9
+    TAG_COMPOUND = 10
+    TAG_INT_ARRAY = 11
+    TAG_SHORT_ARRAY = 12
+
+    # How much to read at a time when skipping over big arrays
+    skip_chunk = 64*1024
+
+    def __init__(self, df):
+        self.df = df
+
+    def _read(self, length):
+        """
+        Reads exactly the given number of bytes
+        """
+        data = self.df.read(length)
+        if len(data) != length:
+            raise Exception('NBT stream too short')
+        return data
+
+    def _skip(self, length):
+        """
+        Skips over the given number of bytes
+        """
+        while length > 0:
+            data = self.df.read(min(length, self.skip_chunk))
+            if len(data) == 0:
+                raise Exception('NBT stream too short')
+            length -= len(data)
+
+    def _read_tag_id(self):
+        return ord(self._read(1))
+
+    def _read_int(self):
+        return struct.unpack('>i', self._read(4))[0]
+
+    def _read_string(self):
+        (length,) = struct.unpack('>H', self._read(2))
+        return self._read(length).decode('utf-8')
+
+    def _read_value(self, tag_id):
+        """
+        Reads the value of a tag of the given type.  Anything which isn't
+        a number or a string is skipped, and we return None for it.
+        """
+        if tag_id in self.formats:
+            fmt = self.formats[tag_id]
+            return struct.unpack(fmt, self._read(struct.calcsize(fmt)))[0]
+        elif tag_id == self.TAG_STRING:
+            return self._read_string()
+        else:
+            self._skip_value(tag_id)
+            return None
+
+    def _skip_value(self, tag_id):
+        """
+        Skips over the value of a tag of the given type
+        """
+        if tag_id in self.formats:
+            self._skip(struct.calcsize(self.formats[tag_id]))
+        elif tag_id == self.TAG_BYTE_ARRAY:
+            self._skip(self._read_int())
+        elif tag_id == self.TAG_STRING:
+            self._skip(struct.unpack('>H', self._read(2))[0])
+        elif tag_id == self.TAG_LIST:
+            list_type = self._read_tag_id()
+            count = self._read_int()
+            if list_type in self.formats:
+                self._skip(count * struct.calcsize(self.formats[list_type]))
+            else:
+                for i in range(count):
+                    self._skip_value(list_type)
+        elif tag_id == self.TAG_COMPOUND:
+            while True:
+                child_id = self._read_tag_id()
+                if child_id == self.TAG_END:
+                    break
+                self._skip(struct.unpack('>H', self._read(2))[0])
+                self._skip_value(child_id)
+        elif tag_id == self.TAG_INT_ARRAY:
+            self._skip(self._read_int()*4)
+        elif tag_id == self.TAG_SHORT_ARRAY:
+            self._skip(self._read_int()*2)
+        else:
+            raise Exception('Unknown NBT tag type %d' % (tag_id))
+
+    def read_values(self, section, names):
+        """
+        Returns a dict of the values of the given tag names, from the
+        compound with the given name inside the root compound (ie: 'Data',
+        in a level.dat).  Tags which aren't found are left out.
+        """
+        if self._read_tag_id() != self.TAG_COMPOUND:
+            raise Exception('Not an NBT file with a root TAG_Compound')
+        self._skip(struct.unpack('>H', self._read(2))[0])
+        values = {}
+        wanted = set(names)
+        while True:
+            tag_id = self._read_tag_id()
+            if tag_id == self.TAG_END:
+                break
+            name = self._read_string()
+            if name != section or tag_id != self.TAG_COMPOUND:
+                self._skip_value(tag_id)
+                continue
+            while len(wanted) > 0:
+                tag_id = self._read_tag_id()
+                if tag_id == self.TAG_END:
+                    break
+                name = self._read_string()
+                if name in wanted:
+                    values[name] = self._read_value(tag_id)
+                    wanted.discard(name)
+                else:
+                    self._skip_value(tag_id)
+            break
+        return values
+
+def read_nbt_values(path, section, names):
+    """
+    Reads the given tag values from an NBT file on disk, using an
+    NBTStreamReader.  As with nbt.load(), the file can be gzipped or not.
+    """
+    with open(path, 'rb') as df:
+        gzipped = (df.read(2) == '\x1f\x8b')
+        df.seek(0)
+        if gzipped:
+            return NBTStreamReader(gzip.GzipFile(fileobj=df)).read_values(section, names)
+        else:
+            return NBTStreamReader(df).read_values(section, names)
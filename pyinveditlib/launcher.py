@@ -21,6 +21,10 @@ except Exception, e:
 
 def main(argv=None):
     from pyinveditlib import pyinveditapp
+
+    # We load files on worker threads, which report back via the main loop
+    gobject.threads_init()
+
     app = pyinveditapp.PyInvEdit()
     app.run()
 
@@ -29,20 +29,148 @@
 
 import os
 import gtk
-import math
-import yaml
+import copy
+import time
 import cairo
+import gobject
+import bisect
 import pango
-import pangocairo
-import collections
 from pymclevel import nbt, mclevelbase
-from pyinveditlib import dialogs, util, minecraft, data
+from pyinveditlib import dialogs, util, minecraft, data, watcher, search, render, fileio, worlds
 from pyinveditlib import about_name, about_version
 
 # This is the bulk of the actual application; the classes here are,
 # by and large, derived from PyGTK widgets, and provide some kind of
 # GUI element to the user.
 
+class RedrawQueue(object):
+    """
+    Collects slot images (and detail panels) which need to be redrawn
+    during bulk operations, and then redraws them all at once from an
+    idle callback, rather than painting each slot as we go.  The callback
+    runs just ahead of GTK's own redraw, so everything lands in a single
+    frame.
+    """
+
+    def __init__(self):
+        self.images = set()
+        self.details = {}
+        self.idle_id = None
+
+    def queue_image(self, image):
+        """
+        Queues up a redraw of the given InvImage
+        """
+        self.images.add(image)
+        self._schedule()
+
+    def queue_details(self, detail, button):
+        """
+        Queues up a refresh of the given InvDetails from the given button.
+        Only the most recent button for each InvDetails is kept.
+        """
+        self.details[detail] = button
+        self._schedule()
+
+    def _schedule(self):
+        """
+        Makes sure that we've got a flush coming up
+        """
+        if self.idle_id is None:
+            self.idle_id = gobject.idle_add(self.flush, priority=gobject.PRIORITY_HIGH_IDLE)
+
+    def flush(self):
+        """
+        Invalidates all our queued images and refreshes our queued detail
+        panels.  Detail panels are skipped if their button has stopped
+        being the active one in the meantime.
+        """
+        if self.idle_id is not None:
+            gobject.source_remove(self.idle_id)
+            self.idle_id = None
+        images = self.images
+        details = self.details
+        self.images = set()
+        self.details = {}
+        for image in images:
+            image.invalidate()
+        for (detail, button) in details.items():
+            if button.get_active():
+                detail.update_from_button(button)
+        return False
+
+# Global queue, so that any of our widgets can get at it
+redraw_queue = RedrawQueue()
+
+class EnchantmentRow(object):
+    """
+    One row of the enchantment list in InvDetails: the enchantment's text,
+    a button to bring it up to max level, and a button to delete it.  Rows
+    are created as needed and then kept around, being rebound to whichever
+    enchantments the current slot has, rather than being rebuilt every
+    time a slot is selected.
+    """
+
+    def __init__(self, detail, table, idx):
+        self.detail = detail
+        self.idx = idx
+
+        # First the enchantment text itself
+        self.label = gtk.Label()
+        self.align = gtk.Alignment(0, .5, 0, 0)
+        self.align.set_padding(0, 0, 0, 5)
+        self.align.add(self.label)
+        table.attach(self.align, 0, 1, idx, idx+1, gtk.FILL, gtk.FILL)
+
+        # A button to bring the enchantment up to its max value
+        self.max_button = gtk.Button()
+        self.max_button.set_image(gtk.image_new_from_stock(gtk.STOCK_GO_UP, gtk.ICON_SIZE_MENU))
+        self.max_button.set_tooltip_text('Maximize Enchantment Level')
+        self.max_button.connect('clicked', self.on_max)
+        table.attach(self.max_button, 1, 2, idx, idx+1, gtk.FILL, gtk.FILL)
+
+        # And a button to delete
+        self.delete_button = gtk.Button()
+        self.delete_button.set_image(gtk.image_new_from_stock(gtk.STOCK_CUT, gtk.ICON_SIZE_MENU))
+        self.delete_button.set_tooltip_text('Delete Enchantment')
+        self.delete_button.connect('clicked', self.on_delete)
+        table.attach(self.delete_button, 2, 3, idx, idx+1, gtk.FILL, gtk.FILL)
+
+        # We show and hide these ourselves
+        for widget in [self.align, self.max_button, self.delete_button]:
+            widget.show_all()
+            widget.set_no_show_all(True)
+
+    def bind(self, text, can_max):
+        """
+        Shows this row with the given text.  can_max determines whether
+        our max-level button is shown.
+        """
+        self.label.set_markup(text)
+        self.align.show()
+        self.max_button.set_visible(can_max)
+        self.delete_button.show()
+
+    def hide(self):
+        """
+        Hides this row, when it's not needed
+        """
+        self.align.hide()
+        self.max_button.hide()
+        self.delete_button.hide()
+
+    def on_max(self, button):
+        """
+        Our max-level button was clicked
+        """
+        self.detail.ench_max_level(button, self.idx)
+
+    def on_delete(self, button):
+        """
+        Our delete button was clicked
+        """
+        self.detail.ench_delete(button, self.idx)
+
 class InvDetails(gtk.Table):
     """
     Class to show our inventory item details
@@ -75,7 +203,7 @@ class InvDetails(gtk.Table):
 
         cur_row += 1
         self._rowlabel(cur_row, 'ID')
-        self._rowspinner(cur_row, 'num', 0, 4095)
+        self._rowspinner(cur_row, 'num', 0, 32767)
 
         cur_row += 1
         self._rowlabel(cur_row, 'Damage/Data')
@@ -92,13 +220,26 @@ class InvDetails(gtk.Table):
 
         self.ench_vport = gtk.Viewport()
         self.ench_vport.set_shadow_type(gtk.SHADOW_IN)
-        self.enchbox = gtk.Table(1, 1)
+        self.enchbox = gtk.Table(1, 3)
+        self.ench_rows = []
         align = gtk.Alignment(0, 0, 0, 0)
         align.set_padding(3, 3, 5, 0)
         align.add(self.enchbox)
         self.ench_vport.add(align)
         self.attach(self.ench_vport, 1, 3, cur_row, cur_row+1, gtk.FILL, gtk.FILL)
 
+        # The enchantment Add button, which always sits below our last
+        # enchantment row
+        button = gtk.Button()
+        button.set_image(gtk.image_new_from_stock(gtk.STOCK_ADD, gtk.ICON_SIZE_MENU))
+        button.set_tooltip_text('Add new enchantment to this item')
+        button.connect('clicked', self.add_enchantment)
+        self.ench_add = gtk.Alignment(0, 0, 1, 0)
+        self.ench_add.add(button)
+        self.ench_add_row = 0
+        self.enchbox.attach(self.ench_add, 0, 1, 0, 1, 0, gtk.FILL)
+        self.ench_vport.show_all()
+
         cur_row += 1
         self.extrainfo = gtk.Label()
         self.attach(self.extrainfo, 0, 3, cur_row, cur_row+1, gtk.FILL, gtk.FILL)
@@ -213,51 +354,35 @@ class InvDetails(gtk.Table):
 
             # Things to skip if we can
             if not updated_self:
-                # Enchantments
-                for contents in self.enchbox.get_children():
-                    self.enchbox.remove(contents)
-                self.enchbox.resize(3, len(self.button.inventoryslot.enchantments)+1)
-                last_idx = -1
-                for idx, ench in enumerate(self.button.inventoryslot.enchantments):
+                # Enchantments.  We only create rows if we don't have enough
+                # already; otherwise they're just rebound.
+                enchantments = self.button.inventoryslot.enchantments
+                if len(enchantments) > len(self.ench_rows):
+                    self.enchbox.resize(len(enchantments)+1, 3)
+                    for idx in range(len(self.ench_rows), len(enchantments)):
+                        self.ench_rows.append(EnchantmentRow(self, self.enchbox, idx))
+                for idx, row in enumerate(self.ench_rows):
+                    if idx >= len(enchantments):
+                        row.hide()
+                        continue
+                    ench = enchantments[idx]
 
                     # First the enchantment text itself
                     ench_text = self.enchantments.get_text(ench.num, ench.lvl)
                     if ench.has_extra_info():
                         ench_text = '%s <i>(has extra tag info)</i>' % (ench_text)
-                    align = gtk.Alignment(0, .5, 0, 0)
-                    align.set_padding(0, 0, 0, 5)
-                    label = gtk.Label()
-                    label.set_markup(ench_text)
-                    align.add(label)
-                    self.enchbox.attach(align, 0, 1, idx, idx+1, gtk.FILL, gtk.FILL)
-                    
+
                     # If we're not at (or above) the enchantment's max value, a button to do that
                     ench_obj = self.enchantments.get_by_id(ench.num)
-                    if ench_obj is not None:
-                        if ench.lvl < ench_obj.max_power:
-                            button = gtk.Button()
-                            button.set_image(gtk.image_new_from_stock(gtk.STOCK_GO_UP, gtk.ICON_SIZE_MENU))
-                            button.set_tooltip_text('Maximize Enchantment Level')
-                            button.connect('clicked', self.ench_max_level, idx)
-                            self.enchbox.attach(button, 1, 2, idx, idx+1, gtk.FILL, gtk.FILL)
-                    
-                    # And a button to delete
-                    button = gtk.Button()
-                    button.set_image(gtk.image_new_from_stock(gtk.STOCK_CUT, gtk.ICON_SIZE_MENU))
-                    button.set_tooltip_text('Delete Enchantment')
-                    button.connect('clicked', self.ench_delete, idx)
-                    self.enchbox.attach(button, 2, 3, idx, idx+1, gtk.FILL, gtk.FILL)
-
-                    last_idx = idx
-
-                # Now the enchantment Add button
-                button = gtk.Button()
-                button.set_image(gtk.image_new_from_stock(gtk.STOCK_ADD, gtk.ICON_SIZE_MENU))
-                button.set_tooltip_text('Add new enchantment to this item')
-                button.connect('clicked', self.add_enchantment)
-                align = gtk.Alignment(0, 0, 1, 0)
-                align.add(button)
-                self.enchbox.attach(align, 0, 1, last_idx+1, last_idx+2, 0, gtk.FILL)
+                    can_max = (ench_obj is not None and ench.lvl < ench_obj.max_power)
+
+                    row.bind(ench_text, can_max)
+
+                # Now move the enchantment Add button, if need be
+                if self.ench_add_row != len(enchantments):
+                    self.ench_add_row = len(enchantments)
+                    self.enchbox.child_set_property(self.ench_add, 'top-attach', self.ench_add_row)
+                    self.enchbox.child_set_property(self.ench_add, 'bottom-attach', self.ench_add_row+1)
 
                 # If we have at least one enchantment, draw a border
                 if len(self.button.inventoryslot.enchantments) > 0:
@@ -267,7 +392,6 @@ class InvDetails(gtk.Table):
 
                 # Show everything
                 self.ench_vport.set_visible(True)
-                self.ench_vport.show_all()
 
         self.updating = False
 
@@ -361,242 +485,192 @@ class InvImage(gtk.DrawingArea):
     context returned from self.window.cairo_create() because that surface
     is an XlibSurface, which apparently contains the entire app window, not
     just our one widget.
+
+    The drawing itself is done by a render.SlotRenderer, which doesn't
+    need GTK.  Rendered surfaces are shared between every slot in the app, through
+    a process-wide LRU cache keyed on what the slot looks like, so a whole
+    inventory full of the same stacks only renders each one once.  Each
+    slot also remembers which key it last showed, so an expose which
+    doesn't change anything is just a copy to the window.  The cached
+    surfaces are shared, so nothing should draw onto self.surf directly.
+
+    On HiDPI displays, slots are rendered at device resolution (size
+    times our scale factor), so exposes are always a straight copy.  When
+    the scale changes, set_scale() throws out the cache and swaps in a
+    new renderer, and the caller redraws everything in one go.
     """
 
-    # Our size
+    # Our size (before scaling), our display's scale factor and font
+    # resolution, and the renderer which does the actual drawing
     size = 50
+    scale = 1
+    resolution = None
+    renderer = render.SlotRenderer(size, scale)
 
-    # Corner constants
-    CORNER_NW = 0
-    CORNER_NE = 1
-    CORNER_SE = 2
-    CORNER_SW = 3
-    CORNER_CENTER = 4
+    # Padding around us inside our buttons
+    button_padding = 13
 
-    # Damage bar constants
-    DAMAGE_X = 3
-    DAMAGE_Y = size-6
-    DAMAGE_W = size-6
-    DAMAGE_H = 3
+    # Our shared cache of rendered slots.  render_generation is bumped
+    # whenever the cache is cleared, so that slots know to look again.
+    # Drag icons are cached alongside, with the same keys.
+    render_cache = util.LRUCache(512)
+    pixbuf_cache = util.LRUCache(128)
+    render_generation = 0
 
     # We define our own expose behavior
     __gsignals__ = { 'expose_event': 'override' }
 
     def __init__(self, button, empty=None):
         super(InvImage, self).__init__()
-        self.set_size_request(self.size, self.size)
+        self.set_size_request(self.renderer.size, self.renderer.size)
         self.button = button
         self.surf = None
         self.cr = None
-        self.pangoctx = None
-        self.cairoctx = None
         self.empty = empty
+        self.render_key = None
+        self.render_generation = None
 
-    def do_expose_event(self, event):
+    @classmethod
+    def clear_render_cache(cls):
         """
-        On our first expose event we'll set up some various vars
-        which we can't set up until the window's exposed.  Then
-        just call the main draw() function.
+        Throws away all our cached slot images and drag icons (used when
+        our item catalog has been reloaded)
         """
-        # TODO: huh, something in here needs to be generated each time.
-        if True or self.cr is None:
-            self.surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.size, self.size)
-            self.cr = cairo.Context(self.surf)
-            self.pangoctx = self.get_parent().get_pango_context()
-            self.pangolayout = pango.Layout(self.pangoctx)
-            self.pangolayout.set_font_description(pango.FontDescription('sans bold 9'))
-            self.pangolayout.set_width(self.size)
-            self.pangolayoutbigger = pango.Layout(self.pangoctx)
-            self.pangolayoutbigger.set_font_description(pango.FontDescription('sans bold 12'))
-            self.pangolayoutbigger.set_width(self.size)
-            self.cairoctx = pangocairo.CairoContext(self.cr)
-        self.draw()
+        cls.render_cache.clear()
+        cls.pixbuf_cache.clear()
+        cls.render_generation += 1
 
-    def draw(self):
+    @classmethod
+    def set_scale(cls, scale, resolution=None):
         """
-        The meat of the rendering
+        Sets the scale factor and font resolution we render at.  Existing
+        slots need to have rescale() called on them afterwards.
         """
-        slotinfo = self.button.inventoryslot
-
-        done_bg = False
-        if self.button.get_active():
-            done_bg = True
-            self.cr.set_source_rgba(.8, .8, .8, 1)
-            self.cr.rectangle(0, 0, self.size, self.size)
-            self.cr.fill()
+        cls.scale = scale
+        cls.resolution = resolution
+        cls.renderer = render.SlotRenderer(cls.size, scale, resolution)
+        cls.clear_render_cache()
 
-        if slotinfo is None:
-            # Nothing in this inventory slot
-            if self.empty is None:
-                if not done_bg:
-                    self.cr.set_source_rgba(0, 0, 0, 0)
-                    self.cr.rectangle(0, 0, self.size, self.size)
-                    self.cr.fill()
-            else:
-                self._surface_center(self.empty)
-        else:
-            # Get information about the item, if we can
-            imgsurf = None
-            item = self.button.items.get_item(slotinfo.num, slotinfo.damage)
-            if item is not None:
-                imgsurf = item.get_image(True)
-
-            # Now get the "base" image
-            if imgsurf is None:
-                center = self.size/2
-
-                self.cr.set_source_rgba(0, 0, 0, 1)
-                self.cr.arc(center, center, center-10, 0, math.pi*2)
-                self.cr.fill()
-
-                self.cr.set_source_rgba(1, 1, 1, 1)
-                self.cr.arc(center, center, center-12, 0, math.pi*2)
-                self.cr.fill()
-
-                self.cr.set_source_rgba(.4196, .596, .7725, 1)
-                self.cr.arc(center, center, center-14, 0, math.pi*2)
-                self.cr.fill()
-
-                self._text_at('%d' % (slotinfo.num), [1, 1, 1, 1], [0, 0, 0, 1], self.CORNER_CENTER)
-            else:
-                self._surface_center(imgsurf)
-
-            # Now the quantity
-            if slotinfo.count > 1:
-                if item is None:
-                    max_quantity = 64
-                else:
-                    max_quantity = item.max_quantity
-
-                if slotinfo.count <= max_quantity:
-                    outlinecolor = [0, 0, 0, 1]
-                else:
-                    outlinecolor = [1, 0, 0, 1]
-
-                self._text_at('%d' % (slotinfo.count), [1, 1, 1, 1], outlinecolor, self.CORNER_SE)
-
-            # Damage (either bar or number)
-            if item is not None and item.all_data:
-                # Report on data value, but it's not an error
-                self._text_at('%d' % (slotinfo.damage), [.2, .2, 1, 1], [1, 1, 1, 1], self.CORNER_NW)
-            elif slotinfo.damage > 0:
-                if item is None:
-                    # No item data to compare against, assume that it's wrong, I guess
-                    self._text_at('%d' % (slotinfo.damage), [1, 0, 0, 1], [0, 0, 0, 1], self.CORNER_NW)
-                elif item.max_damage is None:
-                    # No max damage defined, so check for the Unique ID to see if we're a known data
-                    # type or not.
-                    if item.data != slotinfo.damage:
-                        # Invalid data, apparently!  Red text.
-                        self._text_at('%d' % (slotinfo.damage), [1, 0, 0, 1], [0, 0, 0, 1], self.CORNER_NW)
-                else:
-                    # We have a max damage definition; check against it
-                    if (slotinfo.damage > item.max_damage):
-                        # Damage value is over our known max
-                        self._text_at('%d' % (slotinfo.damage), [1, 0, 0, 1], [0, 0, 0, 1], self.CORNER_NW)
-                    else:
-                        # Damage is in the proper range - draw a damage bar
-                        percent = 1 - (slotinfo.damage / float(item.max_damage))
-
-                        # The base (black) bar
-                        self.cr.set_source_rgba(0, 0, 0, 1)
-                        self.cr.rectangle(self.DAMAGE_X, self.DAMAGE_Y, self.DAMAGE_W, self.DAMAGE_H)
-                        self.cr.fill()
-
-                        # The actual damage notifier
-                        self.cr.set_source_rgba(1-percent, percent, 0, 1)
-                        self.cr.rectangle(self.DAMAGE_X, self.DAMAGE_Y, self.DAMAGE_W*percent, self.DAMAGE_H)
-                        self.cr.fill()
+    @classmethod
+    def get_button_size(cls):
+        """
+        Returns the size our buttons should be, at our current scale
+        """
+        return cls.renderer.size + cls.button_padding
 
-            # Enchantments
-            if len(slotinfo.enchantments) > 0:
-                self._text_at('+%d' % (len(slotinfo.enchantments)), [.7764, .1686, 1, 1], [0, 0, 0, 1], self.CORNER_NE)
+    def rescale(self):
+        """
+        Updates our size for a new scale factor, and queues a redraw
+        """
+        self.set_size_request(self.renderer.size, self.renderer.size)
+        self.invalidate()
 
-            # Extra tag info
-            if slotinfo.has_extra_info():
-                self._text_at('+', [0, 1, 0, 1], [0, 0, 0, 1], self.CORNER_SW, True)
+    def do_expose_event(self, event):
+        """
+        Make sure we have the right surface for our current state, and then
+        copy it to the window.
+        """
+        self._update_surface()
 
-        # Finally, at the very end, copy our stored ImageSurface to our
-        # actual DrawingArea window
+        # Copy our stored ImageSurface to our actual DrawingArea window
         wincr = self.window.cairo_create()
+        wincr.rectangle(event.area.x, event.area.y, event.area.width, event.area.height)
+        wincr.clip()
         wincr.set_source_surface(self.surf)
-        wincr.rectangle(0, 0, self.size, self.size)
-        wincr.fill()
+        wincr.paint()
 
-    def _surface_center(self, surface):
+    def _update_surface(self):
         """
-        Draws a cairo surface to the center of the image.
+        Makes sure that self.surf matches our current state, fetching it
+        from our shared cache, or rendering it if need be.
         """
-        offset = (self.size - surface.get_width()) / 2
-        self.cr.set_source_surface(surface, offset, offset)
-        self.cr.move_to(0, 0)
-        self.cr.rectangle(offset, offset, surface.get_width(), surface.get_width())
-        self.cr.fill()
+        (key, item, damage_key) = self.get_render_key()
+        if key != self.render_key or self.render_generation != InvImage.render_generation:
+            surf = InvImage.render_cache.get(key)
+            if surf is None:
+                surf = self._render(item, damage_key)
+                InvImage.render_cache.put(key, surf)
+            self.surf = surf
+            self.render_key = key
+            self.render_generation = InvImage.render_generation
 
-    def _text_at(self, text, textcolor, outlinecolor, corner, bigger=False):
+    def get_render_key(self):
         """
-        Draws some text to our surface at the given location, using the given colors
-        for the text and the outline.
+        Returns a tuple describing everything which affects how we're
+        drawn, along with the catalog item for our slot (if any) and the
+        damage key which draw() uses.  Items are identified by unique ID,
+        or by number if they're not in our catalog.
         """
-        if bigger:
-            layout = self.pangolayoutbigger
-        else:
-            layout = self.pangolayout
-        layout.set_markup(text)
-        (width, height) = map(lambda x: x/pango.SCALE, layout.get_size())
-        if corner == self.CORNER_NW:
-            x = 1
-            y = 1
-        elif corner == self.CORNER_NE:
-            x = self.size-1-width
-            y = 1
-        elif corner == self.CORNER_SE:
-            x = self.size-1-width
-            y = self.size-1-height
-        elif corner == self.CORNER_SW:
-            x = 1
-            y = self.size-1-height
+        slotinfo = self.button.inventoryslot
+        active = self.button.get_active()
+        if slotinfo is None:
+            if self.empty is None:
+                return ((self.renderer.size, active), None, None)
+            else:
+                return ((self.renderer.size, active, id(self.empty.atlas),
+                    self.empty.x, self.empty.y), None, None)
+        item = self.button.items.get_item(slotinfo.num, slotinfo.damage)
+        if item is None:
+            item_key = ('num', slotinfo.num)
         else:
-            x = (self.size-width)/2
-            y = (self.size-height)/2
-
-        # Now the actual rendering
-        self.cr.move_to(x, y)
-        self.cairoctx.layout_path(layout)
-        self.cr.set_source_rgba(*outlinecolor)
-        self.cr.set_line_width(2)
-        self.cr.stroke()
-        self.cr.move_to(x, y)
-        self.cr.set_source_rgba(*textcolor)
-        self.cairoctx.show_layout(layout)
+            item_key = item.unique_id
+        damage_key = self.renderer.get_damage_key(slotinfo, item)
+        key = (self.renderer.size, active, item_key, slotinfo.count, damage_key,
+                len(slotinfo.enchantments), slotinfo.has_extra_info())
+        return (key, item, damage_key)
+
+    def _render(self, item, damage_key):
+        """
+        Renders our slot to a new ImageSurface and returns it
+        """
+        surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.renderer.size, self.renderer.size)
+        self.renderer.draw(cairo.Context(surf), self.button.inventoryslot,
+                item, self.button.get_active(), self.empty, damage_key)
+        return surf
 
     def update(self):
         """
-        Re-queue an update for ourselves
+        Re-queue an update for ourselves, and redraw right away
         """
         if self.window is not None:
-            self.window.invalidate_rect(gtk.gdk.Rectangle(0, 0, self.size, self.size), True)
+            self.invalidate()
             self.window.process_updates(True)
 
+    def invalidate(self):
+        """
+        Marks ourselves as needing a redraw, which will happen whenever
+        GTK next gets around to it
+        """
+        if self.window is not None:
+            self.window.invalidate_rect(gtk.gdk.Rectangle(0, 0,
+                self.renderer.size, self.renderer.size), True)
+
     def get_pixbuf(self):
         """
-        Returns our currently-displayed image as a gtk.gdk.Pixbuf
+        Returns our currently-displayed image as a gtk.gdk.Pixbuf.  These
+        are cached by render key, so the conversion only happens the first
+        time a given slot image is needed.
         """
-        return util.get_pixbuf_from_surface(self.surf)
+        self._update_surface()
+        pixbuf = InvImage.pixbuf_cache.get(self.render_key)
+        if pixbuf is None:
+            pixbuf = util.get_pixbuf_from_surface(self.surf)
+            InvImage.pixbuf_cache.put(self.render_key, pixbuf)
+        return pixbuf
 
 class TrashButton(gtk.Button):
     """
     Class for our trash button
     """
 
-    def __init__(self, surf):
+    def __init__(self, icon):
         super(TrashButton, self).__init__()
-        self.set_size_request(63, 63)
         self.set_border_width(0)
         self.set_relief(gtk.RELIEF_HALF)
+        self.icon = icon
         self.image = gtk.Image()
-        self.image.set_from_pixbuf(util.get_pixbuf_from_surface(surf))
         self.add(self.image)
+        self.rescale()
         self.set_tooltip_markup('Trash <i>(Drag items here to delete)</i>')
 
         # Set up drag and drop inbetween items
@@ -605,6 +679,21 @@ class TrashButton(gtk.Button):
         self.connect('drag_drop', self.target_drag_drop)
         self.connect('drag_motion', self.target_drag_motion)
 
+    def set_icon(self, icon):
+        """
+        Switches to a new icon (when our texture file has been reloaded)
+        """
+        self.icon = icon
+        self.rescale()
+
+    def rescale(self):
+        """
+        Sizes ourselves (and our icon) for InvImage's current scale factor
+        """
+        size = InvImage.get_button_size()
+        self.set_size_request(size, size)
+        self.image.set_from_pixbuf(self.icon.at_scale(InvImage.scale).get_pixbuf())
+
     def target_drag_drop(self, img, context, x, y, time):
         """
         What to do when we've received a drag request.  (ie: delete the data)
@@ -637,7 +726,7 @@ class InvButton(gtk.RadioButton):
         super(InvButton, self).__init__()
         self.set_mode(False)
         # TODO: Get the button size down properly
-        self.set_size_request(63, 63)
+        self.set_size_request(InvImage.get_button_size(), InvImage.get_button_size())
         self.set_border_width(0)
         self.set_relief(gtk.RELIEF_HALF)
         self.set_active(False)
@@ -663,6 +752,13 @@ class InvButton(gtk.RadioButton):
         self.drag_button = 1
         self.dragging = False
 
+    def rescale(self):
+        """
+        Resizes ourselves for InvImage's current scale factor
+        """
+        self.set_size_request(InvImage.get_button_size(), InvImage.get_button_size())
+        self.image.rescale()
+
     def key_release(self, widget, event, param=None):
         """
         Handle a keypress (mostly just 'delete')
@@ -801,18 +897,24 @@ class InvButton(gtk.RadioButton):
         else:
             return False
 
-    def update_slot(self, inventoryslot):
+    def update_slot(self, inventoryslot, defer=False):
         """
-        Updates this button with new inventoryslot information
+        Updates this button with new inventoryslot information.  If defer
+        is True, the redraw goes on our redraw queue.
         """
         self.inventoryslot = inventoryslot
-        self.update_graphics()
+        self.update_graphics(defer)
 
-    def update_graphics(self):
+    def update_graphics(self, defer=False):
         """
-        There have been changes to our object, update the graphics
+        There have been changes to our object, update the graphics.  If
+        defer is True, the redraw is put on our redraw queue rather than
+        happening immediately.
         """
-        self.image.update()
+        if defer:
+            redraw_queue.queue_image(self.image)
+        else:
+            self.image.update()
         text = self.get_text()
         if text is None:
             self.set_has_tooltip(False)
@@ -826,13 +928,17 @@ class InvButton(gtk.RadioButton):
         """
         self.update_item()
 
-    def update_item(self):
+    def update_item(self, defer=False):
         """
-        Refreshes both our button graphic, and the detail window (if appropriate)
+        Refreshes both our button graphic, and the detail window (if appropriate).
+        If defer is True, both are put on our redraw queue.
         """
-        self.update_graphics()
+        self.update_graphics(defer)
         if self.get_active():
-            self.detail.update_from_button(self)
+            if defer:
+                redraw_queue.queue_details(self.detail, self)
+            else:
+                self.detail.update_from_button(self)
 
     def on_mouse(self, widget, event):
         """
@@ -947,7 +1053,8 @@ class BaseInvTable(gtk.Table):
         self.detail = detail
 
         # Trash button
-        self.attach(TrashButton(gui_sheet.get_tex(1, 0, True)), 8, 9, 0, 1, gtk.FILL, gtk.FILL, ypadding=7)
+        self.trash = TrashButton(gui_sheet.get_tex(1, 0, True))
+        self.attach(self.trash, 8, 9, 0, 1, gtk.FILL, gtk.FILL, ypadding=7)
 
     def _new_button(self, x, y, slot, ypadding=0, empty=None):
         """
@@ -971,6 +1078,21 @@ class BaseInvTable(gtk.Table):
         for button in self.buttons.values():
             button.clear()
 
+    def set_gui_sheet(self, gui_sheet):
+        """
+        Re-points our icons at a new gui.png TexFile (when it's been
+        reloaded)
+        """
+        self.trash.set_icon(gui_sheet.get_tex(1, 0, True))
+
+    def rescale(self):
+        """
+        Resizes all our buttons for a new scale factor
+        """
+        self.trash.rescale()
+        for button in self.buttons.values():
+            button.rescale()
+
     def update_active_button(self):
         """
         Loops through all our buttons and makes sure that the proper one is
@@ -981,13 +1103,25 @@ class BaseInvTable(gtk.Table):
                 button.update_item()
                 break
 
+    def refresh_items(self, unique_ids):
+        """
+        Redraws any of our buttons which are showing one of the given
+        item IDs (used when our item catalog has been reloaded)
+        """
+        for button in self.buttons.values():
+            slot = button.inventoryslot
+            if slot is not None:
+                if slot.num in unique_ids or ('%d~%d' % (slot.num, slot.damage)) in unique_ids:
+                    button.update_graphics(True)
+        self.update_active_button()
+
     def repair_all(self, tools=False, armor=False, weapons=False):
         """
         Repairs all items
         """
         for button in self.buttons.values():
             if button.repair(tools=tools, armor=armor, weapons=weapons):
-                button.update_item()
+                button.update_item(True)
 
     def fill_all(self):
         """
@@ -995,7 +1129,7 @@ class BaseInvTable(gtk.Table):
         """
         for button in self.buttons.values():
             if button.fill():
-                button.update_item()
+                button.update_item(True)
 
     def enchant_all(self):
         """
@@ -1003,7 +1137,7 @@ class BaseInvTable(gtk.Table):
         """
         for button in self.buttons.values():
             if button.enchant_all():
-                button.update_item()
+                button.update_item(True)
 
     def max_ench(self):
         """
@@ -1011,7 +1145,7 @@ class BaseInvTable(gtk.Table):
         """
         for button in self.buttons.values():
             if button.max_ench():
-                button.update_item()
+                button.update_item(True)
 
     def export_nbt(self):
         """
@@ -1032,14 +1166,15 @@ class InvTable(BaseInvTable):
     Table to store our basic inventory info that we know about For Sure
     """
 
+    # Armor slots, and the row of their empty-slot icons in gui.png
+    armor_slots = [(103, 0), (102, 1), (101, 2), (100, 3)]
+
     def __init__(self, items, enchantments, detail, gui_sheet):
         super(InvTable, self).__init__(5, 9, items, enchantments, detail, gui_sheet)
 
         # Armor slots
-        self._new_button(0, 0, 103, 7, empty=gui_sheet.get_tex(0, 0, True))
-        self._new_button(1, 0, 102, 7, empty=gui_sheet.get_tex(0, 1, True))
-        self._new_button(2, 0, 101, 7, empty=gui_sheet.get_tex(0, 2, True))
-        self._new_button(3, 0, 100, 7, empty=gui_sheet.get_tex(0, 3, True))
+        for (slot, icon_y) in self.armor_slots:
+            self._new_button(icon_y, 0, slot, 7, empty=gui_sheet.get_tex(0, icon_y, True))
 
         # Ordinary inventory slots
         for i in range(9):
@@ -1051,6 +1186,17 @@ class InvTable(BaseInvTable):
         # Make sure that all is well here
         self.update_active_button()
 
+    def set_gui_sheet(self, gui_sheet):
+        """
+        Re-points our icons (including the empty armor-slot icons) at a
+        new gui.png TexFile
+        """
+        super(InvTable, self).set_gui_sheet(gui_sheet)
+        for (slot, icon_y) in self.armor_slots:
+            button = self.buttons[slot]
+            button.image.empty = gui_sheet.get_tex(0, icon_y, True)
+            button.update_graphics(True)
+
     def populate_from(self, inventory):
         """
         Populates all of our buttons from the given inventory object.  Returns
@@ -1083,40 +1229,66 @@ class ExtraInvTable(BaseInvTable):
         """
         super(ExtraInvTable, self).__init__(9, 1, items, enchantments, detail, gui_sheet)
 
+        # All the buttons we've got attached, in grid order.  These are
+        # reused from one populate_from() to the next.
+        self.pool = []
+
+    def _pool_button(self, idx):
+        """
+        Creates a new button for the given position in our pool, and
+        attaches it to the grid.  Its slot gets set when it's bound.
+        """
+        button = InvButton(None, self.items, self.enchantments, self.detail)
+        if self.group is None:
+            self.group = button
+        else:
+            button.set_group(self.group)
+        x = idx % self.button_cols
+        y = idx / self.button_cols + 1
+        self.attach(button, x, x+1, y, y+1, gtk.FILL, gtk.FILL)
+        return button
+
     def populate_from(self, items):
         """
         Populates from a list of "extra" items that need to be stored
-        and displayed somewhere.
+        and displayed somewhere.  We keep our buttons around from one
+        call to the next, so only the difference in the number of buttons
+        gets created or destroyed; the rest are just given new slots.
         """
-        
-        # First, totally clear out anything which might be in here
-        # Note that this will leave the Trash icon alone
-        self.clear_buttons()
-        for button in self.buttons.values():
-            self.remove(button)
+
+        # Buttons we keep are about to get new slots, so there's no need
+        # to clear them out first.
         self.buttons = {}
-        self.group = None
 
-        # Start anew!
-        if len(items) > 0:
-            # Figure out how many rows we'll have.
-            rows = len(items)/self.button_cols
-            if (len(items) % self.button_cols) > 0:
-                rows += 1
+        # Get rid of any buttons we don't need anymore.  Note that this
+        # will leave the Trash icon alone
+        while len(self.pool) > len(items):
+            button = self.pool.pop()
+            self.remove(button)
+            button.destroy()
+        if len(self.pool) == 0:
+            self.group = None
+
+        # Figure out how many rows we'll have, and resize in place
+        rows = len(items)/self.button_cols
+        if (len(items) % self.button_cols) > 0:
             rows += 1
-            self.resize(9, rows)
-
-            # And now go and create our bunch of buttons, and load in the
-            # items
-            cur_x = 0
-            cur_y = 1
-            for item in items:
-                self._new_button(cur_x, cur_y, item.slot)
-                self.buttons[item.slot].update_slot(item)
-                cur_x += 1
-                if cur_x == self.button_cols:
-                    cur_x = 0
-                    cur_y += 1
+        rows += 1
+        self.resize(rows, self.button_cols)
+
+        # Create any extra buttons we need
+        for idx in range(len(self.pool), len(items)):
+            self.pool.append(self._pool_button(idx))
+
+        # And now load in the items
+        for (button, item) in zip(self.pool, items):
+            if item.slot in self.buttons:
+                raise Exception("Inventory slot %d already exists" % (item.slot))
+            button.slot = item.slot
+            self.buttons[item.slot] = button
+            button.update_slot(item, True)
+
+        if len(items) > 0:
             self.update_active_button()
 
             # Make sure things are visible
@@ -1127,7 +1299,28 @@ class ItemView(gtk.TreeView):
     TreeView class to actually store all the items
     """
 
-    ( COL_ICON, COL_NAME, COL_OBJ, COL_VISIBLE ) = range(4)
+    ( COL_OBJ, COL_VISIBLE, COL_RANK ) = range(3)
+
+    # Rows only hold on to their item; icons are looked up when a row is
+    # actually drawn, and we keep this many of them around.
+    icon_cache_size = 256
+
+    # Large drag icons are cached as well, though we won't need as many
+    drag_icon_cache_size = 32
+
+    # Filtering is done in the background from the GTK idle loop, so that
+    # typing into the search box never has to wait for the model to catch
+    # up.  Keystrokes are debounced by filter_delay milliseconds, and each
+    # idle call updates rows in batches of filter_batch for up to
+    # filter_budget seconds before handing control back to GTK.
+    filter_delay = 150
+    filter_batch = 64
+    filter_budget = 0.008
+
+    # If a filter pass changes at least this many rows, we detach our
+    # filter and sort models and rebuild them afterwards, rather than
+    # letting each row change ripple through the models and the view.
+    bulk_threshold = 256
 
     def __init__(self, items):
 
@@ -1137,35 +1330,201 @@ class ItemView(gtk.TreeView):
         self.filter_by_group = False
         self.filter_by_text = False
         self.items_visible = True;
-
-        self.model = gtk.ListStore(gtk.gdk.Pixbuf, str, object, bool)
+        self.scale = 1
+        self.filter_delay_id = None
+        self.filter_idle_id = None
+        self.filter_pass = None
+        self.scroll_to_top = False
+
+        self.model = gtk.ListStore(object, bool, int)
+        self.icon_cache = util.LRUCache(self.icon_cache_size)
+        self.drag_icon_cache = util.LRUCache(self.drag_icon_cache_size)
+        self.rows = {}
+        self.ranks = {}
+        self.visible = set()
+        self.index = search.ItemIndex(self.items.get_items())
+        self.query_cache = search.QueryCache(self.index)
         for item in self.items.get_items():
-            iteritem = self.model.append()
-            self.model.set(iteritem,
-                    self.COL_ICON, item.get_pixbuf(),
-                    self.COL_NAME, item.name,
-                    self.COL_OBJ, item,
-                    self.COL_VISIBLE, not item.unknown)
-
-        self.filterobj = self.model.filter_new()
-        self.filterobj.set_visible_column(self.COL_VISIBLE)
+            self._set_row(self.model.append(), item)
 
-        super(ItemView, self).__init__(self.filterobj)
+        super(ItemView, self).__init__()
+        self._attach_models()
 
         self.set_rules_hint(False)
-        self.set_search_column(self.COL_NAME)
+        self.set_search_column(self.COL_OBJ)
+        self.set_search_equal_func(self._search_equal)
         self.set_headers_visible(False)
 
-        column = gtk.TreeViewColumn('Icon', gtk.CellRendererPixbuf(), pixbuf=self.COL_ICON)
-        self.append_column(column)
-
-        column = gtk.TreeViewColumn('Name', gtk.CellRendererText(), text=self.COL_NAME)
-        self.append_column(column)
+        # Our columns are fixed-size so that GTK doesn't have to measure
+        # (and therefore render) every row up front.
+        renderer = gtk.CellRendererPixbuf()
+        self.icon_column = gtk.TreeViewColumn('Icon', renderer)
+        self.icon_column.set_cell_data_func(renderer, self._render_icon)
+        self.icon_column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+        self.append_column(self.icon_column)
+        self._size_icon_column()
+
+        renderer = gtk.CellRendererText()
+        self.name_column = gtk.TreeViewColumn('Name', renderer)
+        self.name_column.set_cell_data_func(renderer, self._render_name)
+        self.name_column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+        self.name_column.set_expand(True)
+        self.append_column(self.name_column)
+        self._size_name_column()
+        self.set_fixed_height_mode(True)
 
         # Set up drag-and-drop
         self.enable_drag_n_drop()
         self.connect('drag_begin', self.drag_begin)
 
+    def _set_row(self, iteritem, item):
+        """
+        Populates the given row of our model with the given item
+        """
+        self.model.set(iteritem,
+                self.COL_OBJ, item,
+                self.COL_VISIBLE, not item.unknown,
+                self.COL_RANK, self.index.key_positions.get(item.unique_id, 0))
+        self.rows[item.unique_id] = iteritem
+        self.ranks[item.unique_id] = self.index.key_positions.get(item.unique_id, 0)
+        if not item.unknown:
+            self.visible.add(item.unique_id)
+
+    def _render_icon(self, column, cell, model, iteritem):
+        """
+        Cell data function for our icon column, which pulls icons from our
+        cache (creating them if need be).
+        """
+        item = model.get_value(iteritem, self.COL_OBJ)
+        if item is None:
+            cell.set_property('pixbuf', None)
+            return
+        pixbuf = self.icon_cache.get(item.unique_id)
+        if pixbuf is None:
+            pixbuf = item.get_pixbuf(self.scale)
+            self.icon_cache.put(item.unique_id, pixbuf)
+        cell.set_property('pixbuf', pixbuf)
+
+    def _get_name(self, item):
+        """
+        Returns the name to show for the given item.  Our fake "Unknown"
+        item shows whichever number it's currently standing in for.
+        """
+        if item.unknown:
+            return 'Unknown Item %d' % (item.num)
+        else:
+            return item.name
+
+    def _render_name(self, column, cell, model, iteritem):
+        """
+        Cell data function for our name column
+        """
+        item = model.get_value(iteritem, self.COL_OBJ)
+        if item is None:
+            cell.set_property('text', '')
+        else:
+            cell.set_property('text', self._get_name(item))
+
+    def _search_equal(self, model, column, key, iteritem):
+        """
+        Interactive search function for our view.  Note that GTK wants
+        this to return False when the row matches.
+        """
+        item = model.get_value(iteritem, self.COL_OBJ)
+        return not self._get_name(item).lower().startswith(key.lower())
+
+    def _size_icon_column(self):
+        """
+        Sets our icon column's width for our current scale factor
+        """
+        renderer = self.icon_column.get_cell_renderers()[0]
+        self.icon_column.set_fixed_width(data.TexFile.size_small*self.scale +
+                2*renderer.get_property('xpad') + 4)
+
+    def set_scale(self, scale):
+        """
+        Switches our icons to a new scale factor.  Cached icons are all
+        dropped, and will be rebuilt at the new size as rows are drawn.
+        """
+        if scale == self.scale:
+            return
+        self.scale = scale
+        self.icon_cache.clear()
+        self.drag_icon_cache.clear()
+        self._size_icon_column()
+        self._size_name_column()
+
+        # Turning fixed-height mode back on makes GTK measure our row
+        # height again
+        self.set_fixed_height_mode(False)
+        self.set_fixed_height_mode(True)
+        self.queue_draw()
+
+    def _size_name_column(self):
+        """
+        Sizes our name column to fit the longest item name.  Rather than
+        measuring every name, we just measure whichever has the most
+        characters, which is close enough.
+        """
+        items = self.items.get_items()
+        if len(items) == 0:
+            return
+        longest = max([item.name for item in items], key=len)
+        (width, height) = self.create_pango_layout(longest).get_pixel_size()
+        self.name_column.set_fixed_width(width + 12)
+
+    def _attach_models(self):
+        """
+        Builds the filter and sort models which sit between our ListStore
+        and the view, and attaches them.  Rows are sorted on their rank,
+        which is just their alphabetical position until there's some
+        search text to rank them against.
+        """
+        self.filterobj = self.model.filter_new()
+        self.filterobj.set_visible_column(self.COL_VISIBLE)
+        self.sortobj = gtk.TreeModelSort(self.filterobj)
+        self.sortobj.set_sort_column_id(self.COL_RANK, gtk.SORT_ASCENDING)
+        self.set_model(self.sortobj)
+
+    def _detach_models(self):
+        """
+        Detaches and drops our filter and sort models, so that changes to
+        our ListStore don't have anything listening to them.
+        """
+        self.set_model(None)
+        self.sortobj = None
+        self.filterobj = None
+
+    def update_items(self, changes):
+        """
+        Updates our model given a data.CatalogChanges object.  Only the
+        rows for items which were actually added, changed, or removed are
+        touched.  Changed items are removed and re-inserted, since their
+        name (and therefore their sort position) may have changed.
+        """
+        for unique_id in changes.get_unique_ids():
+            self.icon_cache.discard(unique_id)
+            self.drag_icon_cache.discard(unique_id)
+        for item in changes.removed + [old for (old, new) in changes.changed]:
+            self.model.remove(self.rows.pop(item.unique_id))
+            del self.ranks[item.unique_id]
+            self.visible.discard(item.unique_id)
+
+        self.index = search.ItemIndex(self.items.get_items())
+        self.query_cache = search.QueryCache(self.index)
+
+        to_insert = changes.added + [new for (old, new) in changes.changed]
+        if len(to_insert) > 0:
+            to_insert.sort()
+            current = [row[self.COL_OBJ] for row in self.model]
+            for item in to_insert:
+                position = bisect.bisect_right(current, item)
+                current.insert(position, item)
+                self._set_row(self.model.insert(position), item)
+
+        self._size_name_column()
+        self.apply_filters()
+
     def enable_drag_n_drop(self):
         """
         Turns drag-and-drop on
@@ -1197,7 +1556,11 @@ class ItemView(gtk.TreeView):
         if item is None:
             self.drag_source_set_icon_stock(gtk.STOCK_DIALOG_ERROR)
         else:
-            self.drag_source_set_icon_pixbuf(util.get_pixbuf_from_surface(item.get_image(True)))
+            pixbuf = self.drag_icon_cache.get(item.unique_id)
+            if pixbuf is None:
+                pixbuf = item.get_image(True, self.scale).get_pixbuf()
+                self.drag_icon_cache.put(item.unique_id, pixbuf)
+            self.drag_source_set_icon_pixbuf(pixbuf)
 
     def filter_text(self, text):
         """
@@ -1209,7 +1572,8 @@ class ItemView(gtk.TreeView):
         else:
             self.filter_by_text = True
             self.text = text.lower()
-        self.apply_filters()
+        self.scroll_to_top = True
+        self.queue_filters(self.filter_delay)
 
     def filter_group(self, group):
         """
@@ -1220,58 +1584,208 @@ class ItemView(gtk.TreeView):
             self.filter_by_group = False
         else:
             self.filter_by_group = True
-        self.apply_filters()
+        self.scroll_to_top = True
+        self.queue_filters()
+
+    def queue_filters(self, delay=0):
+        """
+        Applies our filters in the background, after waiting for the given
+        number of milliseconds.  Any filtering which was already queued up
+        or in progress is cancelled.
+        """
+        self.cancel_filters()
+        if delay > 0:
+            self.filter_delay_id = gobject.timeout_add(delay, self._start_filters)
+        else:
+            self._start_filters()
+
+    def cancel_filters(self):
+        """
+        Cancels any queued or in-progress background filtering.  Rows
+        which have already been updated are left as they are; since we
+        keep track of each row's state as we go, the next pass just picks
+        up from there.
+        """
+        if self.filter_delay_id is not None:
+            gobject.source_remove(self.filter_delay_id)
+            self.filter_delay_id = None
+        if self.filter_idle_id is not None:
+            gobject.source_remove(self.filter_idle_id)
+            self.filter_idle_id = None
+        self.filter_pass = None
+
+    def _start_filters(self):
+        """
+        Kicks off a background filter pass
+        """
+        self.filter_delay_id = None
+        self.filter_pass = self._filter_pass()
+        self.filter_idle_id = gobject.idle_add(self._continue_filters)
+        return False
+
+    def _continue_filters(self):
+        """
+        Idle callback which runs our current filter pass until it either
+        finishes or runs out of time for this go-around.
+        """
+        deadline = time.time() + self.filter_budget
+        for step in self.filter_pass:
+            if time.time() >= deadline:
+                return True
+        self.filter_pass = None
+        self.filter_idle_id = None
+        return False
 
     def apply_filters(self):
         """
-        Applies any active filters that we have.
-        """
-        found_active = False
-        unknown_row = None
-        unknown_item = None
-        for row in self.model:
-            item = row[self.COL_OBJ]
-            if item.unknown:
-                unknown_row = row
-                unknown_item = item
-            if self.filter_by_group:
-                if self.filtergroup not in item.groups:
-                    row[self.COL_VISIBLE] = False
-                    continue
-            if self.filter_by_text:
-                if self.text not in row[self.COL_NAME].lower():
-                    if not self.text.isdigit() or int(self.text) != item.num:
-                        row[self.COL_VISIBLE] = False
-                        continue
-            if item.unknown:
-                row[self.COL_VISIBLE] = False
-            else:
-                row[self.COL_VISIBLE] = True
-                found_active = True
+        Applies any active filters that we have right away, rather than
+        in the background.
+        """
+        self.cancel_filters()
+        for step in self._filter_pass():
+            pass
 
-        if found_active and not self.items_visible:
-            self.items_visible = True
-            self.enable_drag_n_drop()
-        elif not found_active and self.items_visible:
-            if self.filter_by_text and self.text.isdigit():
-                # Substitute our fake "Unknown" item
+    def _filter_pass(self):
+        """
+        Generator which applies any active filters that we have, yielding
+        after every batch of row updates.  Our search index gives us the
+        matching set of items directly, and then only the rows whose
+        visibility has actually changed get touched.  When we're searching
+        by text, visible rows are also re-ordered so that the best matches
+        (including close misspellings) come first.
+        """
+        if self.filter_by_group:
+            matches = self.index.get_group(self.filtergroup)
+        else:
+            matches = self.index.get_all()
+        if self.filter_by_text:
+            ranked = self.query_cache.rank(self.text)
+            matches = matches & set(ranked)
+        else:
+            ranked = []
+        visible = matches - self.index.unknown
+
+        if len(visible) == 0 and self.filter_by_text and self.text.isdigit():
+            # Substitute our fake "Unknown" item
+            for unique_id in self.index.unknown:
                 num = int(self.text)
                 if num > 32767:
                     num = 32767
-                unknown_item.num = num
-                unknown_row[self.COL_NAME] = 'Unknown Item %d' % (num)
-                unknown_row[self.COL_VISIBLE] = True
+                unknown_row = self.rows[unique_id]
+                self.model.get_value(unknown_row, self.COL_OBJ).num = num
+                self.model.row_changed(self.model.get_path(unknown_row), unknown_row)
+                visible = set([unique_id])
+                break
+
+        rank_changes = self._get_rank_changes(visible, ranked)
+        changed = len(rank_changes) + len(visible ^ self.visible)
+        if changed >= self.bulk_threshold:
+            self._bulk_update(visible, rank_changes)
+        else:
+            for step in self._set_ranks(rank_changes):
+                yield step
+            for step in self._set_visible(visible):
+                yield step
+
+        if len(visible) > 0 and not self.items_visible:
+            self.items_visible = True
+            self.enable_drag_n_drop()
+        elif len(visible) == 0 and self.items_visible:
+            self.items_visible = False
+            self.disable_drag_n_drop()
+
+        # New search text or a new group starts back at the top, but only
+        # once the rows actually reflect it; a pass which gets cancelled
+        # leaves this for the next one.
+        if self.scroll_to_top:
+            self.scroll_to_top = False
+            self.get_vadjustment().set_value(0)
+
+    def _get_rank_changes(self, visible, ranked):
+        """
+        Returns a dict of the new sort rank for each of our visible rows
+        whose rank needs to change: ranked items come first, in the given
+        order, followed by everything else alphabetically.  Rows which are
+        hidden keep whatever rank they had, and get fixed up whenever
+        they're shown again.
+        """
+        ranks = {}
+        for (rank, unique_id) in enumerate(ranked):
+            ranks[unique_id] = rank
+        offset = len(ranked)
+        positions = self.index.key_positions
+        changes = {}
+        for unique_id in visible:
+            if unique_id in ranks:
+                rank = ranks[unique_id]
             else:
-                self.items_visible = False
-                self.disable_drag_n_drop()
+                rank = offset + positions.get(unique_id, 0)
+            if self.ranks[unique_id] != rank:
+                changes[unique_id] = rank
+        return changes
+
+    def _set_ranks(self, rank_changes):
+        """
+        Generator which applies the given rank changes to our rows
+        """
+        count = 0
+        for (unique_id, rank) in rank_changes.iteritems():
+            self.model.set_value(self.rows[unique_id], self.COL_RANK, rank)
+            self.ranks[unique_id] = rank
+            count += 1
+            if count % self.filter_batch == 0:
+                yield count
+
+    def _bulk_update(self, visible, rank_changes):
+        """
+        Applies a large set of rank and visibility changes in one go.  The
+        view and its filter and sort models are detached first, so that
+        the row updates don't have anything listening to them, and the
+        models are then rebuilt, which filters and sorts everything at
+        once.  The selected item is reselected afterwards if it's still
+        visible.
+        """
+        selected = self.get_selected_item()
+        self._detach_models()
+        for step in self._set_ranks(rank_changes):
+            pass
+        for step in self._set_visible(visible):
+            pass
+        self._attach_models()
+
+        if selected is not None and selected.unique_id in self.visible:
+            path = self.model.get_path(self.rows[selected.unique_id])
+            path = self.filterobj.convert_child_path_to_path(path)
+            if path is not None:
+                path = self.sortobj.convert_child_path_to_path(path)
+            if path is not None:
+                self.get_selection().select_path(path)
+
+    def _set_visible(self, visible):
+        """
+        Generator which makes exactly the given set of items visible, only
+        updating rows whose visibility changes.  self.visible is kept up
+        to date as we go, in case we're cancelled partway through.
+        """
+        count = 0
+        for unique_id in list(self.visible - visible):
+            self.model.set_value(self.rows[unique_id], self.COL_VISIBLE, False)
+            self.visible.discard(unique_id)
+            count += 1
+            if count % self.filter_batch == 0:
+                yield count
+        for unique_id in list(visible - self.visible):
+            self.model.set_value(self.rows[unique_id], self.COL_VISIBLE, True)
+            self.visible.add(unique_id)
+            count += 1
+            if count % self.filter_batch == 0:
+                yield count
 
 class ItemScroll(gtk.ScrolledWindow):
     """
     Class that holds our list of items to choose from
     """
 
-    ( COL_ICON, COL_NAME ) = range(2)
-
     def __init__(self, items):
         super(ItemScroll, self).__init__()
 
@@ -1286,16 +1800,12 @@ class ItemScroll(gtk.ScrolledWindow):
         Filter our list of items based on the given text
         """
         self.tv.filter_text(text)
-        # TODO: why doesn't this adjustment work?
-        self.get_vadjustment().set_value(0)
 
     def filter_group(self, group):
         """
         Filter our list of items based on the given text
         """
         self.tv.filter_group(group)
-        # TODO: why doesn't this adjustment work?
-        self.get_vadjustment().set_value(0)
 
 class SearchEntry(gtk.Entry):
     """
@@ -1402,12 +1912,28 @@ class ItemSelector(gtk.VBox):
         """
         self.itemscroll.filter_group(group)
 
+    def set_scale(self, scale):
+        """
+        Switches our icons to the given scale factor
+        """
+        self.itemscroll.tv.set_scale(scale)
+        self.grouptable.set_scale(scale)
+
+    def update_catalog(self, changes, groups):
+        """
+        Our item catalog has been reloaded; update our list (and our
+        group buttons, if need be)
+        """
+        self.itemscroll.tv.update_items(changes)
+        if changes.groups_changed:
+            self.grouptable.populate(groups)
+
 class GroupButton(gtk.ToggleButton):
     """
     Class for an individual button in our Group-selection area
     """
 
-    def __init__(self, table, group):
+    def __init__(self, table, group, scale=1):
         super(GroupButton, self).__init__()
         self.set_mode(False)
         self.set_border_width(0)
@@ -1416,10 +1942,16 @@ class GroupButton(gtk.ToggleButton):
         self.group = group
         self.table = table
         self.set_tooltip_text(group.name)
-        image = gtk.image_new_from_pixbuf(group.get_pixbuf())
-        self.add(image)
+        self.image = gtk.image_new_from_pixbuf(group.get_pixbuf(scale))
+        self.add(self.image)
         self.connect('clicked', self.on_clicked)
 
+    def set_scale(self, scale):
+        """
+        Switches our icon to the given scale factor
+        """
+        self.image.set_from_pixbuf(self.group.get_pixbuf(scale))
+
     def on_clicked(self, button):
         """
         Process a click
@@ -1443,14 +1975,32 @@ class GroupTable(gtk.Table):
 
         self.selector = selector
         self.buttons = []
+        self.scale = 1
+
+        # Call out to our parent constructor
+        super(GroupTable, self).__init__(1, self.cols)
+
+        # Populate
+        self.populate(groups)
+
+    def populate(self, groups):
+        """
+        (Re)creates our buttons from the given list of groups.  If a group
+        was selected, and a group with the same name is still around, it
+        stays selected.
+        """
+        active_name = None
+        for button in self.buttons:
+            if button.get_active():
+                active_name = button.group.name
+            self.remove(button)
+        self.buttons = []
 
         # Figure out how many rows we're going to use
         self.rows = len(groups) / self.cols
         if len(groups) % self.cols > 0:
             self.rows += 1
-
-        # Call out to our parent constructor
-        super(GroupTable, self).__init__(self.rows, self.cols)
+        self.resize(max(self.rows, 1), self.cols)
 
         # Populate
         cur_row = 0
@@ -1461,15 +2011,35 @@ class GroupTable(gtk.Table):
             if cur_col == self.cols:
                 cur_col = 0
                 cur_row += 1
+        self.show_all()
+
+        # Re-apply our selection, if we had one
+        if active_name is not None:
+            for button in self.buttons:
+                if button.group.name == active_name:
+                    button.set_active(True)
+                    break
+            else:
+                self.notify_unclicked()
 
     def _new_button(self, group):
         """
         Creates a new button
         """
-        button = GroupButton(self, group)
+        button = GroupButton(self, group, self.scale)
         self.buttons.append(button)
         return button
 
+    def set_scale(self, scale):
+        """
+        Switches all our buttons to the given scale factor
+        """
+        if scale == self.scale:
+            return
+        self.scale = scale
+        for button in self.buttons:
+            button.set_scale(scale)
+
     def notify_clicked(self, clickedbutton):
         """
         Called by a button when it's clicked on.  This emulates the behavior
@@ -1533,6 +2103,7 @@ class InvExtra(gtk.VBox):
         super(InvExtra, self).__init__()
         self.app = app
         self.varcache = {}
+        self.timebuttons = []
         self.populating = True
 
         # Player Attributes
@@ -1599,10 +2170,10 @@ class InvExtra(gtk.VBox):
         hbox = gtk.HBox()
         align.add(hbox)
         timehbox.pack_start(align, False, True)
-        self._timebutton(hbox, gui_sheet.get_pixbuf(2, 0), 0, 'Daytime')
-        self._timebutton(hbox, gui_sheet.get_pixbuf(3, 0), 12000, 'Sunset')
-        self._timebutton(hbox, gui_sheet.get_pixbuf(4, 0), 13800, 'Nighttime')
-        self._timebutton(hbox, gui_sheet.get_pixbuf(5, 0), 22200, 'Sunrise')
+        self._timebutton(hbox, gui_sheet, 2, 0, 'Daytime')
+        self._timebutton(hbox, gui_sheet, 3, 12000, 'Sunset')
+        self._timebutton(hbox, gui_sheet, 4, 13800, 'Nighttime')
+        self._timebutton(hbox, gui_sheet, 5, 22200, 'Sunrise')
 
         # Structures
         cur_row += 1
@@ -1779,18 +2350,27 @@ class InvExtra(gtk.VBox):
         time_widget = self._getcache('Time', 'input')
         time_widget.set_value(time)
 
-    def _timebutton(self, box, pixbuf, time, text):
+    def _timebutton(self, box, gui_sheet, icon_x, time, text):
         """
-        Sets up a time-preset button, to alter our time.
+        Sets up a time-preset button, to alter our time.  Its icon comes
+        from column icon_x of the top row of gui.png.
         """
         align = gtk.Alignment(0, 0, 0, 0)
         align.set_padding(0, 0, 2, 0)
         button = gtk.Button()
-        button.set_image(gtk.image_new_from_pixbuf(pixbuf))
+        button.set_image(gtk.image_new_from_pixbuf(gui_sheet.get_pixbuf(icon_x, 0)))
         button.set_tooltip_text('Set time to %s' % (text))
         button.connect('clicked', self.set_time, time)
         align.add(button)
         box.pack_start(align, False, True)
+        self.timebuttons.append((button, icon_x))
+
+    def set_gui_sheet(self, gui_sheet):
+        """
+        Re-points our time-preset icons at a new gui.png TexFile
+        """
+        for (button, icon_x) in self.timebuttons:
+            button.set_image(gtk.image_new_from_pixbuf(gui_sheet.get_pixbuf(icon_x, 0)))
 
     def handle_time_data_set(self, widget, data):
         """
@@ -1923,84 +2503,184 @@ class InvNotebook(gtk.Notebook):
         worldvbox.pack_start(sw, True, True)
         self.append_page(worldvbox, gtk.Label('Inventory'))
 
-        # Second page: overflow items we don't support directly
-        align = gtk.Alignment(0, 0, 1, 1)
-        align.set_padding(5, 5, 110, 110)
-        itemdetails2 = InvDetails(app, items, enchantments)
-        align.add(itemdetails2)
-        sw = gtk.ScrolledWindow()
-        sw.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
-        sw.add_with_viewport(align)
-        self.extrainvtable = ExtraInvTable(items, enchantments, itemdetails2, texfiles['gui.png'])
-        worldvbox = gtk.VBox()
-        worldvbox.pack_start(self.extrainvtable, False, True)
-        worldvbox.pack_start(gtk.HSeparator(), False, True)
-        worldvbox.pack_start(sw, True, True)
-        self.append_page(worldvbox, gtk.Label('Extra Slots'))
-
-        # Third: extra information also in the level file
-        align = gtk.Alignment(0, 0, 1, 1)
-        align.set_padding(5, 5, 5, 5)
-        self.extradetails = InvExtra(app, texfiles['gui.png'])
-        align.add(self.extradetails)
+        # The other two pages (overflow items we don't support directly,
+        # and extra information from the level file) aren't needed by most
+        # sessions, so they start out as empty placeholders and are only
+        # built the first time they're shown, or their data is needed.
+        # Until then, whatever they'd be populated from is held on to.
+        self.items = items
+        self.enchantments = enchantments
+        self.gui_sheet = texfiles['gui.png']
+        self.extrainvtable = None
+        self.extradetails = None
+        self.pending_extra_items = []
+        self.pending_extra_nbt = None
+
+        self.extra_page = gtk.VBox()
+        self.append_page(self.extra_page, gtk.Label('Extra Slots'))
         self.extradetails_sw = gtk.ScrolledWindow()
         self.extradetails_sw.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
-        self.extradetails_sw.add_with_viewport(align)
         self.append_page(self.extradetails_sw, gtk.Label('Other Information'))
 
+        self.connect('switch-page', self.on_switch_page)
+
+    def on_switch_page(self, notebook, page, page_num):
+        """
+        Builds our deferred pages when they're first switched to
+        """
+        if page_num == 1:
+            self.get_extrainvtable()
+        elif page_num == 2:
+            self.get_extradetails()
+
+    def get_extrainvtable(self):
+        """
+        Returns our ExtraInvTable, building its page (and populating it
+        from any staged items) if that hasn't happened yet
+        """
+        if self.extrainvtable is None:
+            align = gtk.Alignment(0, 0, 1, 1)
+            align.set_padding(5, 5, 110, 110)
+            itemdetails2 = InvDetails(self.app, self.items, self.enchantments)
+            align.add(itemdetails2)
+            sw = gtk.ScrolledWindow()
+            sw.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
+            sw.add_with_viewport(align)
+            self.extrainvtable = ExtraInvTable(self.items, self.enchantments, itemdetails2, self.gui_sheet)
+            self.extra_page.pack_start(self.extrainvtable, False, True)
+            self.extra_page.pack_start(gtk.HSeparator(), False, True)
+            self.extra_page.pack_start(sw, True, True)
+            self.extra_page.show_all()
+            self.extrainvtable.populate_from(self.pending_extra_items)
+            self.pending_extra_items = []
+        return self.extrainvtable
+
+    def get_extradetails(self):
+        """
+        Returns our InvExtra, building its page (and populating it from
+        any staged data) if that hasn't happened yet
+        """
+        if self.extradetails is None:
+            align = gtk.Alignment(0, 0, 1, 1)
+            align.set_padding(5, 5, 5, 5)
+            self.extradetails = InvExtra(self.app, self.gui_sheet)
+            align.add(self.extradetails)
+            self.extradetails_sw.add_with_viewport(align)
+            self.extradetails_sw.get_child().show_all()
+            if self.pending_extra_nbt is not None:
+                self.extradetails.populate_from(self.pending_extra_nbt)
+                self.pending_extra_nbt = None
+        return self.extradetails
+
     def populate_from(self, inventory, nbt=None):
         """
-        Populates from the given inventory set.
+        Populates from the given inventory set.  Pages which haven't been
+        built yet just hang on to their data for later.
         """
         extra_items = self.invtable.populate_from(inventory)
-        self.extrainvtable.populate_from(extra_items)
+        if self.extrainvtable is None:
+            self.pending_extra_items = extra_items
+        else:
+            self.extrainvtable.populate_from(extra_items)
         if self.app.multiplayer:
             self.extradetails_sw.hide()
         else:
             self.extradetails_sw.show()
             if nbt:
-                self.extradetails.populate_from(nbt['Data'])
+                if self.extradetails is None:
+                    self.pending_extra_nbt = nbt['Data']
+                else:
+                    self.extradetails.populate_from(nbt['Data'])
+
+    def get_extra_count(self):
+        """
+        Returns how many extra slots we have, whether or not their page
+        has been built
+        """
+        if self.extrainvtable is None:
+            return len(self.pending_extra_items)
+        else:
+            return len(self.extrainvtable.buttons)
 
     def export_inv_nbt(self):
         """
         Exports our inventory data as a fresh NBT file
         """
-        return self.invtable.export_nbt() + self.extrainvtable.export_nbt()
+        if self.extrainvtable is None:
+            extra = [slot.export_nbt() for slot in sorted(self.pending_extra_items)]
+        else:
+            extra = self.extrainvtable.export_nbt()
+        return self.invtable.export_nbt() + extra
 
     def save_extra_nbt_changes(self, nbt):
         """
-        Saves any extra changes we might have made to our "other" vars
+        Saves any extra changes we might have made to our "other" vars.
+        If that page was never built, there's nothing to save.
         """
-        if not self.app.multiplayer:
+        if not self.app.multiplayer and self.extradetails is not None:
             self.extradetails.save_to(nbt['Data'])
 
+    def refresh_items(self, unique_ids):
+        """
+        Redraws any slots showing one of the given item IDs
+        """
+        self.invtable.refresh_items(unique_ids)
+        if self.extrainvtable is not None:
+            self.extrainvtable.refresh_items(unique_ids)
+
     def repair_all(self, tools=False, armor=False, weapons=False):
         """
         Repairs all items contained in the book
         """
         self.invtable.repair_all(tools=tools, armor=armor, weapons=weapons)
-        self.extrainvtable.repair_all(tools=tools, armor=armor, weapons=weapons)
+        if self.get_extra_count() > 0:
+            self.get_extrainvtable().repair_all(tools=tools, armor=armor, weapons=weapons)
 
     def fill_all(self):
         """
         Fills all items contained in the book to their maximum capacity
         """
         self.invtable.fill_all()
-        self.extrainvtable.fill_all()
+        if self.get_extra_count() > 0:
+            self.get_extrainvtable().fill_all()
 
     def enchant_all(self):
         """
         Enchants all items with all applicable enchantments
         """
         self.invtable.enchant_all()
-        self.extrainvtable.enchant_all()
+        if self.get_extra_count() > 0:
+            self.get_extrainvtable().enchant_all()
 
     def max_ench(self):
         """
         Brings all existing enchantments up to their maximum values
         """
         self.invtable.max_ench()
-        self.extrainvtable.max_ench()
+        if self.get_extra_count() > 0:
+            self.get_extrainvtable().max_ench()
+
+    def set_gui_sheet(self, gui_sheet):
+        """
+        Switches to a new gui.png TexFile (after it's been reloaded from
+        disk).  Pages which haven't been built yet will use the new one
+        when they are.
+        """
+        self.gui_sheet = gui_sheet
+        self.invtable.set_gui_sheet(gui_sheet)
+        if self.extrainvtable is not None:
+            self.extrainvtable.set_gui_sheet(gui_sheet)
+        if self.extradetails is not None:
+            self.extradetails.set_gui_sheet(gui_sheet)
+
+    def rescale(self):
+        """
+        Resizes our inventory slots for a new scale factor.  An unbuilt
+        Extra Slots page will pick up the new scale when it's built.
+        """
+        self.invtable.rescale()
+        if self.extrainvtable is not None:
+            self.extrainvtable.rescale()
 
     def update_tabs(self):
         """
@@ -2015,11 +2695,83 @@ class InvNotebook(gtk.Notebook):
             else:
                 title = 'Inventory'
         self.set_tab_label(self.get_nth_page(0), gtk.Label(title))
-        if (len(self.extrainvtable.buttons) > 0):
+        if self.get_extra_count() > 0:
             self.get_nth_page(1).show()
         else:
             self.get_nth_page(1).hide()
 
+class StatusArea(gtk.HBox):
+    """
+    A strip along the bottom of our main window, for reporting on things
+    which are happening in the background (loading files, for instance),
+    without getting in the user's way.  Shows a message, and optionally a
+    progress bar and Cancel button.
+    """
+
+    def __init__(self):
+        super(StatusArea, self).__init__()
+        self.set_spacing(5)
+        self.set_border_width(2)
+        self.cancel_callback = None
+
+        self.label = gtk.Label()
+        self.label.set_alignment(0, .5)
+        self.label.set_ellipsize(pango.ELLIPSIZE_MIDDLE)
+        self.pack_start(self.label, True, True)
+
+        self.progress = gtk.ProgressBar()
+        self.progress.set_pulse_step(.1)
+        self.pack_start(self.progress, False, False)
+
+        self.cancel = gtk.Button(stock=gtk.STOCK_CANCEL)
+        self.cancel.set_relief(gtk.RELIEF_NONE)
+        self.cancel.connect('clicked', self.on_cancel)
+        self.pack_start(self.cancel, False, False)
+
+        for widget in [self.progress, self.cancel]:
+            widget.set_no_show_all(True)
+
+    def start(self, markup, cancel_callback=None, progress=True):
+        """
+        Shows a new task with the given message, and a Cancel button if
+        we were given a callback for it.  If progress is False, there's
+        no progress to report, so we won't show the progress bar.
+        """
+        self.label.set_markup(markup)
+        self.progress.set_fraction(0)
+        self.progress.set_text('')
+        self.progress.set_visible(progress)
+        self.cancel_callback = cancel_callback
+        self.cancel.set_visible(cancel_callback is not None)
+
+    def set_progress(self, text, fraction=None):
+        """
+        Updates our progress bar.  If fraction is None, we don't know how
+        far along we are, so the bar just pulses.
+        """
+        self.progress.set_text(text)
+        if fraction is None:
+            self.progress.pulse()
+        else:
+            self.progress.set_fraction(min(fraction, 1))
+
+    def finish(self, markup=''):
+        """
+        Hides our progress bar and Cancel button, leaving the given
+        message behind
+        """
+        self.label.set_markup(markup)
+        self.progress.hide()
+        self.cancel.hide()
+        self.cancel_callback = None
+
+    def on_cancel(self, widget, data=None):
+        """
+        Our Cancel button has been clicked
+        """
+        if self.cancel_callback is not None:
+            self.cancel_callback()
+
 class PyInvEdit(gtk.Window):
     """
     Main PyInvedit class
@@ -2035,8 +2787,10 @@ class PyInvEdit(gtk.Window):
         # Load our YAML
         self.load_from_yaml()
 
-        # Figure out what single-player worlds we have available
-        avail_worlds = self.get_avail_worlds()
+        # Figure out our display's scale factor before creating any of our
+        # inventory slots, so they start out at the right size
+        InvImage.set_scale(util.get_scale_factor(self.get_screen()),
+                util.get_font_resolution(self.get_screen()))
 
         # The main VBox
         self.mainvbox = gtk.VBox()
@@ -2068,17 +2822,33 @@ class PyInvEdit(gtk.Window):
         self.itembox = ItemSelector(self.items, self.groups.values())
         mainhbox.add(self.itembox)
 
+        # Status for things happening in the background
+        self.statusarea = StatusArea()
+        self.mainvbox.pack_start(self.statusarea, False, False)
+
+        # Bring our item list up to the same scale
+        self.itembox.set_scale(InvImage.scale)
+
         # Make sure everything's shown
         self.show_all()
 
         # ... but really don't actually show the main world notebook
         self.worldbook.hide()
 
-        # Populate our world submenus (and potentially hide, if we
-        # couldn't find any)
-        self.populate_world_submenu(self.menu_openfrom, self.load_known, avail_worlds)
-        self.populate_world_submenu(self.menu_importfrom, self.import_known, avail_worlds)
-        self.populate_world_submenu(self.menu_saveto, self.save_known, avail_worlds)
+        # Our world submenus start out hidden, and are filled in as we
+        # find out what single-player worlds we have available, which
+        # happens in the background
+        self.world_menus = [
+                (self.menu_openfrom, self.load_known),
+                (self.menu_importfrom, self.import_known),
+                (self.menu_saveto, self.save_known),
+            ]
+        self.world_menu_items = {}
+        for (menu, func) in self.world_menus:
+            self.world_menu_items[menu] = ([], {})
+            menu.set_visible(False)
+        self.world_index = worlds.WorldIndex(mclevelbase.saveFileDir, self.worlds_changed,
+                util.get_cache_path('worlds.yaml'))
 
         # Temporarily disable some menus which should only be active
         # when we've loaded a file
@@ -2095,6 +2865,35 @@ class PyInvEdit(gtk.Window):
         self.filename = None
         self.inventory = None
         self.loaded = False
+        self.load_job = None
+        self.save_queue = fileio.SaveQueue()
+
+        # Pick up changes to our item data while we're running
+        self.catalog_error = False
+        self.catalog_watcher = watcher.FileWatcher(self.catalog.get_watch_paths(),
+                self.catalog_changed)
+
+        # And changes to our scale factor: either the DPI setting changing,
+        # or being moved to a different screen
+        gtk.settings_get_default().connect('notify::gtk-xft-dpi', self.update_scale)
+        self.connect('screen-changed', self.update_scale)
+
+    def update_scale(self, widget=None, data=None):
+        """
+        Checks our display's scale factor, and if it's changed, resizes
+        everything which draws at device resolution.  Slot images and
+        icons are all thrown away and re-rendered at the new size the next
+        time they're drawn, rather than being scaled on every expose.  A
+        DPI change which doesn't change our scale factor still changes the
+        size of the text on our slots, so they're redrawn for that too.
+        """
+        scale = util.get_scale_factor(self.get_screen())
+        resolution = util.get_font_resolution(self.get_screen())
+        if scale == InvImage.scale and resolution == InvImage.resolution:
+            return
+        InvImage.set_scale(scale, resolution)
+        self.worldbook.rescale()
+        self.itembox.set_scale(scale)
 
     def about(self, widget, data=None):
         """
@@ -2189,38 +2988,41 @@ class PyInvEdit(gtk.Window):
         # Return
         return menu
 
-    def get_avail_worlds(self):
-        """
-        Returns a dict of available singleplayer worlds that we could find on
-        this machine.  The key will be the name of the dir, the value will
-        be the full path
-        """
-        worlds = {}
-        savesdir = mclevelbase.saveFileDir
-        if os.path.exists(savesdir):
-            for dirent in os.listdir(savesdir):
-                dirent_path = os.path.join(savesdir, dirent)
-                if os.path.isdir(dirent_path):
-                    test_path = os.path.join(dirent_path, 'level.dat')
-                    if os.path.exists(test_path):
-                        worlds[dirent] = test_path
-        return worlds
-
-    def populate_world_submenu(self, menu, func, worlds):
-        """
-        Given a dict of worlds, populate a submenu
-        """
-        if len(worlds) > 0:
-            worldnames = worlds.keys()
-            worldnames.sort()
-            sub = menu.get_submenu()
-            for name in worldnames:
-                item = gtk.MenuItem(name)
-                item.connect('activate', func, name, worlds[name])
-                sub.append(item)
-            menu.show_all()
-        else:
-            menu.set_visible(False)
+    def worlds_changed(self, added, removed):
+        """
+        Called by our WorldIndex when worlds have been added or removed
+        """
+        for (menu, func) in self.world_menus:
+            self.populate_world_submenu(menu, func, added, removed)
+
+    def populate_world_submenu(self, menu, func, worlds, removed=()):
+        """
+        Given a dict of worlds.WorldInfo objects, add them to a submenu
+        (replacing any existing items with the same name), and remove any
+        worlds named in removed.  Items are labelled with the world's
+        name and details, and kept sorted by that label (and then by
+        directory name, for worlds which share one).  The submenu is
+        hidden if it ends up empty.
+        """
+        (keys, items) = self.world_menu_items[menu]
+        sub = menu.get_submenu()
+        for name in set(removed) | set(worlds.keys()):
+            if name in items:
+                (key, item) = items.pop(name)
+                item.destroy()
+                del keys[bisect.bisect_left(keys, key)]
+        for (name, info) in worlds.items():
+            label = info.get_label()
+            key = (label.lower(), name)
+            item = gtk.MenuItem(label, use_underline=False)
+            item.set_tooltip_text(info.path)
+            item.connect('activate', func, name, info.path)
+            position = bisect.bisect_left(keys, key)
+            keys.insert(position, key)
+            items[name] = (key, item)
+            sub.insert(item, position)
+            item.show()
+        menu.set_visible(len(items) > 0)
 
     def run(self):
         """
@@ -2250,6 +3052,12 @@ class PyInvEdit(gtk.Window):
         Proces our Quit action
         """
         if self.confirm_replace('quit'):
+            if self.save_queue.has_pending():
+                # Don't cut off a save which is still being written
+                self.statusarea.start('Finishing save...', progress=False)
+                while gtk.events_pending():
+                    gtk.main_iteration(False)
+                self.save_queue.wait()
             gtk.main_quit()
             return False
         return True
@@ -2259,7 +3067,8 @@ class PyInvEdit(gtk.Window):
         Load a savefile from our known singleplayer maps
         """
         if self.confirm_replace('load'):
-            self.load_from_filename(path)
+            self.load_in_background(path, lambda leveldat:
+                    self.load_from_filename(path, leveldat=leveldat), 'load')
 
     def load(self, widget, data=None):
         """
@@ -2270,80 +3079,156 @@ class PyInvEdit(gtk.Window):
             filename = dialog.load()
             dialog.destroy()
             if filename is not None:
-                self.load_from_filename(filename)
+                self.load_in_background(filename, lambda leveldat:
+                        self.load_from_filename(filename, leveldat=leveldat), 'load')
+
+    def load_in_background(self, path, callback, action=None):
+        """
+        Starts loading the given path on a worker thread, with progress
+        shown in our status area.  Once it's loaded (and checked over by
+        _check_leveldat()), callback is called from the main loop with the
+        loaded NBT data.  Any load which is already in progress is
+        cancelled first, and if there's an error, or the user cancels,
+        callback is never called.
+
+        The editor stays usable while we're loading.  If callback is going
+        to throw away what's being edited, pass the action (as for
+        confirm_replace()), and if anything gets changed before the load
+        finishes, we'll check with the user again before calling it.
+        """
+        self.cancel_load()
+        self.statusarea.start('Loading <tt>%s</tt>' % (gobject.markup_escape_text(path)),
+                self.cancel_load)
+        change_count = util.undo.get_change_count()
+        self.load_job = fileio.LoadJob(path, self.load_progress,
+                lambda job, leveldat, exception:
+                    self.load_done(job, path, leveldat, exception, callback,
+                        action, change_count))
+        self.load_job.start()
+
+    def cancel_load(self):
+        """
+        Cancels our background load, if we have one going
+        """
+        if self.load_job is not None:
+            self.load_job.cancel()
+            self.load_job = None
+            self.statusarea.finish('Loading cancelled')
+
+    def load_progress(self, job, phase, fraction):
+        """
+        Progress report from our background load
+        """
+        if job is self.load_job:
+            self.statusarea.set_progress(phase, fraction)
+
+    def load_done(self, job, path, leveldat, exception, callback, action, change_count):
+        """
+        Our background load has finished
+        """
+        if job is not self.load_job:
+            return
+        self.load_job = None
+        self.statusarea.finish()
+        if exception is not None:
+            self._load_error(path, exception)
+            return
+        if (action is not None and util.undo.get_change_count() != change_count and
+                not self.confirm_replace(action)):
+            self.statusarea.finish('Loading cancelled')
+            return
+        leveldat = self._check_leveldat(leveldat)
+        if leveldat is not None:
+            callback(leveldat)
+
+    def _load_error(self, path, exception):
+        """
+        Tells the user about an error loading the given path
+        """
+        dialog = dialogs.ExceptionDialog(self,
+                'Error Loading File',
+                "There was an error loading the file:\n<tt>%s</tt>" % (path),
+                exception)
+        dialog.run()
+        dialog.destroy()
 
     def _load_from_filename(self, path):
         """
         Loads our NBT data from the given path and returns it, or None
         if there was an error.  Will throw a dialog for the user if there
-        was an error.  Also sets the var self.last_load_multiplayer as a
-        boolean, if what we loaded was a multiplayer server's player.dat
-        file, as opposed to the singleplayer level.dat (the inventory
-        location is different in those)
+        was an error.  This blocks until the load is done; most things
+        should be using load_in_background() instead.
         """
         try:
             leveldat = nbt.load(path)
+        except Exception, e:
+            self._load_error(path, e)
+            return None
+        return self._check_leveldat(leveldat)
 
-            # Doublecheck
-            if leveldat is None:
-                dialog = gtk.MessageDialog(self,
-                        gtk.DIALOG_MODAL|gtk.DIALOG_DESTROY_WITH_PARENT,
-                        gtk.MESSAGE_ERROR,
-                        gtk.BUTTONS_OK)
-                dialog.set_title('No Data Loaded')
-                dialog.set_markup('No data could be loaded from the specified file!')
-                dialog.run()
-                dialog.destroy()
-                return None
-
-            # More double-checking
-            correct_tags = False
-            try:
-                if 'Data' in leveldat:
-                    if 'Player' in leveldat['Data']:
-                        if 'Inventory' in leveldat['Data']['Player']:
-                            self.last_load_multiplayer = False
-                            correct_tags = True
-                elif 'Inventory' in leveldat:
-                    self.last_load_multiplayer = True
-                    correct_tags = True
-            except Exception:
-                pass
-
-            if not correct_tags:
-                dialog = gtk.MessageDialog(self,
-                        gtk.DIALOG_MODAL|gtk.DIALOG_DESTROY_WITH_PARENT,
-                        gtk.MESSAGE_ERROR,
-                        gtk.BUTTONS_OK)
-                dialog.set_title('Not a valid Minecraft level.dat')
-                dialog.set_markup('The file chosen was a valid NBT file, but did not contain Minecraft inventory data')
-                dialog.run()
-                dialog.destroy()
-                return None
-
-            return leveldat
+    def _check_leveldat(self, leveldat):
+        """
+        Checks over some freshly-loaded NBT data, and returns it if it's
+        got inventory data in it.  Otherwise returns None, after throwing
+        a dialog for the user.  Also sets the var self.last_load_multiplayer
+        as a boolean, if what we loaded was a multiplayer server's
+        player.dat file, as opposed to the singleplayer level.dat (the
+        inventory location is different in those)
+        """
+        # Doublecheck
+        if leveldat is None:
+            dialog = gtk.MessageDialog(self,
+                    gtk.DIALOG_MODAL|gtk.DIALOG_DESTROY_WITH_PARENT,
+                    gtk.MESSAGE_ERROR,
+                    gtk.BUTTONS_OK)
+            dialog.set_title('No Data Loaded')
+            dialog.set_markup('No data could be loaded from the specified file!')
+            dialog.run()
+            dialog.destroy()
+            return None
 
-        except Exception, e:
-            dialog = dialogs.ExceptionDialog(self,
-                    'Error Loading File',
-                    "There was an error loading the file:\n<tt>%s</tt>" % (filename),
-                    e)
+        # More double-checking
+        correct_tags = False
+        try:
+            if 'Data' in leveldat:
+                if 'Player' in leveldat['Data']:
+                    if 'Inventory' in leveldat['Data']['Player']:
+                        self.last_load_multiplayer = False
+                        correct_tags = True
+            elif 'Inventory' in leveldat:
+                self.last_load_multiplayer = True
+                correct_tags = True
+        except Exception:
+            pass
+
+        if not correct_tags:
+            dialog = gtk.MessageDialog(self,
+                    gtk.DIALOG_MODAL|gtk.DIALOG_DESTROY_WITH_PARENT,
+                    gtk.MESSAGE_ERROR,
+                    gtk.BUTTONS_OK)
+            dialog.set_title('Not a valid Minecraft level.dat')
+            dialog.set_markup('The file chosen was a valid NBT file, but did not contain Minecraft inventory data')
             dialog.run()
             dialog.destroy()
             return None
 
-    def load_from_filename(self, path, load_inventory=True):
+        return leveldat
+
+    def load_from_filename(self, path, load_inventory=True, leveldat=None):
         """
         Loads a level given a filename.  Returns True or False depending
         on if we were successful, though I don't think anything actually
         checks it (or really needs to, given that we throw a dialog in
-        here if there were problems).
+        here if there were problems).  If leveldat is passed in (from
+        load_in_background(), say), we use that rather than loading it
+        ourselves.
         """
 
-        # First, do the actual load
-        leveldat = self._load_from_filename(path)
+        # First, do the actual load, if it hasn't already been done
         if leveldat is None:
-            return False
+            leveldat = self._load_from_filename(path)
+            if leveldat is None:
+                return False
 
         # Store our values
         self.filename = path
@@ -2394,23 +3279,28 @@ class PyInvEdit(gtk.Window):
         etc).
         """
         if self.loaded:
-            leveldat = self._load_from_filename(path)
-            if leveldat is None:
-                return
-            if self.last_load_multiplayer:
-                self.inventory = minecraft.Inventory(leveldat['Inventory'])
-            else:
-                self.inventory = minecraft.Inventory(leveldat['Data']['Player']['Inventory'])
-            self.worldbook.populate_from(self.inventory)
-            util.undo.change()
-            return
+            self.load_in_background(path, self.import_from_leveldat, 'import')
+
+    def import_from_leveldat(self, leveldat):
+        """
+        Overwrites our inventory with the one from the given (freshly
+        loaded) NBT data
+        """
+        if self.last_load_multiplayer:
+            self.inventory = minecraft.Inventory(leveldat['Inventory'])
+        else:
+            self.inventory = minecraft.Inventory(leveldat['Data']['Player']['Inventory'])
+        self.worldbook.populate_from(self.inventory)
+        util.undo.change()
 
     def revert(self, widget, data=None):
         """
         Reverts to the data on disk
         """
         if self.loaded and self.confirm_replace('revert'):
-            self.load_from_filename(self.filename)
+            path = self.filename
+            self.load_in_background(path, lambda leveldat:
+                    self.load_from_filename(path, leveldat=leveldat), 'revert')
 
     def save_as(self, widget, data=None):
         """
@@ -2423,11 +3313,7 @@ class PyInvEdit(gtk.Window):
             overwrite_all = dialog.is_overwrite_all()
             dialog.destroy()
             if resp == gtk.RESPONSE_OK:
-                self.filename = filename
-                if os.path.exists(filename) and not overwrite_all:
-                    # Load everything but the inventory
-                    self.load_from_filename(path, False)
-                self.save()
+                self.save_to(filename, overwrite_all)
 
     def save_known(self, widget, name, path):
         """
@@ -2439,35 +3325,62 @@ class PyInvEdit(gtk.Window):
             overwrite_all = dialog.is_overwrite_all()
             dialog.destroy()
             if result == gtk.RESPONSE_YES:
-                self.filename = path
-                if os.path.exists(path) and not overwrite_all:
-                    # Load everything but the inventory
-                    self.load_from_filename(path, False)
+                self.save_to(path, overwrite_all)
+
+    def save_to(self, path, overwrite_all):
+        """
+        Saves to a new path.  If there's already a file there, and we're
+        not overwriting all of it, everything but the inventory is loaded
+        in from that file first (in the background), and we save once
+        that's done.
+        """
+        if os.path.exists(path) and not overwrite_all:
+            def loaded(leveldat):
+                self.load_from_filename(path, False, leveldat)
                 self.save()
+            self.load_in_background(path, loaded)
+        else:
+            self.filename = path
+            self.save()
 
     def save(self, widget=None, data=None):
         """
         Save our data
         """
         if self.loaded:
+            # The actual writing happens in the background, and the worker
+            # reads our NBT data until it's done.  If an earlier save is
+            # still working on it, make our changes to a copy instead.
+            if self.save_queue.is_pending(self.leveldat):
+                self.leveldat = copy.deepcopy(self.leveldat)
+
             if self.multiplayer:
                 self.leveldat['Inventory'].value = self.worldbook.export_inv_nbt()
             else:
                 self.leveldat['Data']['Player']['Inventory'].value = self.worldbook.export_inv_nbt()
                 self.worldbook.save_extra_nbt_changes(self.leveldat)
-            self.leveldat.saveGzipped(self.filename)
-            dialog = gtk.MessageDialog(self,
-                    gtk.DIALOG_MODAL|gtk.DIALOG_DESTROY_WITH_PARENT,
-                    gtk.MESSAGE_INFO,
-                    gtk.BUTTONS_OK)
-            dialog.set_title('Saved')
-            dialog.set_markup("This savefile has been saved to:\n<tt>%s</tt>" % (self.filename))
-            dialog.run()
-            dialog.destroy()
+            self.save_queue.save(self.leveldat, self.filename, self.save_done)
+            self.statusarea.start('Saving to <tt>%s</tt>...' %
+                    (gobject.markup_escape_text(self.filename)), progress=False)
 
-            # Update our Undo object
+            # Update our Undo object.  Anything changed from here on
+            # isn't part of this save.
             util.undo.save()
 
+    def save_done(self, job, exception):
+        """
+        A background save has finished
+        """
+        path = gobject.markup_escape_text(job.path)
+        if exception is None:
+            if not self.save_queue.has_pending():
+                self.statusarea.finish('Saved to <tt>%s</tt> at %s' %
+                        (path, time.strftime('%H:%M:%S')))
+        else:
+            util.undo.change()
+            self.statusarea.finish('<span foreground="red"><b>Error saving to <tt>%s</tt>:</b> %s</span>' %
+                    (path, gobject.markup_escape_text(str(exception))))
+
     def repair_all(self, widget, data=None):
         """
         Repairs all items
@@ -2521,55 +3434,50 @@ class PyInvEdit(gtk.Window):
 
     def load_from_yaml(self):
         """
-        Loads all of our relevant objects from the given YAML filename.
-
-        Really we should be clever and hook into PyYAML's functions
-        for handling the loading-into-objects directly, but frankly I
-        don't want to take the time to do it.  :)
+        Loads all of our relevant objects from our YAML file.  The actual
+        work is done by data.Catalog, which also knows how to reload itself
+        if the file changes while we're running.
         """
+        self.catalog = data.Catalog(util.get_datafile_path('pyinvedit.yaml', 'data'))
+        self.catalog.load()
+        self.texfiles = self.catalog.texfiles
+        self.groups = self.catalog.groups
+        self.enchantments = self.catalog.enchantments
+        self.items = self.catalog.items
 
-        filedata = None
-        with open(util.get_datafile_path('pyinvedit.yaml', 'data'), 'r') as df:
-            filedata = df.read()
-
-        if filedata:
-            yaml_dict = yaml.load(filedata)
-
-            # Load texfiles
-            self.texfiles = {}
-            for yamlobj in yaml_dict['texfiles']:
-                texfile = data.TexFile(yamlobj)
-                self.texfiles[texfile.texfile] = texfile
-
-            # Inject our own GUI yaml file
-            texfile = data.TexFile({ 'texfile': 'gui.png',
-                    'dimensions': [16, 16] })
-            self.texfiles[texfile.texfile] = texfile
-
-            # Now our groups
-            self.groups = collections.OrderedDict()
-            for yamlobj in yaml_dict['groups']:
-                group = data.Group(yamlobj, self.texfiles)
-                self.groups[group.name] = group
-
-            # Now our enchantments
-            self.enchantments = data.Enchantments()
-            for yamlobj in yaml_dict['enchantments']:
-                self.enchantments.add_enchantment(yamlobj)
+    def catalog_changed(self, paths):
+        """
+        Called by our watcher when our YAML file or texture files change
+        on disk.  Patches our catalog in place and refreshes only the parts
+        of the GUI which are affected.
+        """
+        try:
+            changes = self.catalog.reload(paths)
+        except Exception, e:
+            self.catalog_status('<span foreground="red"><b>Unable to reload item data:</b> %s</span>' %
+                    (gobject.markup_escape_text(str(e))))
+            self.catalog_error = True
+            return
+        if self.catalog_error:
+            self.catalog_status('Item data reloaded')
+            self.catalog_error = False
 
-            # And finally our items
-            self.items = data.ItemCollection()
-            for yamlobj in yaml_dict['items']:
-                self.items.add_item(data.Item(yamlobj, self.texfiles, self.groups, self.enchantments))
+        # A new texfile may live somewhere we aren't watching yet
+        for path in self.catalog.get_watch_paths():
+            self.catalog_watcher.add_path(path)
 
-            # A standin Item which we'll use when someone wants to type in
-            # an arbitrary ID
-            yamlobj = {}
-            yamlobj['num'] = 0
-            yamlobj['name'] = 'Unknown Item'
-            yamlobj['texfile'] = 'gui.png'
-            yamlobj['coords'] = [1, 2]
-            self.items.add_item(data.Item(yamlobj, self.texfiles, self.groups, self.enchantments, True))
+        if changes.is_empty():
+            return
+        InvImage.clear_render_cache()
+        if 'gui.png' in changes.texfiles:
+            self.worldbook.set_gui_sheet(self.texfiles['gui.png'])
+        self.itembox.update_catalog(changes, self.groups.values())
+        self.worldbook.refresh_items(changes.get_unique_ids())
 
-        else:
-            raise Exception('No data found from YAML file')
+    def catalog_status(self, markup):
+        """
+        Reports on an item data reload in our status area, unless it's
+        busy showing the progress of a load or save.
+        """
+        if self.load_job is None and not self.save_queue.has_pending():
+            self.statusarea.finish(markup)
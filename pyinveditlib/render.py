@@ -0,0 +1,505 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Copyright (c) 2012, Christopher J. Kucera
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the PyInvEdit team nor the names of its
+#       contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL VINCENT VOLLERS OR CJ KUCERA BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import math
+import cairo
+import pango
+import cStringIO
+import pangocairo
+from pymclevel import nbt
+from pyinveditlib import util, data, minecraft
+
+# This file contains rendering helpers which only need cairo and Pango,
+# not GTK, so they can be used without a display: the glyph atlases and
+# slot drawing used by our inventory buttons, and an offscreen renderer
+# for whole inventories.
+
+class GlyphAtlas(object):
+    """
+    A pre-rendered strip of outlined glyphs, in a single font and colour
+    combination, for the little numbers we draw over inventory slots.
+    Each glyph is shaped and stroked once, when the atlas is built, and
+    after that drawing a string is just a couple of blits per character.
+
+    Outlines and fills are kept in two separate strips, so that we can
+    draw all of a string's outlines first and then all of its fills, the
+    same as stroking and then filling a whole layout would.  Otherwise
+    one character's outline could overlap the character before it.
+
+    Glyphs are laid out at the given font resolution (in DPI), which
+    should be the display's, so that they come out the same size as the
+    rest of the text on screen.
+    """
+
+    chars = '0123456789+-'
+
+    def __init__(self, font, textcolor, outlinecolor, scale=1, resolution=96):
+        self.glyphs = {}
+
+        # Space around each glyph for its outline
+        self.padding = 2*scale
+
+        # Measure everything first
+        scratch = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
+        layout = pangocairo.CairoContext(cairo.Context(scratch)).create_layout()
+        pangocairo.context_set_resolution(layout.get_context(), resolution)
+        layout.context_changed()
+        layout.set_font_description(pango.FontDescription(font))
+        self.height = 0
+        x = 0
+        for char in self.chars:
+            layout.set_text(char)
+            (width, height) = map(lambda v: v/pango.SCALE, layout.get_size())
+            self.glyphs[char] = (x, width)
+            self.height = max(self.height, height)
+            x += width + self.padding*2
+
+        # And then render
+        self.outline = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(x, 1), self.height + self.padding*2)
+        self.fill = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(x, 1), self.height + self.padding*2)
+        outline_cr = pangocairo.CairoContext(cairo.Context(self.outline))
+        fill_cr = pangocairo.CairoContext(cairo.Context(self.fill))
+        outline_cr.set_source_rgba(*outlinecolor)
+        outline_cr.set_line_width(2*scale)
+        fill_cr.set_source_rgba(*textcolor)
+        for char in self.chars:
+            layout.set_text(char)
+            (glyph_x, width) = self.glyphs[char]
+            outline_cr.move_to(glyph_x + self.padding, self.padding)
+            outline_cr.layout_path(layout)
+            outline_cr.stroke()
+            fill_cr.move_to(glyph_x + self.padding, self.padding)
+            fill_cr.show_layout(layout)
+
+    def get_size(self, text):
+        """
+        Returns the (width, height) of the given text
+        """
+        return (sum([self.glyphs[char][1] for char in text]), self.height)
+
+    def draw(self, cr, text, x, y):
+        """
+        Draws the given text onto a cairo context, with the top-left
+        corner of its logical extents at the given coordinates
+        """
+        for strip in [self.outline, self.fill]:
+            char_x = x
+            for char in text:
+                (glyph_x, width) = self.glyphs[char]
+                cr.set_source_surface(strip, char_x - glyph_x - self.padding, y - self.padding)
+                cr.rectangle(char_x - self.padding, y - self.padding,
+                        width + self.padding*2, self.height + self.padding*2)
+                cr.fill()
+                char_x += width
+
+# Atlases we've built so far, keyed by (font, textcolor, outlinecolor,
+# scale, resolution)
+glyph_atlases = {}
+
+def get_glyph_atlas(font, textcolor, outlinecolor, scale=1, resolution=96):
+    """
+    Returns the GlyphAtlas for the given font description, colours and
+    resolution, building it if we haven't needed it before
+    """
+    key = (font, tuple(textcolor), tuple(outlinecolor), scale, resolution)
+    if key not in glyph_atlases:
+        glyph_atlases[key] = GlyphAtlas(font, textcolor, outlinecolor, scale, resolution)
+    return glyph_atlases[key]
+
+class SlotRenderer(object):
+    """
+    Draws inventory slots: the item's icon, plus overlays for its count,
+    damage, enchantments and extra info.  This is what InvImage uses to
+    draw its slots, and since it only needs cairo and our texture atlases
+    it works just as well without a display.
+
+    size is in logical pixels, and scale is the display's scale factor.
+    Everything is drawn directly at device resolution (size*scale pixels
+    square), using icons and fonts built for that resolution, rather than
+    drawing small and scaling up afterwards.  Overlay text is laid out at
+    the display's font resolution, if we're given one, so that it matches
+    the rest of the UI; otherwise we take it to be 96 DPI per unit of
+    scale.
+    """
+
+    # Corner constants
+    CORNER_NW = 0
+    CORNER_NE = 1
+    CORNER_SE = 2
+    CORNER_SW = 3
+    CORNER_CENTER = 4
+
+    # Font sizes for our overlay text, in points
+    FONT = 'sans bold %d'
+    FONT_SIZE = 9
+    FONT_SIZE_BIGGER = 12
+
+    def __init__(self, size=50, scale=1, resolution=None):
+        self.scale = scale
+        self.size = size*scale
+        if resolution is None or resolution <= 0:
+            resolution = 96.0*scale
+        self.resolution = resolution
+        self.font = self.FONT % (self.FONT_SIZE)
+        self.font_bigger = self.FONT % (self.FONT_SIZE_BIGGER)
+
+        # Damage bar constants
+        self.DAMAGE_X = 3*scale
+        self.DAMAGE_Y = self.size-6*scale
+        self.DAMAGE_W = self.size-6*scale
+        self.DAMAGE_H = 3*scale
+
+    def get_damage_key(self, slotinfo, item):
+        """
+        Returns how we're going to show a slot's damage value: None if
+        we aren't, ('data', damage) for a plain data value, ('bad', damage)
+        for an invalid one, or ('bar', width) for a damage bar, where the
+        width is in pixels.  Bars are bucketed by pixel width so that
+        slots whose bars would look the same share a cached image.
+        """
+        if item is not None and item.all_data:
+            # Report on data value, but it's not an error
+            return ('data', slotinfo.damage)
+        elif slotinfo.damage > 0:
+            if item is None:
+                # No item data to compare against, assume that it's wrong, I guess
+                return ('bad', slotinfo.damage)
+            elif item.max_damage is None:
+                # No max damage defined, so check for the Unique ID to see if we're a known data
+                # type or not.
+                if item.data != slotinfo.damage:
+                    # Invalid data, apparently!  Red text.
+                    return ('bad', slotinfo.damage)
+            else:
+                # We have a max damage definition; check against it
+                if (slotinfo.damage > item.max_damage):
+                    # Damage value is over our known max
+                    return ('bad', slotinfo.damage)
+                else:
+                    # Damage is in the proper range - draw a damage bar
+                    percent = 1 - (slotinfo.damage / float(item.max_damage))
+                    return ('bar', int(round(self.DAMAGE_W*percent)))
+        return None
+
+    def draw(self, cr, slotinfo, item, active=False, empty=None, damage_key=None):
+        """
+        The meat of the rendering.  Draws the given InventorySlot (which
+        may be None, for an empty slot) to the given cairo context, with
+        its top-left corner at the origin.  item is the slot's catalog
+        item, if it has one.  active is whether the slot is selected, and
+        empty is an optional data.TexIcon to show when there's nothing in
+        the slot, at our base scale.  If damage_key isn't passed in, it's
+        worked out here.
+        """
+        if slotinfo is not None and damage_key is None:
+            damage_key = self.get_damage_key(slotinfo, item)
+
+        done_bg = False
+        if active:
+            done_bg = True
+            cr.set_source_rgba(.8, .8, .8, 1)
+            cr.rectangle(0, 0, self.size, self.size)
+            cr.fill()
+
+        if slotinfo is None:
+            # Nothing in this inventory slot
+            if empty is None:
+                if not done_bg:
+                    cr.set_source_rgba(0, 0, 0, 0)
+                    cr.rectangle(0, 0, self.size, self.size)
+                    cr.fill()
+            else:
+                self._surface_center(cr, empty.at_scale(self.scale))
+        else:
+            # Get information about the item, if we can
+            imgsurf = None
+            if item is not None:
+                imgsurf = item.get_image(True, self.scale)
+
+            # Now get the "base" image
+            if imgsurf is None:
+                center = self.size/2
+                scale = self.scale
+
+                cr.set_source_rgba(0, 0, 0, 1)
+                cr.arc(center, center, center-10*scale, 0, math.pi*2)
+                cr.fill()
+
+                cr.set_source_rgba(1, 1, 1, 1)
+                cr.arc(center, center, center-12*scale, 0, math.pi*2)
+                cr.fill()
+
+                cr.set_source_rgba(.4196, .596, .7725, 1)
+                cr.arc(center, center, center-14*scale, 0, math.pi*2)
+                cr.fill()
+
+                self._text_at(cr, '%d' % (slotinfo.num), [1, 1, 1, 1], [0, 0, 0, 1], self.CORNER_CENTER)
+            else:
+                self._surface_center(cr, imgsurf)
+
+            # Now the quantity
+            if slotinfo.count > 1:
+                if item is None:
+                    max_quantity = 64
+                else:
+                    max_quantity = item.max_quantity
+
+                if slotinfo.count <= max_quantity:
+                    outlinecolor = [0, 0, 0, 1]
+                else:
+                    outlinecolor = [1, 0, 0, 1]
+
+                self._text_at(cr, '%d' % (slotinfo.count), [1, 1, 1, 1], outlinecolor, self.CORNER_SE)
+
+            # Damage (either bar or number)
+            if damage_key is not None:
+                (damage_type, value) = damage_key
+                if damage_type == 'data':
+                    self._text_at(cr, '%d' % (value), [.2, .2, 1, 1], [1, 1, 1, 1], self.CORNER_NW)
+                elif damage_type == 'bad':
+                    self._text_at(cr, '%d' % (value), [1, 0, 0, 1], [0, 0, 0, 1], self.CORNER_NW)
+                else:
+                    percent = value / float(self.DAMAGE_W)
+
+                    # The base (black) bar
+                    cr.set_source_rgba(0, 0, 0, 1)
+                    cr.rectangle(self.DAMAGE_X, self.DAMAGE_Y, self.DAMAGE_W, self.DAMAGE_H)
+                    cr.fill()
+
+                    # The actual damage notifier
+                    cr.set_source_rgba(1-percent, percent, 0, 1)
+                    cr.rectangle(self.DAMAGE_X, self.DAMAGE_Y, value, self.DAMAGE_H)
+                    cr.fill()
+
+            # Enchantments
+            if len(slotinfo.enchantments) > 0:
+                self._text_at(cr, '+%d' % (len(slotinfo.enchantments)), [.7764, .1686, 1, 1], [0, 0, 0, 1], self.CORNER_NE)
+
+            # Extra tag info
+            if slotinfo.has_extra_info():
+                self._text_at(cr, '+', [0, 1, 0, 1], [0, 0, 0, 1], self.CORNER_SW, True)
+
+    def _surface_center(self, cr, icon):
+        """
+        Draws a data.TexIcon to the center of the slot, straight from
+        its shared atlas.
+        """
+        offset = (self.size - icon.get_width()) / 2
+        cr.move_to(0, 0)
+        icon.paint(cr, offset, offset)
+
+    def _text_at(self, cr, text, textcolor, outlinecolor, corner, bigger=False):
+        """
+        Draws some text to the slot at the given location, using the given colors
+        for the text and the outline.  The text itself comes from a pre-rendered
+        GlyphAtlas, so it can only contain digits and +/-.
+        """
+        if bigger:
+            atlas = get_glyph_atlas(self.font_bigger, textcolor, outlinecolor,
+                    self.scale, self.resolution)
+        else:
+            atlas = get_glyph_atlas(self.font, textcolor, outlinecolor,
+                    self.scale, self.resolution)
+        (width, height) = atlas.get_size(text)
+        margin = self.scale
+        if corner == self.CORNER_NW:
+            x = margin
+            y = margin
+        elif corner == self.CORNER_NE:
+            x = self.size-margin-width
+            y = margin
+        elif corner == self.CORNER_SE:
+            x = self.size-margin-width
+            y = self.size-margin-height
+        elif corner == self.CORNER_SW:
+            x = margin
+            y = self.size-margin-height
+        else:
+            x = (self.size-width)/2
+            y = (self.size-height)/2
+
+        # Now the actual rendering
+        atlas.draw(cr, text, x, y)
+
+
+class InventoryRenderer(object):
+    """
+    Draws a whole minecraft.Inventory offscreen, laid out the same way as
+    our main inventory table: armor along the top, then the main
+    inventory, then the hotbar.  Any slots which don't fit in there (from
+    mods, say) go in extra rows along the bottom.  Output is PNG or SVG
+    data, in memory.
+    """
+
+    columns = 9
+    spacing = 4
+    gap = 14
+
+    # Our armor slots, in the order they're shown, and where their
+    # placeholder icons live in gui.png
+    armor_slots = [ (103, 0), (102, 1), (101, 2), (100, 3) ]
+
+    def __init__(self, items, gui_texfile=None, size=50):
+        """
+        Initializes given a data.ItemCollection, and optionally the
+        TexFile for gui.png (for empty armor slot icons)
+        """
+        self.items = items
+        self.size = size
+        self.renderer = SlotRenderer(size)
+        self.empty = {}
+        if gui_texfile is not None:
+            for (slot, y) in self.armor_slots:
+                self.empty[slot] = gui_texfile.get_tex(0, y, True)
+
+    def get_layout(self, inventory):
+        """
+        Returns a list of (slot, x, y) tuples for where each slot should
+        be drawn, along with the total width and height
+        """
+        rows = [ [slot for (slot, y) in self.armor_slots] ]
+        for row in range(1, 4):
+            rows.append(range(row*self.columns, (row+1)*self.columns))
+        rows.append(range(self.columns))
+        gaps_before = set([1, 4])
+
+        known = set()
+        for row in rows:
+            known.update(row)
+        extra = sorted([slot.slot for slot in inventory.get_items() if slot.slot not in known])
+        if len(extra) > 0:
+            gaps_before.add(len(rows))
+            for start in range(0, len(extra), self.columns):
+                rows.append(extra[start:start+self.columns])
+
+        layout = []
+        cell = self.size + self.spacing
+        y = self.spacing
+        for (rownum, row) in enumerate(rows):
+            if rownum in gaps_before:
+                y += self.gap
+            for (col, slot) in enumerate(row):
+                layout.append((slot, self.spacing + col*cell, y))
+            y += cell
+        return (layout, self.spacing + self.columns*cell, y)
+
+    def draw(self, cr, inventory):
+        """
+        Draws the given inventory onto a cairo context, starting at the
+        origin.  Returns the (width, height) that was drawn.
+        """
+        slots = {}
+        for slot in inventory.get_items():
+            slots[slot.slot] = slot
+        (layout, width, height) = self.get_layout(inventory)
+        for (slotnum, x, y) in layout:
+            cr.save()
+            cr.translate(x, y)
+            cr.set_source_rgba(0, 0, 0, .15)
+            cr.rectangle(0, 0, self.size, self.size)
+            cr.fill()
+            slot = slots.get(slotnum)
+            if slot is None:
+                item = None
+            else:
+                item = self.items.get_item(slot.num, slot.damage)
+            self.renderer.draw(cr, slot, item, empty=self.empty.get(slotnum))
+            cr.restore()
+        return (width, height)
+
+    def render_png(self, inventory):
+        """
+        Returns the given inventory as PNG data
+        """
+        (layout, width, height) = self.get_layout(inventory)
+        surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        self.draw(cairo.Context(surf), inventory)
+        df = cStringIO.StringIO()
+        surf.write_to_png(df)
+        return df.getvalue()
+
+    def render_svg(self, inventory):
+        """
+        Returns the given inventory as SVG data.  Icons are embedded as
+        bitmaps.
+        """
+        (layout, width, height) = self.get_layout(inventory)
+        df = cStringIO.StringIO()
+        surf = cairo.SVGSurface(df, width, height)
+        self.draw(cairo.Context(surf), inventory)
+        surf.finish()
+        return df.getvalue()
+
+    def render(self, inventory, format='png'):
+        """
+        Returns the given inventory as either 'png' or 'svg' data
+        """
+        if format == 'png':
+            return self.render_png(inventory)
+        elif format == 'svg':
+            return self.render_svg(inventory)
+        else:
+            raise Exception('Unknown image format: %s' % (format))
+
+# The following lets a process pool render inventories in bulk, along
+# the lines of:
+#
+#   pool = multiprocessing.Pool(initializer=render.init_worker)
+#   images = pool.map(render.render_player_file, paths)
+#
+# Each worker process loads the item catalog once, when it starts.
+
+worker_renderer = None
+
+def init_worker(yaml_filename=None):
+    """
+    Loads our item catalog (without any GTK pixbufs) and sets up an
+    InventoryRenderer for this process to use
+    """
+    global worker_renderer
+    if yaml_filename is None:
+        yaml_filename = util.get_datafile_path('pyinvedit.yaml', 'data')
+    catalog = data.Catalog(yaml_filename, pixbufs=False)
+    catalog.load()
+    worker_renderer = InventoryRenderer(catalog.items, catalog.texfiles['gui.png'])
+
+def render_player_file(path, format='png'):
+    """
+    Renders the inventory in the given level.dat (or multiplayer player
+    .dat file) and returns the image data.  init_worker() must have
+    been called first.
+    """
+    if worker_renderer is None:
+        raise Exception('init_worker() must be called before rendering')
+    leveldat = nbt.load(path)
+    if 'Data' in leveldat:
+        inventory = minecraft.Inventory(leveldat['Data']['Player']['Inventory'])
+    else:
+        inventory = minecraft.Inventory(leveldat['Inventory'])
+    return worker_renderer.render(inventory, format)
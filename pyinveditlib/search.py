@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Copyright (c) 2012, Christopher J. Kucera
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the PyInvEdit team nor the names of its
+#       contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL VINCENT VOLLERS OR CJ KUCERA BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import array
+import numpy
+from pyinveditlib import util
+
+# This file contains our item search index.  It doesn't depend on GTK, so
+# it can be used without the GUI as well.
+
+class ItemIndex(object):
+    """
+    An inverted n-gram index over our item names, plus an index of item
+    IDs, so that a search produces its set of matching items directly
+    rather than by walking through every item.
+
+    Every distinct substring of up to gram_size characters of each
+    (lowercased) name is indexed.  Queries of up to gram_size characters
+    are answered straight from the index; for longer queries we take the
+    shortest posting list among the query's n-grams and check those
+    candidates with a substring test.  Posting lists are stored as compact
+    arrays of item positions, ordered the way rank() wants them: names
+    which are the n-gram itself, then names starting with it, then names
+    with a later word starting with it, then the rest, each in the order
+    the items were indexed.  word_ends records where the word-start part
+    of each posting list ends.
+
+    Results are sets of item unique IDs.  Items flagged as unknown are
+    indexed, but never included in get_all() or get_group().
+
+    rank() provides a ranked, typo-tolerant search on top of that: exact
+    matches are ordered with whole-name and prefix matches first, and if
+    there are only a few of them, names which share enough n-grams with
+    the query are checked for an approximate match as well.
+    """
+
+    gram_size = 3
+
+    # Queries up to this long are ranked straight from their posting
+    # lists, and the most recent few rankings are kept around.  This
+    # can't be more than gram_size.
+    short_query = 3
+    short_cache_size = 64
+
+    # Only go looking for fuzzy matches if we have fewer exact matches
+    # than this, and only check this many of the best fuzzy candidates.
+    fuzzy_threshold = 20
+    fuzzy_candidates = 24
+
+    def __init__(self, items):
+        self.keys = []
+        self.names = []
+        self.key_names = {}
+        self.key_positions = {}
+        self.masks = []
+        self.grams = {}
+        self.word_ends = {}
+        self.ids = {}
+        self.unknown = set()
+        self.all_keys = set()
+        self.group_cache = {}
+        self.short_ranks = util.LRUCache(self.short_cache_size)
+
+        # Each posting list is built up in four parts (see above), which
+        # are joined together once everything's been added
+        parts = ({}, {}, {}, {})
+        for item in items:
+            self._add(item, parts)
+        for gram in set().union(*parts):
+            postings = array.array('i')
+            for (tier, part) in enumerate(parts):
+                postings.extend(part.get(gram, ()))
+                if tier == 2 and len(postings) > 0:
+                    self.word_ends[gram] = len(postings)
+            self.grams[gram] = postings
+
+    def _add(self, item, parts):
+        """
+        Adds an item into our index, putting its n-grams into the given
+        posting list parts
+        """
+        position = len(self.keys)
+        name = item.name.lower()
+        self.keys.append(item.unique_id)
+        self.names.append(name)
+        self.key_names[item.unique_id] = name
+        self.key_positions[item.unique_id] = position
+        self.masks.append(item.group_mask)
+        if item.unknown:
+            self.unknown.add(item.unique_id)
+        else:
+            self.all_keys.add(item.unique_id)
+        self.ids.setdefault(item.num, set()).add(item.unique_id)
+        word_grams = set()
+        for start in [0] + [i+1 for (i, char) in enumerate(name) if char == ' ']:
+            for size in range(1, self.gram_size+1):
+                word_grams.add(name[start:start+size])
+        seen = set()
+        for size in range(1, self.gram_size+1):
+            for start in range(0, len(name)-size+1):
+                gram = name[start:start+size]
+                if gram in seen:
+                    continue
+                seen.add(gram)
+                if gram == name:
+                    part = parts[0]
+                elif start == 0:
+                    part = parts[1]
+                elif gram in word_grams:
+                    part = parts[2]
+                else:
+                    part = parts[3]
+                if gram not in part:
+                    part[gram] = array.array('i')
+                part[gram].append(position)
+
+    def get_all(self):
+        """
+        Returns the set of all (known) items
+        """
+        return self.all_keys
+
+    def get_group(self, group):
+        """
+        Returns the set of all (known) items in the given group
+        """
+        if group not in self.group_cache:
+            keys = set()
+            for (position, mask) in enumerate(self.masks):
+                if mask & group.bit:
+                    keys.add(self.keys[position])
+            self.group_cache[group] = keys - self.unknown
+        return self.group_cache[group]
+
+    def search(self, text):
+        """
+        Returns the set of items whose name contains the given text, or
+        whose ID is the given text.
+        """
+        return self.search_names(text) | self.search_ids(text)
+
+    def search_ids(self, text):
+        """
+        Returns the set of items whose ID is the given text
+        """
+        if text.isdigit() and int(text) in self.ids:
+            return set(self.ids[int(text)])
+        else:
+            return set()
+
+    def search_names(self, text):
+        """
+        Returns the set of items whose name contains the given text
+        """
+        text = text.lower()
+        if 0 < len(text) <= self.gram_size:
+            positions = self.grams.get(text, ())
+        else:
+            positions = self.match_names(text)
+        keys = self.keys
+        return set([keys[position] for position in positions])
+
+    def match_names(self, text):
+        """
+        Returns a list of the positions of the names which contain the
+        given (lowercase) text, in the order they were indexed.
+        """
+        if len(text) == 0:
+            return range(len(self.keys))
+        if len(text) <= self.gram_size:
+            return sorted(self.grams.get(text, ()))
+        postings = None
+        for start in range(0, len(text)-self.gram_size+1):
+            gram = text[start:start+self.gram_size]
+            if gram not in self.grams:
+                return []
+            if postings is None or len(self.grams[gram]) < len(postings):
+                postings = self.grams[gram]
+        names = self.names
+        return sorted([position for position in postings if text in names[position]])
+
+    def refine(self, positions, text):
+        """
+        Given the positions of the names which matched an earlier search
+        (from match_names()), return those whose names also contain the
+        given text.  Only valid if the earlier search text is a substring
+        of this one.
+        """
+        text = text.lower()
+        names = self.names
+        return [position for position in positions if text in names[position]]
+
+    def rank(self, text, matches=None):
+        """
+        Returns a list of the unique IDs of items matching the given text,
+        best match first: names which are the text, then names starting
+        with it, then names with a word starting with it, then items with
+        the text as their ID, then any other names containing it, and
+        then fuzzy matches, ordered by how many typos they needed and
+        then by where in the name they matched.  Otherwise, within a tier,
+        items are left in the order they were indexed (alphabetical, for
+        our catalog).  If the positions of the names containing the text
+        are already known (from a QueryCache, say), they can be passed in
+        as matches.
+        """
+        text = text.lower()
+        if 0 < len(text) <= self.short_query:
+            return self.rank_short(text)
+        if matches is None:
+            matches = self.match_names(text)
+        names = self.names
+        keys = self.keys
+        word_text = ' %s' % (text)
+        starts = [position for position in matches if names[position].startswith(text)]
+        others = [position for position in matches if not names[position].startswith(text)]
+        ranked = [keys[position] for position in starts if names[position] == text]
+        ranked.extend([keys[position] for position in starts if names[position] != text])
+        ranked.extend([keys[position] for position in others if word_text in names[position]])
+        ranked.extend(self._rank_ids(text))
+        ranked.extend([keys[position] for position in others if word_text not in names[position]])
+        if len(ranked) < self.fuzzy_threshold:
+            found = set(ranked)
+            ranked.extend([key for (key, distance, end) in self.search_fuzzy(text)
+                if key not in found])
+        return ranked
+
+    def rank_short(self, text):
+        """
+        Ranks the matches for a query of up to short_query characters,
+        the same way rank() does.  Our posting lists are already in that
+        order, so this is just a matter of looking up their keys and
+        adding in any ID matches.  The result is shared with our cache,
+        so shouldn't be modified.
+        """
+        ranked = self.short_ranks.get(text)
+        if ranked is not None:
+            return ranked
+        keys = self.keys
+        ranked = [keys[position] for position in self.grams.get(text, ())]
+        word_end = self.word_ends.get(text, 0)
+        ranked[word_end:word_end] = self._rank_ids(text)
+        self.short_ranks.put(text, ranked)
+        return ranked
+
+    def _rank_ids(self, text):
+        """
+        Returns the items whose ID is the given text but whose names don't
+        contain it, in the order they were indexed
+        """
+        keys = [key for key in self.search_ids(text) if text not in self.key_names[key]]
+        return sorted(keys, key=self.key_positions.get)
+
+    def search_fuzzy(self, text):
+        """
+        Returns a list of (unique ID, edit distance, match position) tuples
+        for items whose names approximately contain the given text, best
+        first: fewest typos, then earliest match in the name.  One typo (a
+        wrong, missing, extra or swapped character) is allowed for queries
+        of four or five characters, and two for anything longer.  Shorter
+        queries don't get fuzzy matches.
+
+        Candidates come from counting how many of the query's bigrams and
+        trigrams each name shares, using our posting lists.  By the q-gram
+        lemma, a name which matches within k typos still shares at least
+        len(grams)-(q+1)*k of the query's q-grams (swaps can break q+1 of
+        them), so names short of that are dropped.  The counting is done
+        by numpy over the posting lists, rather than by looking at names,
+        and only the fuzzy_candidates names sharing the most n-grams are
+        then checked with an approximate substring match.
+        """
+        text = text.lower()
+        if len(text) <= self.gram_size:
+            return []
+        if len(text) <= 5:
+            max_distance = 1
+        else:
+            max_distance = 2
+
+        # Score each name by how many of the query's bigrams and trigrams
+        # it shares.  Counts for just one size are only worked out when the
+        # lemma for that size actually rules something out.
+        count = len(self.names)
+        all_postings = []
+        bounds = []
+        for size in (2, 3):
+            grams = set()
+            for start in range(0, len(text)-size+1):
+                grams.add(text[start:start+size])
+            postings = [numpy.frombuffer(self.grams[gram], numpy.intc)
+                    for gram in grams if gram in self.grams]
+            needed = len(grams) - (size+1)*max_distance
+            if needed > len(postings):
+                return []
+            if needed > 0:
+                bounds.append((postings, needed))
+            all_postings.extend(postings)
+        if len(all_postings) == 0:
+            return []
+        scores = numpy.bincount(numpy.concatenate(all_postings), minlength=count)
+        for (postings, needed) in bounds:
+            scores[numpy.bincount(numpy.concatenate(postings), minlength=count) < needed] = 0
+
+        # Only check the best-scoring candidates
+        if count > self.fuzzy_candidates:
+            candidates = numpy.argpartition(scores, count-self.fuzzy_candidates)
+            candidates = candidates[count-self.fuzzy_candidates:]
+        else:
+            candidates = numpy.arange(count)
+        candidates = candidates[scores[candidates] > 0]
+
+        masks = char_masks(text)
+        results = []
+        for position in candidates.tolist():
+            (distance, end) = substring_distance(text, self.names[position], max_distance, masks)
+            if distance <= max_distance:
+                results.append((distance, end, position))
+        results.sort()
+        return [(self.keys[match_position], match_distance, match_end)
+                for (match_distance, match_end, match_position) in results]
+
+def char_masks(text):
+    """
+    Returns a dict of each character in the given text, and a bitmask of
+    the positions in the text where it appears, for substring_distance()
+    """
+    masks = {}
+    for (i, char) in enumerate(text):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+def substring_distance(text, name, limit=None, masks=None):
+    """
+    Returns a tuple of the smallest edit distance between the given text
+    and any substring of the given name, and where in the name the best
+    such substring ends.  This is the usual edit distance dynamic program,
+    except that a match is allowed to start and end anywhere in the name
+    for free, and swapping two neighbouring characters counts as a single
+    edit (the "optimal string alignment" distance).  If a limit is given
+    and the distance is over it, we return (limit+1, 0).
+
+    Rather than filling in the table a cell at a time, each column of it
+    is held as bit vectors of the differences between neighbouring cells,
+    and worked out in a handful of integer operations (Myers' algorithm,
+    with Hyyro's extension for swaps).  The character masks for the text
+    can be passed in from char_masks(), when checking it against a lot of
+    names.
+    """
+    length = len(text)
+    if length == 0:
+        return (0, 0)
+    if masks is None:
+        masks = char_masks(text)
+    get_mask = masks.get
+    full = (1 << length) - 1
+    last = 1 << (length-1)
+
+    # Vertical differences are all +1 to start with, since the first
+    # column is 0..length.  Each match can start anywhere in the name,
+    # so the top row stays at zero.  The score only goes down on a -1
+    # in the bottom row, so that's the only time we look for a new best.
+    plus = full
+    minus = 0
+    score = length
+    best = length
+    best_end = 0
+    prev_eq = 0
+    prev_diag = 0
+    end = 0
+    for char in name:
+        end += 1
+        eq = get_mask(char, 0)
+        swap = (((~prev_diag) & eq) << 1) & prev_eq
+        diag = (((eq & plus) + plus) ^ plus) | eq | minus | swap
+        hplus = minus | (full & ~(diag | plus))
+        hminus = diag & plus
+        if hplus & last:
+            score += 1
+        elif hminus & last:
+            score -= 1
+            if score < best:
+                best = score
+                best_end = end
+        hplus = (hplus << 1) & full
+        plus = (hminus << 1) | (full & ~(diag | hplus))
+        minus = diag & hplus
+        prev_eq = eq
+        prev_diag = diag
+    if limit is not None and best > limit:
+        return (limit+1, 0)
+    return (best, best_end)
+
+class QueryCache(object):
+    """
+    Remembers the results of recent name searches on an ItemIndex.  As
+    someone types, each query usually extends the one before it, and its
+    result can only be a subset of the earlier one, so we just narrow
+    down the previous result.  We keep a stack of these refinements, so
+    that backspacing can be answered straight from the cache.  Queries
+    short enough for the index to rank from its posting lists don't go
+    on the stack.
+    """
+
+    max_depth = 32
+
+    def __init__(self, index):
+        self.index = index
+        self.stack = []
+
+    def search(self, text):
+        """
+        Returns the set of items whose name contains the given text, or
+        whose ID is the given text.
+        """
+        # ID matches don't narrow the same way, but they're just a dict
+        # lookup anyway.
+        return self.search_names(text) | self.index.search_ids(text)
+
+    def rank(self, text):
+        """
+        Returns a ranked list of matching items; see ItemIndex.rank()
+        """
+        text = text.lower()
+        if len(text) <= self.index.short_query:
+            return self.index.rank(text)
+        return self.index.rank(text, self.match_names(text))
+
+    def search_names(self, text):
+        """
+        Returns the set of items whose name contains the given text
+        """
+        text = text.lower()
+        if len(text) <= self.index.short_query:
+            return self.index.search_names(text)
+        keys = self.index.keys
+        return set([keys[position] for position in self.match_names(text)])
+
+    def match_names(self, text):
+        """
+        Returns the positions of the names containing the given text, as
+        ItemIndex.match_names() does.  This list is shared with our cache,
+        so shouldn't be modified.
+        """
+        text = text.lower()
+
+        # Throw away anything which our new text doesn't build on
+        while len(self.stack) > 0 and self.stack[-1][0] not in text:
+            self.stack.pop()
+
+        if len(self.stack) > 0 and self.stack[-1][0] == text:
+            result = self.stack[-1][1]
+        else:
+            if len(self.stack) > 0:
+                result = self.index.refine(self.stack[-1][1], text)
+            else:
+                result = self.index.match_names(text)
+            self.stack.append((text, result))
+            if len(self.stack) > self.max_depth:
+                self.stack.pop(0)
+        return result
@@ -27,9 +27,16 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
-import gtk
 import sys
 import cStringIO
+import collections
+
+# GTK is only needed for get_pixbuf_from_surface(); leaving it optional
+# lets our data classes be used without it.
+try:
+    import gtk
+except ImportError:
+    gtk = None
 
 # This file contains various helper functions and classes which didn't seem
 # to really fit elsewhere
@@ -49,6 +56,54 @@ def get_pixbuf_from_surface(surface):
     df.close()
     return loader.get_pixbuf()
 
+def get_scale_factor(screen=None):
+    """
+    Returns the integer scale factor we should be drawing at, for HiDPI
+    displays.  GTK2 doesn't have any notion of this itself, so we honor
+    GDK_SCALE if it's set (as GTK3 does), and otherwise go by the screen's
+    font resolution, taking 96 DPI to be a scale of 1.
+    """
+    if 'GDK_SCALE' in os.environ:
+        try:
+            return max(1, int(os.environ['GDK_SCALE']))
+        except ValueError:
+            pass
+    if screen is None:
+        if gtk is None:
+            return 1
+        screen = gtk.gdk.screen_get_default()
+        if screen is None:
+            return 1
+    resolution = screen.get_resolution()
+    if resolution <= 0:
+        return 1
+    return max(1, int(round(resolution / 96.0)))
+
+def get_font_resolution(screen=None):
+    """
+    Returns the resolution, in DPI, that text we draw at device resolution
+    should be laid out at to match the rest of the UI.  That's the screen's
+    font resolution (which follows GTK's gtk-xft-dpi setting), except that
+    if GDK_SCALE is set, we scale it up along with everything else, as
+    GTK3 would.  Returns None if the screen hasn't got a resolution, or
+    we're not running under GTK.
+    """
+    if screen is None:
+        if gtk is None:
+            return None
+        screen = gtk.gdk.screen_get_default()
+        if screen is None:
+            return None
+    resolution = screen.get_resolution()
+    if resolution <= 0:
+        return None
+    if 'GDK_SCALE' in os.environ:
+        try:
+            return resolution * max(1, int(os.environ['GDK_SCALE']))
+        except ValueError:
+            pass
+    return resolution
+
 def get_datafile_path(filename, prefix=''):
     """
     Gets the path to one of our datafiles, given its directory
@@ -98,6 +153,71 @@ def get_datafile_path(filename, prefix=''):
                 fullpath = os.path.join(path, '..', '..', '..', 'share', 'pyinvedit', prefix, filename)
                 return fullpath
 
+def get_cache_path(filename):
+    """
+    Returns the path to one of our cache files, which live in the usual
+    per-user cache location for the platform.  The directory isn't
+    created here; whoever writes the file should take care of that.
+    """
+    if sys.platform == 'win32' and 'APPDATA' in os.environ:
+        path = os.path.join(os.environ['APPDATA'], 'pyinvedit')
+    elif sys.platform == 'darwin':
+        path = os.path.join(os.path.expanduser('~'), 'Library', 'Caches', 'pyinvedit')
+    else:
+        path = os.environ.get('XDG_CACHE_HOME',
+                os.path.join(os.path.expanduser('~'), '.cache'))
+        path = os.path.join(path, 'pyinvedit')
+    return os.path.join(path, filename)
+
+class LRUCache(object):
+    """
+    A simple dict-like cache which holds on to at most maxsize entries,
+    throwing away whichever was least-recently used when it fills up.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Returns the value for the given key (marking it as recently used),
+        or the default if we don't have it.
+        """
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            return default
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a value in the cache
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        """
+        Removes the given key from the cache, if it's there
+        """
+        self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Empties the cache
+        """
+        self.entries.clear()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
 class Undo(object):
     """
     Right now this is a dummy object which only keeps track of
@@ -109,12 +229,14 @@ class Undo(object):
 
     def __init__(self):
         self.changed = False
+        self.change_count = 0
 
     def change(self):
         """
         We've changed something in our file
         """
         self.changed = True
+        self.change_count += 1
 
     def load(self):
         """
@@ -134,6 +256,14 @@ class Undo(object):
         """
         return self.changed
 
+    def get_change_count(self):
+        """
+        Returns how many changes have been made since we started up.
+        Comparing two of these tells us whether anything was changed in
+        between (while something was loading in the background, say).
+        """
+        return self.change_count
+
 # We'll make this a global var so that any of our classes can access
 # it.  Probably not a very clean way of doing things, but it will
 # probably prevent having to pass a bunch more references around, etc.
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Copyright (c) 2012, Christopher J. Kucera
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the PyInvEdit team nor the names of its
+#       contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL VINCENT VOLLERS OR CJ KUCERA BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import gobject
+
+# pyinotify is optional; without it we'll just poll.
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# This file contains a simple watcher for files and directories on disk,
+# which reports changes back to us via the GTK main loop.
+
+def inotify_available():
+    """
+    Returns whether or not FileWatcher can use inotify, rather than
+    polling
+    """
+    return pyinotify is not None
+
+class PollSnapshot(object):
+    """
+    The polling side of FileWatcher, which doesn't need GTK: remembers the
+    modification time and size of a set of files, and of the direct
+    children of a set of directories, and reports which of those have
+    changed since it last looked.  Paths should already be resolved.
+    This touches the disk on every call, so it's up to the caller which
+    thread it runs on; it isn't safe to share between threads, though.
+    """
+
+    def __init__(self, paths):
+        self.paths = set(paths)
+        self.snapshot = self._take_snapshot(self.paths)
+
+    def add_path(self, path):
+        """
+        Starts watching another file or directory.  We don't report on
+        it until it changes after this.
+        """
+        if path in self.paths:
+            return
+        self.paths.add(path)
+        self.snapshot.update(self._take_snapshot([path]))
+
+    def remove_path(self, path):
+        """
+        Stops watching a file or directory
+        """
+        if path not in self.paths:
+            return
+        self.paths.remove(path)
+        self.snapshot = dict([(child, stat) for (child, stat)
+            in self.snapshot.items() if self.is_watched(child)])
+
+    def is_watched(self, path):
+        """
+        Returns whether or not the given path is something we should be
+        reporting on.
+        """
+        return path in self.paths or os.path.dirname(path) in self.paths
+
+    def poll(self):
+        """
+        Compares the current state of things against our last snapshot,
+        and returns the set of paths which have changed
+        """
+        snapshot = self._take_snapshot(self.paths)
+        changed = set()
+        for path in set(snapshot.keys()) | set(self.snapshot.keys()):
+            if snapshot.get(path) != self.snapshot.get(path):
+                changed.add(path)
+        self.snapshot = snapshot
+        return changed
+
+    def _stat(self, path):
+        """
+        Returns the (mtime, size) of the given path, or None if it doesn't
+        exist.
+        """
+        try:
+            st = os.stat(path)
+            return (st.st_mtime, st.st_size)
+        except OSError:
+            return None
+
+    def _take_snapshot(self, paths):
+        """
+        Returns a dict of (mtime, size) for everything under the given
+        paths
+        """
+        snapshot = {}
+        for path in paths:
+            if os.path.isdir(path):
+                try:
+                    names = os.listdir(path)
+                except OSError:
+                    names = []
+                for name in names:
+                    child = os.path.join(path, name)
+                    snapshot[child] = self._stat(child)
+            else:
+                snapshot[path] = self._stat(path)
+        return snapshot
+
+class FileWatcher(object):
+    """
+    Watches a list of files and directories, and calls the given callback
+    from the GTK main loop with a set of paths which have changed.  A
+    watched file reports its own path; a watched directory reports the
+    paths of whichever of its direct children were modified, created,
+    deleted or renamed.  Bursts of changes (editors tend to write files in
+    several steps) are collected for a short while and reported in one go.
+
+    We use inotify (via pyinotify) if it's available, and otherwise fall
+    back to polling modification times with a PollSnapshot, from the main
+    loop.  That's fine for a handful of files; anything which might have
+    to watch a lot more should poll from a thread of its own instead.
+    """
+
+    poll_interval = 2000
+    settle_interval = 300
+
+    def __init__(self, paths, callback, use_inotify=True):
+        self.paths = set([os.path.realpath(path) for path in paths])
+        self.callback = callback
+        self.pending = set()
+        self.settle_id = None
+        self.poll_id = None
+        self.io_id = None
+        self.notifier = None
+        self.watch_dirs = {}
+        self.watch_ids = {}
+        self.poller = None
+        if use_inotify and pyinotify is not None:
+            self._start_inotify()
+        else:
+            self._start_polling()
+
+    def stop(self):
+        """
+        Stops watching
+        """
+        for source_id in [self.settle_id, self.poll_id, self.io_id]:
+            if source_id is not None:
+                gobject.source_remove(source_id)
+        self.settle_id = None
+        self.poll_id = None
+        self.io_id = None
+        self.poller = None
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
+            self.watch_dirs = {}
+            self.watch_ids = {}
+
+    def add_path(self, path, is_file=False):
+        """
+        Starts watching another file or directory.  We don't report on
+        it until it changes after this.  A caller which knows that path
+        is an already-resolved path to a file can pass is_file, which
+        saves us from looking it up on disk when we're using inotify.
+        """
+        if not is_file:
+            path = os.path.realpath(path)
+        if path in self.paths:
+            return
+        self.paths.add(path)
+        if self.notifier is not None:
+            self._add_inotify_watch(path, is_file)
+        elif self.poller is not None:
+            self.poller.add_path(path)
+
+    def remove_path(self, path, is_file=False):
+        """
+        Stops watching a file or directory.  is_file works the same as
+        for add_path().
+        """
+        if not is_file:
+            path = os.path.realpath(path)
+        if path not in self.paths:
+            return
+        self.paths.remove(path)
+        if self.notifier is not None:
+            self._remove_inotify_watch(path)
+        elif self.poller is not None:
+            self.poller.remove_path(path)
+
+    def _is_watched(self, path):
+        """
+        Returns whether or not the given path is something we should be
+        reporting on.
+        """
+        return path in self.paths or os.path.dirname(path) in self.paths
+
+    def _queue(self, path):
+        """
+        Queues up a changed path to be reported once things settle down
+        """
+        self.pending.add(path)
+        if self.settle_id is None:
+            self.settle_id = gobject.timeout_add(self.settle_interval, self._settle)
+
+    def _settle(self):
+        """
+        Reports all our pending changes to our callback
+        """
+        paths = self.pending
+        self.pending = set()
+        self.settle_id = None
+        self.callback(paths)
+        return False
+
+    def _start_inotify(self):
+        """
+        Sets up our inotify watches.  We watch the directory containing
+        each file rather than the file itself, since a lot of editors save
+        by writing a new file and renaming it over the old one.
+        """
+        self.mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE |
+                pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM |
+                pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB)
+        self.wm = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.wm, self._inotify_event, timeout=0)
+        for path in self.paths:
+            self._add_inotify_watch(path)
+        self.io_id = gobject.io_add_watch(self.wm.get_fd(), gobject.IO_IN, self._inotify_readable)
+
+    def _add_inotify_watch(self, path, is_file=False):
+        """
+        Watches the directory for the given path (which may be shared with
+        other paths we're watching), if we aren't already
+        """
+        if not is_file and os.path.isdir(path):
+            dirname = path
+        else:
+            dirname = os.path.dirname(path)
+        self.watch_dirs[path] = dirname
+        if dirname not in self.watch_ids:
+            # pyinotify just hands back a negative descriptor if the
+            # directory isn't there
+            wd = self.wm.add_watch(dirname, self.mask, quiet=True).get(dirname, -1)
+            if wd >= 0:
+                self.watch_ids[dirname] = wd
+
+    def _remove_inotify_watch(self, path):
+        """
+        Stops watching the directory for the given path, if none of our
+        other paths still need it
+        """
+        dirname = self.watch_dirs.pop(path, None)
+        if dirname is None or dirname in self.watch_dirs.values():
+            return
+        wd = self.watch_ids.pop(dirname, None)
+        # The kernel drops the watch by itself if the directory's been
+        # deleted, in which case there's nothing left to remove.
+        if wd is not None and self.wm.get_path(wd) is not None:
+            self.wm.rm_watch(wd)
+
+    def _inotify_readable(self, fd, condition):
+        """
+        Our inotify file descriptor has events waiting
+        """
+        self.notifier.read_events()
+        self.notifier.process_events()
+        return True
+
+    def _inotify_event(self, event):
+        """
+        Processes a single inotify event
+        """
+        path = os.path.realpath(event.pathname)
+        if self._is_watched(path):
+            self._queue(path)
+
+    def _start_polling(self):
+        """
+        Sets up our polling fallback
+        """
+        self.poller = PollSnapshot(self.paths)
+        self.poll_id = gobject.timeout_add(self.poll_interval, self._poll)
+
+    def _poll(self):
+        """
+        Queues up whatever's changed since we last looked
+        """
+        for path in self.poller.poll():
+            self._queue(path)
+        return True
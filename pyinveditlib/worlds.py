@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Copyright (c) 2012, Christopher J. Kucera
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the PyInvEdit team nor the names of its
+#       contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL VINCENT VOLLERS OR CJ KUCERA BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import time
+import yaml
+import Queue
+import gobject
+import threading
+from pyinveditlib import watcher, fileio
+
+# This file keeps track of which singleplayer worlds are available in
+# Minecraft's saves directory, and what's in them, without making the GUI
+# wait on the disk.
+
+class WorldInfo(object):
+    """
+    What we know about a single world: its directory name, the path to
+    its level.dat, and (once they've been read) a few fields from the
+    level.dat itself.  Any of those fields may be None if we haven't read
+    them yet, or the file didn't have them.
+    """
+
+    game_types = {
+            0: 'Survival',
+            1: 'Creative',
+            2: 'Adventure',
+            3: 'Spectator',
+        }
+
+    def __init__(self, dirname, path, level_name=None, last_played=None,
+            game_type=None, hardcore=False):
+        self.dirname = dirname
+        self.path = path
+        self.level_name = level_name
+        self.last_played = last_played
+        self.game_type = game_type
+        self.hardcore = hardcore
+
+    def _key(self):
+        return (self.dirname, self.path, self.level_name, self.last_played,
+                self.game_type, self.hardcore)
+
+    def __eq__(self, other):
+        return isinstance(other, WorldInfo) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def get_label(self):
+        """
+        Returns a label for this world, for use in our menus
+        """
+        if self.level_name:
+            label = self.level_name
+        else:
+            label = self.dirname
+        details = []
+        if self.hardcore:
+            details.append('Hardcore')
+        elif self.game_type in self.game_types:
+            details.append(self.game_types[self.game_type])
+        if self.last_played:
+            details.append(time.strftime('%Y-%m-%d %H:%M',
+                time.localtime(self.last_played / 1000)))
+        if len(details) > 0:
+            label = '%s (%s)' % (label, ', '.join(details))
+        return label
+
+class WorldInfoCache(object):
+    """
+    A small persistent cache of the fields we read from level.dat files.
+    Entries are keyed by path, and are only used if the file's mtime and
+    size still match what they were when we read it, so the fields are
+    only actually read from disk for new or changed worlds.  This is only
+    meant to be used from a single (worker) thread.
+    """
+
+    # The tags we pull out of each level.dat's Data compound
+    tags = ['LevelName', 'LastPlayed', 'GameType', 'hardcore']
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        """
+        Loads our cache from disk, if we've got one.  A missing or broken
+        cache file just means starting from scratch.
+        """
+        if self.filename is None or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as df:
+                entries = yaml.safe_load(df)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except Exception, e:
+            print 'Unable to load world cache %s: %s' % (self.filename, str(e))
+
+    def save(self):
+        """
+        Writes our cache out to disk, if it's changed
+        """
+        if self.filename is None or not self.dirty:
+            return
+        try:
+            dirname = os.path.dirname(self.filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            tmpname = '%s.tmp' % (self.filename)
+            with open(tmpname, 'w') as df:
+                yaml.safe_dump(self.entries, df)
+            if os.name == 'nt' and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmpname, self.filename)
+            self.dirty = False
+        except Exception, e:
+            print 'Unable to save world cache %s: %s' % (self.filename, str(e))
+
+    def lookup(self, path):
+        """
+        Returns the cached fields for the given level.dat, or None if we
+        don't have them (or they're out of date)
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if entry.get('mtime') != st.st_mtime or entry.get('size') != st.st_size:
+            return None
+        return entry
+
+    def read(self, path):
+        """
+        Returns the fields for the given level.dat, reading them from the
+        file (and caching them) if need be.  If the file can't be read,
+        we return an empty dict, and don't cache anything.
+        """
+        entry = self.lookup(path)
+        if entry is not None:
+            return entry
+        try:
+            st = os.stat(path)
+            entry = fileio.read_nbt_values(path, 'Data', self.tags)
+        except Exception, e:
+            print 'Unable to read world info from %s: %s' % (path, str(e))
+            return {}
+        entry['mtime'] = st.st_mtime
+        entry['size'] = st.st_size
+        self.entries[path] = entry
+        self.dirty = True
+        return entry
+
+    def prune(self, paths):
+        """
+        Throws away entries for anything but the given paths
+        """
+        paths = set(paths)
+        for path in self.entries.keys():
+            if path not in paths:
+                del self.entries[path]
+                self.dirty = True
+
+    def get_info(self, dirname, path, entry):
+        """
+        Returns a WorldInfo for the given world, from a cache entry
+        """
+        if entry is None:
+            return WorldInfo(dirname, path)
+        return WorldInfo(dirname, path,
+                entry.get('LevelName'),
+                entry.get('LastPlayed'),
+                entry.get('GameType'),
+                bool(entry.get('hardcore')))
+
+class WorldIndex(object):
+    """
+    An index of the singleplayer worlds in a saves directory, mapping each
+    world's directory name to a WorldInfo.  The directory is scanned once
+    on a worker thread, and after that we watch it, along with the
+    level.dat of each world we know about, and only re-check the entries
+    which have changed, also on the worker.  We use inotify if we can;
+    otherwise the worker polls every poll_interval milliseconds, so that
+    the main loop never has to wait on the disk either way.
+
+    Whenever the index changes, callback(added, removed) is called from
+    the GTK main loop, where added is a dict of new (or changed) worlds
+    and removed is a set of world names which have gone away.
+
+    World details come from a WorldInfoCache.  The initial scan reports
+    every world straight away, using whatever details are cached, and
+    then reads in the rest, reporting them in batches of describe_batch
+    as they come in.
+
+    A freshly-created world directory might not have its level.dat yet
+    when we hear about it, so directories without one are checked once
+    more after recheck_delay milliseconds.
+    """
+
+    recheck_delay = 2000
+    describe_batch = 20
+    poll_interval = 2000
+
+    def __init__(self, savesdir, callback, cache_filename=None):
+        self.savesdir = savesdir
+
+        # Our watcher reports resolved paths, so we scan (and record our
+        # worlds' paths) under the resolved directory too, to keep them
+        # all in the same form.
+        self.realdir = os.path.realpath(savesdir)
+        self.callback = callback
+        self.worlds = {}
+        self.recheck_ids = {}
+
+        # Only our worker thread touches this
+        self.cache = WorldInfoCache(cache_filename)
+
+        # Work for our worker thread.  None means a full scan, and 'poll'
+        # means polling for changes; otherwise it's a list of paths to
+        # check, and whether or not they can be rechecked later if need
+        # be.  Changes we hear about while the initial scan is running
+        # are queued up behind it, so they're applied afterwards.
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+        # Without inotify, our worker keeps a PollSnapshot (which only it
+        # touches) of our directory and our worlds' level.dat files, and
+        # the main loop just tells it when to look.
+        self.poller = None
+        self.poll_queued = False
+        self.poll_id = None
+        if watcher.inotify_available():
+            self.watcher = watcher.FileWatcher([self.realdir], self._on_changes)
+        else:
+            self.watcher = None
+            self.poll_id = gobject.timeout_add(self.poll_interval, self._queue_poll)
+        self.queue.put(None)
+        self.thread.start()
+
+    def get_worlds(self):
+        """
+        Returns a dict of the worlds we currently know about
+        """
+        return dict(self.worlds)
+
+    def stop(self):
+        """
+        Stops watching our directory
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.poll_id is not None:
+            gobject.source_remove(self.poll_id)
+            self.poll_id = None
+        for source_id in self.recheck_ids.values():
+            gobject.source_remove(source_id)
+        self.recheck_ids = {}
+
+    def _run(self):
+        """
+        Our worker thread
+        """
+        while True:
+            work = self.queue.get()
+            if work is None:
+                self._scan()
+            elif work == 'poll':
+                self.poll_queued = False
+                self._poll()
+            else:
+                (paths, recheck) = work
+                results = [(path, self._check(path)) for path in paths]
+                gobject.idle_add(self._checked, results, recheck)
+            self.cache.save()
+
+    def _scan(self):
+        """
+        Scans our whole saves directory, reporting everything we find
+        (with cached details), and then reading in any details which
+        weren't cached
+        """
+        self.cache.load()
+        if self.watcher is None:
+            self.poller = watcher.PollSnapshot([self.realdir])
+        worlds = {}
+        undescribed = []
+        try:
+            names = os.listdir(self.realdir)
+        except OSError:
+            names = []
+        for name in names:
+            path = self._find_leveldat(os.path.join(self.realdir, name))[0]
+            if path is not None:
+                if self.poller is not None:
+                    self.poller.add_path(path)
+                entry = self.cache.lookup(path)
+                worlds[name] = self.cache.get_info(name, path, entry)
+                if entry is None:
+                    undescribed.append(worlds[name])
+        self.cache.prune([info.path for info in worlds.values()])
+        gobject.idle_add(self._scanned, worlds)
+
+        for start in range(0, len(undescribed), self.describe_batch):
+            described = {}
+            for info in undescribed[start:start+self.describe_batch]:
+                entry = self.cache.read(info.path)
+                described[info.dirname] = self.cache.get_info(info.dirname, info.path, entry)
+            gobject.idle_add(self._described, described)
+
+    def _find_leveldat(self, path):
+        """
+        Checks a single entry in our saves directory.  Returns a tuple
+        of the path to its level.dat (or None, if it's not a world) and
+        whether or not it's a directory.
+        """
+        if not os.path.isdir(path):
+            return (None, False)
+        leveldat = os.path.join(path, 'level.dat')
+        if os.path.exists(leveldat):
+            return (leveldat, True)
+        return (None, True)
+
+    def _check(self, path):
+        """
+        Checks a single changed entry in our saves directory.  Returns a
+        tuple of its WorldInfo (or None, if it's not a world) and whether
+        or not it's a directory.
+        """
+        (leveldat, is_dir) = self._find_leveldat(path)
+        if self.poller is not None:
+            if leveldat is None:
+                self.poller.remove_path(os.path.join(path, 'level.dat'))
+            else:
+                self.poller.add_path(leveldat)
+        if leveldat is None:
+            return (None, is_dir)
+        name = os.path.basename(path)
+        return (self.cache.get_info(name, leveldat, self.cache.read(leveldat)), is_dir)
+
+    def _poll(self):
+        """
+        Checks our directory for changes, without inotify.  Runs on our
+        worker thread, and only the results for whatever's changed get
+        handed back to the main loop.
+        """
+        if self.poller is None:
+            return
+        paths = self._get_world_dirs(self.poller.poll())
+        if len(paths) > 0:
+            results = [(path, self._check(path)) for path in paths]
+            gobject.idle_add(self._checked, results, True)
+
+    def _get_world_dirs(self, paths):
+        """
+        Given a set of changed entries in our saves directory, or
+        level.dat files in our worlds, returns the set of world
+        directories which need re-checking
+        """
+        to_check = set()
+        for path in paths:
+            dirname = os.path.dirname(path)
+            if dirname == self.realdir:
+                to_check.add(path)
+            elif (os.path.basename(path) == 'level.dat' and
+                    os.path.dirname(dirname) == self.realdir):
+                to_check.add(dirname)
+        return to_check
+
+    def _on_changes(self, paths):
+        """
+        Called by our watcher when entries in our saves directory change,
+        or when one of our worlds' level.dat files does.  Either way, it's
+        the world directory which gets re-checked.
+        """
+        to_check = self._get_world_dirs(paths)
+        if len(to_check) > 0:
+            self.queue.put((list(to_check), True))
+
+    def _queue_poll(self):
+        """
+        Asks our worker to poll for changes, unless it's still got an
+        earlier poll waiting
+        """
+        if not self.poll_queued:
+            self.poll_queued = True
+            self.queue.put('poll')
+        return True
+
+    def _recheck(self, path):
+        """
+        Checks a world directory again, in case it's got its level.dat now
+        """
+        del self.recheck_ids[path]
+        self.queue.put(([path], False))
+        return False
+
+    def _scanned(self, worlds):
+        """
+        Our initial scan is done.  Runs in the main loop.
+        """
+        removed = set(self.worlds.keys()) - set(worlds.keys())
+        self._update(worlds, removed)
+        return False
+
+    def _described(self, described):
+        """
+        Details for some worlds from our initial scan have been read in.
+        Runs in the main loop.  Any world which has gone away (or been
+        replaced) in the meantime is left alone.
+        """
+        added = {}
+        for (name, info) in described.items():
+            if name in self.worlds and self.worlds[name].path == info.path:
+                added[name] = info
+        self._update(added, set())
+        return False
+
+    def _checked(self, results, recheck):
+        """
+        Some changed entries have been re-checked.  Runs in the main loop.
+        """
+        added = {}
+        removed = set()
+        for (path, (info, is_dir)) in results:
+            name = os.path.basename(path)
+            if info is None:
+                if name in self.worlds:
+                    removed.add(name)
+                if recheck and is_dir and path not in self.recheck_ids:
+                    self.recheck_ids[path] = gobject.timeout_add(self.recheck_delay,
+                            self._recheck, path)
+            else:
+                added[name] = info
+        self._update(added, removed)
+        return False
+
+    def _update(self, added, removed):
+        """
+        Applies a set of changes to our index, and lets our callback know
+        about them (if there are any).  Our watcher keeps an eye on the
+        level.dat of every world in the index (when we're polling, our
+        worker takes care of that itself).
+        """
+        added = dict([(name, info) for (name, info) in added.items()
+            if self.worlds.get(name) != info])
+        for name in removed:
+            if self.watcher is not None:
+                self.watcher.remove_path(self.worlds[name].path, is_file=True)
+            del self.worlds[name]
+        for (name, info) in added.items():
+            if self.watcher is not None:
+                if name in self.worlds and self.worlds[name].path != info.path:
+                    self.watcher.remove_path(self.worlds[name].path, is_file=True)
+                self.watcher.add_path(info.path, is_file=True)
+        self.worlds.update(added)
+        if len(added) > 0 or len(removed) > 0:
+            self.callback(added, removed)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Tests for reloading our item catalog.  These need cairo, numpy and
+# PyYAML (for the texture sheets and YAML), but not GTK.
+
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+
+try:
+    import yaml
+    from pyinveditlib import data
+except ImportError:
+    data = None
+
+CATALOG = {
+        'texfiles': [
+            { 'texfile': 'items.png', 'dimensions': [16, 16] },
+        ],
+        'groups': [
+            { 'name': 'Tools', 'texfile': 'items.png', 'coords': [2, 5] },
+            { 'name': 'Food', 'texfile': 'items.png', 'coords': [10, 0] },
+        ],
+        'enchantments': [
+            { 'num': 16, 'name': 'Sharpness', 'max_power': 5 },
+        ],
+        'items': [
+            { 'num': 256, 'name': 'Iron Shovel', 'texfile': 'items.png',
+                'coords': [2, 5], 'groups': ['Tools'], 'max_damage': 250 },
+            { 'num': 260, 'name': 'Apple', 'texfile': 'items.png',
+                'coords': [10, 0], 'groups': ['Food'] },
+            { 'num': 276, 'name': 'Diamond Sword', 'texfile': 'items.png',
+                'coords': [3, 4], 'groups': ['Tools'], 'max_damage': 1561,
+                'enchantments': ['Sharpness'] },
+        ],
+    }
+
+@unittest.skipIf(data is None, 'needs cairo, numpy and PyYAML')
+class CatalogReloadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'pyinvedit.yaml')
+        self.yaml = copy.deepcopy(CATALOG)
+        self.write()
+        self.catalog = data.Catalog(self.filename, pixbufs=False)
+        self.initial = self.catalog.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def write(self):
+        with open(self.filename, 'w') as df:
+            yaml.dump(self.yaml, df)
+
+    def item(self, num):
+        return self.catalog.items.get_by_unique_id(num)
+
+    def item_named(self, name):
+        for yamlobj in self.yaml['items']:
+            if yamlobj['name'] == name:
+                return yamlobj
+
+    def test_load(self):
+        self.assertEqual(sorted(self.initial.texfiles), ['gui.png', 'items.png'])
+        self.assertTrue(self.initial.groups_changed)
+        self.assertTrue(self.initial.enchantments_changed)
+        self.assertEqual(sorted([item.unique_id for item in self.initial.added]),
+                [0, 256, 260, 276])
+        self.assertEqual([item.name for item in self.catalog.items.get_items()],
+                ['Apple', 'Diamond Sword', 'Iron Shovel', 'Unknown Item'])
+        self.assertTrue(self.item(0).unknown)
+        self.assertEqual(self.catalog.groups.keys(), ['Tools', 'Food'])
+        self.assertEqual(self.item(256).group_mask, self.catalog.groups['Tools'].bit)
+        self.assertEqual(self.item(260).group_mask, self.catalog.groups['Food'].bit)
+        self.assertEqual([item.name for item in self.catalog.groups['Tools'].items],
+                ['Diamond Sword', 'Iron Shovel'])
+
+    def test_shared_tuples(self):
+        self.assertTrue(self.item(256).groups is self.item(276).groups)
+
+    def test_unchanged(self):
+        items = dict([(item.unique_id, item) for item in self.catalog.items.get_items()])
+        changes = self.catalog.reload()
+        self.assertTrue(changes.is_empty())
+        for item in self.catalog.items.get_items():
+            self.assertTrue(item is items[item.unique_id])
+
+    def test_item_changed(self):
+        shovel = self.item(256)
+        apple = self.item(260)
+        self.item_named('Apple')['name'] = 'Red Apple'
+        self.write()
+        changes = self.catalog.reload()
+        self.assertEqual(len(changes.changed), 1)
+        (old, new) = changes.changed[0]
+        self.assertTrue(old is apple)
+        self.assertEqual(new.name, 'Red Apple')
+        self.assertTrue(self.item(260) is new)
+        self.assertTrue(self.item(256) is shovel)
+        self.assertEqual(changes.get_unique_ids(), set([260]))
+        self.assertFalse(changes.groups_changed)
+        self.assertEqual(changes.texfiles, [])
+
+    def test_added_and_removed(self):
+        apple = self.item(260)
+        self.yaml['items'].remove(self.item_named('Apple'))
+        self.yaml['items'].append({ 'num': 297, 'name': 'Bread',
+            'texfile': 'items.png', 'coords': [9, 2], 'groups': ['Food'] })
+        self.write()
+        changes = self.catalog.reload()
+        self.assertEqual(changes.removed, [apple])
+        self.assertEqual([item.name for item in changes.added], ['Bread'])
+        self.assertEqual(self.item(260), None)
+        self.assertEqual(self.catalog.items.get_item(297, 0).name, 'Bread')
+        self.assertEqual([item.name for item in self.catalog.groups['Food'].items], ['Bread'])
+
+    def test_enchantments_changed(self):
+        shovel = self.item(256)
+        self.yaml['enchantments'][0]['max_power'] = 10
+        self.write()
+        changes = self.catalog.reload()
+        self.assertTrue(changes.enchantments_changed)
+        self.assertEqual([new.unique_id for (old, new) in changes.changed], [276])
+        self.assertTrue(self.item(256) is shovel)
+        self.assertEqual(self.catalog.enchantments.get_by_name('Sharpness').max_power, 10)
+
+    def test_group_moved(self):
+        tools = self.catalog.groups['Tools']
+        self.yaml['groups'].reverse()
+        self.write()
+        changes = self.catalog.reload()
+        self.assertTrue(changes.groups_changed)
+        self.assertEqual(self.catalog.groups.keys(), ['Food', 'Tools'])
+        self.assertEqual(sorted([new.unique_id for (old, new) in changes.changed]), [256, 260, 276])
+        self.assertEqual(self.item(256).group_mask, self.catalog.groups['Tools'].bit)
+        self.assertEqual(self.item(260).group_mask, self.catalog.groups['Food'].bit)
+        self.assertFalse(self.catalog.groups['Tools'] is tools)
+
+    def test_broken_yaml_leaves_catalog_alone(self):
+        apple = self.item(260)
+        self.item_named('Apple')['name'] = 'Red Apple'
+        self.item_named('Iron Shovel')['groups'] = ['No Such Group']
+        self.write()
+        self.assertRaises(Exception, self.catalog.reload)
+        self.assertTrue(self.item(260) is apple)
+        self.assertEqual(self.item(260).name, 'Apple')
+        self.assertEqual(self.catalog.groups.keys(), ['Tools', 'Food'])
+
+    def test_texfile_changed_on_disk(self):
+        shovel = self.item(256)
+        texfile = self.catalog.texfiles['items.png']
+        changes = self.catalog.reload([texfile.filename])
+        self.assertEqual(changes.texfiles, ['items.png'])
+        self.assertFalse(self.catalog.texfiles['items.png'] is texfile)
+        self.assertTrue(changes.groups_changed)
+        self.assertEqual(sorted([new.unique_id for (old, new) in changes.changed]), [256, 260, 276])
+        self.assertFalse(self.item(256) is shovel)
+        self.assertTrue(self.item(0) is not None)
+
+@unittest.skipIf(data is None, 'needs cairo, numpy and PyYAML')
+class CatalogChangesTests(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertTrue(data.CatalogChanges().is_empty())
+        changes = data.CatalogChanges()
+        changes.groups_changed = True
+        self.assertFalse(changes.is_empty())
+
+if __name__ == '__main__':
+    unittest.main()
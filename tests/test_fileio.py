@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Tests for our background load and save, and for pulling values out of
+# NBT files.  These need PyGObject for the main loop, but not GTK.
+
+import os
+import stat
+import time
+import shutil
+import tempfile
+import unittest
+
+try:
+    import gobject
+    from pyinveditlib import fileio
+    from pyinveditlib.pymclevel import nbt
+    gobject.threads_init()
+except ImportError:
+    fileio = None
+
+def run_main_loop(condition, timeout=10):
+    """
+    Runs the main loop until the given condition is true
+    """
+    context = gobject.main_context_default()
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise Exception('Timed out waiting on the main loop')
+        if not context.iteration(False):
+            time.sleep(0.01)
+
+def make_leveldat(level_name='Test World', game_type=1):
+    """
+    Returns a small level.dat-like NBT structure
+    """
+    root = nbt.TAG_Compound()
+    root['Other'] = nbt.TAG_Compound()
+    root['Other']['Padding'] = nbt.TAG_Byte_Array()
+    root['Data'] = nbt.TAG_Compound()
+    root['Data']['SpawnX'] = nbt.TAG_Int(12)
+    root['Data']['Player'] = nbt.TAG_Compound()
+    root['Data']['Player']['Inventory'] = nbt.TAG_List()
+    root['Data']['LevelName'] = nbt.TAG_String(level_name)
+    root['Data']['LastPlayed'] = nbt.TAG_Long(1350000000000)
+    root['Data']['GameType'] = nbt.TAG_Int(game_type)
+    return root
+
+class FileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def path(self, name='level.dat'):
+        return os.path.join(self.dirname, name)
+
+@unittest.skipIf(fileio is None, 'needs PyGObject')
+class ReadNBTValuesTests(FileTestCase):
+
+    def test_gzipped(self):
+        make_leveldat().save(self.path())
+        values = fileio.read_nbt_values(self.path(), 'Data',
+                ['LevelName', 'LastPlayed', 'GameType', 'hardcore'])
+        self.assertEqual(values, {'LevelName': 'Test World',
+            'LastPlayed': 1350000000000, 'GameType': 1})
+
+    def test_uncompressed(self):
+        with open(self.path(), 'wb') as df:
+            make_leveldat('Plain').save(buf=df)
+        self.assertEqual(fileio.read_nbt_values(self.path(), 'Data', ['LevelName']),
+                {'LevelName': 'Plain'})
+
+    def test_missing_section(self):
+        make_leveldat().save(self.path())
+        self.assertEqual(fileio.read_nbt_values(self.path(), 'Nope', ['LevelName']), {})
+
+    def test_truncated(self):
+        with open(self.path(), 'wb') as df:
+            df.write('\x0a\x00')
+        self.assertRaises(Exception, fileio.read_nbt_values, self.path(), 'Data', ['LevelName'])
+
+class BrokenTag(object):
+    """
+    A tag which fails partway through being saved
+    """
+
+    def save(self, buf):
+        buf.write('partial')
+        raise IOError('disk full')
+
+@unittest.skipIf(fileio is None, 'needs PyGObject')
+class SaveQueueTests(FileTestCase):
+
+    def setUp(self):
+        super(SaveQueueTests, self).setUp()
+        self.queue = fileio.SaveQueue()
+        self.results = []
+        self.fsyncs = []
+        self.real_fsync = os.fsync
+        os.fsync = self.fsync
+
+    def tearDown(self):
+        os.fsync = self.real_fsync
+        super(SaveQueueTests, self).tearDown()
+
+    def fsync(self, fd):
+        """
+        Records which files were synced, and whether the temp file was
+        still in place at the time
+        """
+        self.fsyncs.append((os.fstat(fd).st_ino, os.path.exists(self.path('level.dat.tmp'))))
+        self.real_fsync(fd)
+
+    def done(self, job, exception):
+        self.results.append((job, exception))
+
+    def save(self, tag, path):
+        job = self.queue.save(tag, path, self.done)
+        self.assertTrue(self.queue.has_pending())
+        run_main_loop(lambda: not self.queue.has_pending())
+        return job
+
+    def test_save(self):
+        tag = make_leveldat('Saved')
+        job = self.save(tag, self.path())
+        self.assertEqual(self.results, [(job, None)])
+        self.assertEqual(nbt.load(self.path())['Data']['LevelName'].value, 'Saved')
+        self.assertFalse(os.path.exists(self.path('level.dat.tmp')))
+
+    def test_fsynced_before_rename(self):
+        self.save(make_leveldat(), self.path())
+        self.assertEqual(len(self.fsyncs), 1)
+        (inode, tmp_existed) = self.fsyncs[0]
+        self.assertTrue(tmp_existed)
+        self.assertEqual(inode, os.stat(self.path()).st_ino)
+
+    def test_keeps_file_mode(self):
+        make_leveldat('Old').save(self.path())
+        os.chmod(self.path(), 0640)
+        self.save(make_leveldat('New'), self.path())
+        self.assertEqual(stat.S_IMODE(os.stat(self.path()).st_mode), 0640)
+        self.assertEqual(nbt.load(self.path())['Data']['LevelName'].value, 'New')
+
+    def test_failure_cleans_up(self):
+        make_leveldat('Old').save(self.path())
+        job = self.save(BrokenTag(), self.path())
+        self.assertEqual(len(self.results), 1)
+        self.assertTrue(self.results[0][0] is job)
+        self.assertTrue(isinstance(self.results[0][1], IOError))
+        self.assertFalse(os.path.exists(self.path('level.dat.tmp')))
+        self.assertEqual(nbt.load(self.path())['Data']['LevelName'].value, 'Old')
+
+    def test_pending(self):
+        tag = make_leveldat()
+        self.queue.save(tag, self.path(), self.done)
+        self.assertTrue(self.queue.is_pending(tag))
+        self.assertFalse(self.queue.is_pending(make_leveldat()))
+        run_main_loop(lambda: not self.queue.has_pending())
+        self.assertFalse(self.queue.is_pending(tag))
+
+    def test_in_order(self):
+        for name in ['First', 'Second', 'Third']:
+            self.queue.save(make_leveldat(name), self.path(), self.done)
+        run_main_loop(lambda: not self.queue.has_pending())
+        self.assertEqual([job.tag['Data']['LevelName'].value for (job, exception) in self.results],
+                ['First', 'Second', 'Third'])
+        self.assertEqual(nbt.load(self.path())['Data']['LevelName'].value, 'Third')
+
+@unittest.skipIf(fileio is None, 'needs PyGObject')
+class LoadJobTests(FileTestCase):
+
+    def setUp(self):
+        super(LoadJobTests, self).setUp()
+        self.progress = []
+        self.results = []
+
+    def load(self, path, chunk_size=None):
+        job = fileio.LoadJob(path, self.on_progress, self.on_done)
+        if chunk_size is not None:
+            job.chunk_size = chunk_size
+        job.start()
+        return job
+
+    def on_progress(self, job, phase, fraction):
+        self.progress.append((phase, fraction))
+
+    def on_done(self, job, leveldat, exception):
+        self.results.append((leveldat, exception))
+
+    def test_gzipped(self):
+        make_leveldat('Loaded').save(self.path())
+        self.load(self.path(), chunk_size=16)
+        run_main_loop(lambda: len(self.results) > 0)
+        (leveldat, exception) = self.results[0]
+        self.assertEqual(exception, None)
+        self.assertEqual(leveldat['Data']['LevelName'].value, 'Loaded')
+        phases = [phase for (phase, fraction) in self.progress]
+        self.assertTrue(set(phases) <= set(['Reading', 'Parsing']))
+        fractions = [fraction for (phase, fraction) in self.progress if phase == 'Reading']
+        self.assertEqual(fractions, sorted(fractions))
+
+    def test_uncompressed(self):
+        with open(self.path(), 'wb') as df:
+            make_leveldat('Plain').save(buf=df)
+        self.load(self.path())
+        run_main_loop(lambda: len(self.results) > 0)
+        self.assertEqual(self.results[0][0]['Data']['LevelName'].value, 'Plain')
+
+    def test_missing_file(self):
+        self.load(self.path('missing.dat'))
+        run_main_loop(lambda: len(self.results) > 0)
+        (leveldat, exception) = self.results[0]
+        self.assertEqual(leveldat, None)
+        self.assertTrue(isinstance(exception, Exception))
+
+    def test_cancel(self):
+        make_leveldat().save(self.path())
+        job = self.load(self.path())
+        job.cancel()
+        job.thread.join()
+        end = time.time() + 0.2
+        while time.time() < end:
+            gobject.main_context_default().iteration(False)
+        self.assertTrue(job.is_cancelled())
+        self.assertEqual(self.results, [])
+        self.assertEqual(self.progress, [])
+
+if __name__ == '__main__':
+    unittest.main()
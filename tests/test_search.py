@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Tests for our item search index, which doesn't need GTK
+
+import random
+import unittest
+from pyinveditlib import search
+
+class StubItem(object):
+    """
+    Just enough of a data.Item for the index
+    """
+
+    def __init__(self, num, name, group_mask=1, unknown=False):
+        self.num = num
+        self.name = name
+        self.unique_id = '%d~%s' % (num, name)
+        self.group_mask = group_mask
+        self.unknown = unknown
+
+NAMES = [
+        'Block of Diamond',
+        'Diamond',
+        'Diamond Pickaxe',
+        'Diamond Sword',
+        'Iron Sword',
+        'Redstone Torch',
+        'Stone',
+        'Stone Sword',
+        'Torch',
+        'Wooden Door',
+        'Wooden Planks',
+        'Wooden Sword',
+    ]
+
+def make_index():
+    return search.ItemIndex([StubItem(num, name) for (num, name) in enumerate(NAMES, 1)])
+
+def names(index, keys):
+    return [index.key_names[key] for key in keys]
+
+def table_distance(text, name):
+    """
+    The plain dynamic-programming version of substring_distance(), to
+    check the bit-parallel one against
+    """
+    rows = [[0]*(len(name)+1)]
+    for i in range(1, len(text)+1):
+        row = [i]
+        for j in range(1, len(name)+1):
+            best = min(rows[i-1][j-1] + (text[i-1] != name[j-1]),
+                    rows[i-1][j] + 1, row[j-1] + 1)
+            if (i > 1 and j > 1 and text[i-1] == name[j-2] and
+                    text[i-2] == name[j-1]):
+                best = min(best, rows[i-2][j-2] + 1)
+            row.append(best)
+        rows.append(row)
+    distance = min(rows[-1])
+    return (distance, rows[-1].index(distance))
+
+class SubstringDistanceTests(unittest.TestCase):
+
+    def test_exact(self):
+        self.assertEqual(search.substring_distance('sword', 'stone sword'), (0, 11))
+
+    def test_substitution(self):
+        self.assertEqual(search.substring_distance('dxam', 'diamond')[0], 1)
+
+    def test_insertion_and_deletion(self):
+        self.assertEqual(search.substring_distance('swrd', 'sword')[0], 1)
+        self.assertEqual(search.substring_distance('swoord', 'sword')[0], 1)
+
+    def test_transposition(self):
+        self.assertEqual(search.substring_distance('tocrh', 'torch')[0], 1)
+        self.assertEqual(search.substring_distance('sowrd', 'sword')[0], 1)
+        self.assertEqual(search.substring_distance('dimaond', 'diamond')[0], 1)
+
+    def test_match_position(self):
+        self.assertEqual(search.substring_distance('diamnd', 'diamond'), (1, 7))
+        self.assertEqual(search.substring_distance('diamnd', 'block of diamond'), (1, 16))
+
+    def test_limit(self):
+        self.assertEqual(search.substring_distance('xxxxx', 'diamond', 2), (3, 0))
+        self.assertEqual(search.substring_distance('diamnd', 'diamond', 2), (1, 7))
+
+    def test_matches_table(self):
+        rand = random.Random(0)
+        for i in range(2000):
+            text = ''.join([rand.choice('abc ') for j in range(rand.randint(0, 8))])
+            name = ''.join([rand.choice('abc ') for j in range(rand.randint(0, 16))])
+            self.assertEqual(search.substring_distance(text, name),
+                    table_distance(text, name), (text, name))
+
+class FuzzySearchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = make_index()
+
+    def fuzzy_names(self, text):
+        return [self.index.key_names[key] for (key, distance, end)
+                in self.index.search_fuzzy(text)]
+
+    def test_typos(self):
+        for (text, expected) in [
+                ('wodden', 'wooden sword'),
+                ('dxam', 'diamond'),
+                ('swrd', 'iron sword'),
+                ('dimaond', 'diamond'),
+                ('tocrh', 'torch'),
+                ('swrod', 'stone sword'),
+                ('sowrd', 'wooden sword'),
+                ]:
+            self.assertIn(expected, self.fuzzy_names(text), text)
+
+    def test_too_many_typos(self):
+        self.assertEqual(self.fuzzy_names('tcorh'), [])
+        self.assertEqual(self.fuzzy_names('xxxxx'), [])
+
+    def test_short_queries(self):
+        self.assertEqual(self.index.search_fuzzy('dia'), [])
+
+    def test_candidate_limit(self):
+        self.index.fuzzy_candidates = 2
+        self.assertEqual(len(self.index.search_fuzzy('diamnd')), 2)
+
+    def test_ranked_by_distance_then_position(self):
+        results = self.index.search_fuzzy('diamnd')
+        self.assertEqual([distance for (key, distance, end) in results], [1]*4)
+        self.assertEqual(names(self.index, [key for (key, distance, end) in results]),
+                ['diamond', 'diamond pickaxe', 'diamond sword', 'block of diamond'])
+
+class RankTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = make_index()
+
+    def test_tiers(self):
+        self.assertEqual(names(self.index, self.index.rank('stone')),
+                ['stone', 'stone sword', 'redstone torch'])
+
+    def test_word_before_substring(self):
+        self.assertEqual(names(self.index, self.index.rank('sword')),
+                ['diamond sword', 'iron sword', 'stone sword', 'wooden sword'])
+
+    def test_ids(self):
+        self.assertEqual(names(self.index, self.index.rank('2')), ['diamond'])
+
+    def test_fuzzy_after_exact(self):
+        ranked = names(self.index, self.index.rank('diamnd'))
+        self.assertEqual(ranked[0], 'diamond')
+        self.assertEqual(ranked[-1], 'block of diamond')
+
+    def test_short_queries(self):
+        self.assertEqual(names(self.index, self.index.rank('st')),
+                ['stone', 'stone sword', 'redstone torch'])
+        self.assertEqual(names(self.index, self.index.rank('wo')),
+                ['wooden door', 'wooden planks', 'wooden sword', 'diamond sword',
+                    'iron sword', 'stone sword'])
+        self.assertEqual(names(self.index, self.index.rank('12')), ['wooden sword'])
+
+    def test_short_queries_match_full_ranking(self):
+        for text in ['s', 'o', 'd', 'st', 'to', 'wo', ' s', '5', '10', 'xx',
+                'sto', 'ord', 'dia', 'n s', '12']:
+            short = self.index.rank(text)
+            self.index.short_query = 0
+            self.assertEqual(short, self.index.rank(text), text)
+            del self.index.short_query
+
+    def test_fuzzy_typos(self):
+        self.assertEqual(names(self.index, self.index.rank('tocrh')), ['torch', 'redstone torch'])
+
+class QueryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = make_index()
+        self.cache = search.QueryCache(self.index)
+
+    def test_refine_and_backspace(self):
+        for text in ['s', 'st', 'sto', 'ston', 'stone', 'ston', 'st', 'sw']:
+            self.assertEqual(self.cache.search_names(text), self.index.search_names(text), text)
+
+    def test_ids(self):
+        self.assertEqual(self.cache.search('12'), self.index.search('12'))
+
+    def test_rank(self):
+        for text in ['w', 'wo', 'woo', 'wood', 'wooden', 'wooden s', 'wood', 'wodden']:
+            self.assertEqual(self.cache.rank(text), self.index.rank(text), text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Tests for our GTK-free utility classes
+
+import unittest
+from pyinveditlib import util
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = util.LRUCache(2)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('a', 1), 1)
+        cache.put('a', 'apple')
+        self.assertEqual(cache.get('a'), 'apple')
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = util.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_put_refreshes(self):
+        cache = util.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('a', 10)
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 10)
+        self.assertNotIn('b', cache)
+
+    def test_discard_and_clear(self):
+        cache = util.LRUCache(4)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.discard('a')
+        cache.discard('missing')
+        self.assertNotIn('a', cache)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+class UndoTests(unittest.TestCase):
+
+    def test_change_count(self):
+        undo = util.Undo()
+        count = undo.get_change_count()
+        self.assertFalse(undo.is_changed())
+        undo.change()
+        self.assertTrue(undo.is_changed())
+        undo.save()
+        self.assertFalse(undo.is_changed())
+        self.assertEqual(undo.get_change_count(), count + 1)
+
+if __name__ == '__main__':
+    unittest.main()
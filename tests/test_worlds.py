@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+#
+# Tests for our world info cache and directory polling.  These need
+# PyGObject and PyYAML, but not GTK.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from pyinveditlib import worlds, watcher
+    from tests.test_fileio import make_leveldat
+except ImportError:
+    worlds = None
+
+class WorldsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def make_world(self, name, level_name='Test World'):
+        """
+        Creates a world directory with a level.dat, and returns the
+        level.dat's path
+        """
+        path = os.path.join(self.dirname, name)
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        leveldat = os.path.join(path, 'level.dat')
+        make_leveldat(level_name).save(leveldat)
+        return leveldat
+
+    def touch(self, path):
+        """
+        Bumps the mtime on the given path, in case it's been changed
+        within the filesystem's timestamp resolution
+        """
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+@unittest.skipIf(worlds is None, 'needs PyGObject and PyYAML')
+class WorldInfoCacheTests(WorldsTestCase):
+
+    def test_read(self):
+        path = self.make_world('one', 'First')
+        cache = worlds.WorldInfoCache()
+        self.assertEqual(cache.lookup(path), None)
+        entry = cache.read(path)
+        self.assertEqual(entry['LevelName'], 'First')
+        self.assertEqual(entry['GameType'], 1)
+        self.assertTrue(cache.dirty)
+        self.assertEqual(cache.lookup(path), entry)
+
+    def test_stale_entry(self):
+        path = self.make_world('one', 'First')
+        cache = worlds.WorldInfoCache()
+        cache.read(path)
+        self.make_world('one', 'Renamed')
+        self.touch(path)
+        self.assertEqual(cache.lookup(path), None)
+        self.assertEqual(cache.read(path)['LevelName'], 'Renamed')
+
+    def test_unreadable(self):
+        path = os.path.join(self.dirname, 'level.dat')
+        with open(path, 'wb') as df:
+            df.write('not nbt')
+        cache = worlds.WorldInfoCache()
+        self.assertEqual(cache.read(path), {})
+        self.assertFalse(cache.dirty)
+
+    def test_save_and_load(self):
+        path = self.make_world('one', 'First')
+        filename = os.path.join(self.dirname, 'cache', 'worlds.yaml')
+        cache = worlds.WorldInfoCache(filename)
+        cache.read(path)
+        cache.save()
+        self.assertFalse(cache.dirty)
+        self.assertFalse(os.path.exists('%s.tmp' % (filename)))
+        loaded = worlds.WorldInfoCache(filename)
+        loaded.load()
+        self.assertEqual(loaded.lookup(path)['LevelName'], 'First')
+
+    def test_broken_cache_file(self):
+        filename = os.path.join(self.dirname, 'worlds.yaml')
+        with open(filename, 'w') as df:
+            df.write('{ this is not: [ yaml')
+        cache = worlds.WorldInfoCache(filename)
+        cache.load()
+        self.assertEqual(cache.entries, {})
+
+    def test_prune(self):
+        one = self.make_world('one')
+        two = self.make_world('two')
+        cache = worlds.WorldInfoCache()
+        cache.read(one)
+        cache.read(two)
+        cache.dirty = False
+        cache.prune([one])
+        self.assertEqual(cache.entries.keys(), [one])
+        self.assertTrue(cache.dirty)
+
+    def test_get_info(self):
+        path = self.make_world('one', 'First')
+        cache = worlds.WorldInfoCache()
+        info = cache.get_info('one', path, cache.read(path))
+        self.assertEqual(info.level_name, 'First')
+        self.assertEqual(info.game_type, 1)
+        self.assertFalse(info.hardcore)
+        self.assertTrue(info.get_label().startswith('First (Creative, '))
+        self.assertEqual(cache.get_info('one', path, None).get_label(), 'one')
+
+@unittest.skipIf(worlds is None, 'needs PyGObject and PyYAML')
+class PollSnapshotTests(WorldsTestCase):
+
+    def test_directory_changes(self):
+        self.make_world('one')
+        poller = watcher.PollSnapshot([self.dirname])
+        self.assertEqual(poller.poll(), set())
+        self.make_world('two')
+        shutil.rmtree(os.path.join(self.dirname, 'one'))
+        self.assertEqual(poller.poll(), set([os.path.join(self.dirname, 'one'),
+            os.path.join(self.dirname, 'two')]))
+        self.assertEqual(poller.poll(), set())
+
+    def test_file_changes(self):
+        one = self.make_world('one')
+        poller = watcher.PollSnapshot([self.dirname])
+        poller.add_path(one)
+        self.assertEqual(poller.poll(), set())
+        self.touch(one)
+        self.assertEqual(poller.poll(), set([one]))
+        poller.remove_path(one)
+        self.touch(one)
+        self.assertEqual(poller.poll(), set())
+
+if __name__ == '__main__':
+    unittest.main()